@@ -0,0 +1,174 @@
+"""
+Пересылка вложений задачи с учётом альбомов.
+
+Альбом приходит от Telegram отдельными сообщениями с общим
+media_group_id. AlbumBuffer собирает части альбома, пока они приходят
+чаще, чем раз в ALBUM_WINDOW секунд, и отдаёт весь альбом одним
+вызовом: получатель видит один альбом (send_media_group) и одну
+клавиатуру после него. Одиночные сообщения передаются сразу и
+копируются через copy_message. Готовый альбом таймер не обрабатывает
+сам, а отдаёт в submit - в handler_worker.py это шард чата
+(chat_executor.py), поэтому альбом идёт по порядку с остальными
+обновлениями чата.
+"""
+import contextvars
+import logging
+import threading
+
+from telebot import TeleBot
+from telebot.types import (
+    Message,
+    InputMediaAudio,
+    InputMediaDocument,
+    InputMediaPhoto,
+    InputMediaVideo,
+)
+
+from config import ALBUM_WINDOW
+
+logger = logging.getLogger('manager_bot_logger')
+
+
+class Album:
+    __slots__ = ('messages', 'on_complete', 'context', 'timer')
+
+    def __init__(self, on_complete) -> None:
+        self.messages = []
+        self.on_complete = on_complete
+        # Контекст журнала первого сообщения альбома
+        self.context = contextvars.copy_context()
+        self.timer = None
+
+
+def call_now(func, *args) -> None:
+    """submit по умолчанию: вызываем в потоке таймера"""
+    try:
+        func(*args)
+    except Exception as e:
+        logger.error(f'Ошибка: {e}')
+
+
+class AlbumBuffer:
+    """Части альбомов, которые ещё ждут остальные сообщения"""
+
+    def __init__(self, window: float = ALBUM_WINDOW,
+                 submit=call_now) -> None:
+        self.window = window
+        self.submit = submit
+        self.lock = threading.Lock()
+        self.albums = {}
+
+    def add(self, message: Message, on_complete) -> None:
+        """
+        on_complete(message, messages) вызывается один раз на альбом,
+        message - первая часть: когда части перестали приходить, таймер
+        передаёт вызов в submit(on_complete, message, messages). Для
+        сообщения без альбома - сразу в текущем потоке
+        """
+        group_id = message.media_group_id
+        if group_id is None:
+            on_complete(message, [message])
+            return
+
+        with self.lock:
+            album = self.albums.get(group_id)
+            if album is None:
+                album = Album(on_complete)
+                self.albums[group_id] = album
+            else:
+                album.timer.cancel()
+            album.messages.append(message)
+            album.timer = threading.Timer(self.window, self._complete,
+                                          args=(group_id,))
+            album.timer.daemon = True
+            album.timer.start()
+
+    def _complete(self, group_id: str) -> None:
+        with self.lock:
+            album = self.albums.pop(group_id, None)
+        if album is None:
+            return
+        messages = sorted(album.messages, key=lambda m: m.message_id)
+        album.context.run(self.submit, album.on_complete, messages[0],
+                          messages)
+
+
+MEDIA_TYPES = {
+    'photo': InputMediaPhoto,
+    'video': InputMediaVideo,
+    'audio': InputMediaAudio,
+    'document': InputMediaDocument,
+}
+# Какие вложения можно объединить в один send_media_group
+MEDIA_GROUPS = {
+    'photo': 'visual',
+    'video': 'visual',
+    'audio': 'audio',
+    'document': 'document',
+}
+MEDIA_GROUP_SIZE = 10
+
+
+def attachment_fields(message: Message) -> dict:
+    """Тип, file_id и подпись вложения. Фото - в наибольшем размере"""
+    if message.content_type == 'text':
+        return {'kind': 'text', 'file_id': None, 'file_unique_id': None,
+                'caption': message.text}
+    if message.content_type == 'photo':
+        file = message.photo[-1]
+    else:
+        file = getattr(message, message.content_type)
+    return {'kind': message.content_type, 'file_id': file.file_id,
+            'file_unique_id': file.file_unique_id,
+            'caption': message.caption}
+
+
+def input_media(message: Message):
+    """Часть альбома для send_media_group"""
+    fields = attachment_fields(message)
+    return MEDIA_TYPES[fields['kind']](
+        fields['file_id'], caption=fields['caption'],
+        caption_entities=message.caption_entities)
+
+
+def send_attachments(bot: TeleBot, chat_id: int, messages: list) -> None:
+    """Одно сообщение копируем, альбом отправляем одним запросом"""
+    if len(messages) == 1:
+        bot.copy_message(chat_id, messages[0].chat.id,
+                         messages[0].message_id)
+    else:
+        bot.send_media_group(chat_id, [input_media(message)
+                                       for message in messages])
+
+
+def send_stored(bot: TeleBot, chat_id: int, attachments) -> None:
+    """
+    Отправляем сохранённые вложения (TaskAttachment) по file_id без
+    повторной загрузки: подряд идущие файлы - альбомами до 10 штук
+    """
+    batch = []
+
+    def flush() -> None:
+        if len(batch) == 1:
+            attachment = batch[0]
+            getattr(bot, f'send_{attachment.kind}')(
+                chat_id, attachment.file_id, caption=attachment.caption)
+        elif batch:
+            bot.send_media_group(chat_id, [
+                MEDIA_TYPES[attachment.kind](attachment.file_id,
+                                             caption=attachment.caption)
+                for attachment in batch
+            ])
+        batch.clear()
+
+    for attachment in attachments:
+        group = MEDIA_GROUPS.get(attachment.kind)
+        if group is None:
+            flush()
+            bot.send_message(chat_id, attachment.caption)
+            continue
+        if batch and (MEDIA_GROUPS[batch[0].kind] != group or
+                      len(batch) == MEDIA_GROUP_SIZE):
+            flush()
+        batch.append(attachment)
+    flush()
@@ -0,0 +1,240 @@
+"""
+Асинхронный режим бота на AsyncTeleBot.
+
+Обновления получает AsyncTeleBot. Обработчики из handler_worker.py
+работают без изменений в ограниченном пуле потоков: там выполняются
+запросы к б/д и смена состояний. Их запросы к Bot API не блокируют поток:
+они собираются во время обработки обновления и отправляются из цикла
+asyncio. Обновления одного чата обрабатываются последовательно, разных
+чатов - одновременно.
+
+Все запросы с chat_id (сообщения и правки) идут через один
+упорядоченный отправитель на чат: в один чат - по порядку, в разные -
+параллельно. Запросы из других потоков (таймеры альбомов, выгрузка
+export.py) тоже передаются в цикл и встают в очередь своего чата, а
+поток ждёт ответа, не занимая пул обработчиков.
+
+Обработчики не должны полагаться на ответ Bot API: в асинхронном режиме
+send_message и др. возвращают заглушку, реальный запрос уходит позже.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot import apihelper, asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_helper import ApiTelegramException
+from telebot.custom_filters import StateFilter
+from telebot.types import BotCommand, Update
+
+from config import BOT_TOKEN, DEFAULT_COMMANDS, ASYNC_DB_WORKERS
+from handler_worker import bot
+from metrics import count_api_call, start_server as start_metrics_server
+from migrations import run_migrations
+from outbound import dispatcher, current_priority, rewind
+
+logger = logging.getLogger('manager_bot_logger')
+
+# Запросы к Bot API, собранные при обработке обновления в текущем потоке
+outbox = threading.local()
+
+
+class ApiResponse:
+    """Ответ Bot API для синхронного бота: заглушка или ответ из цикла"""
+    reason = 'OK'
+
+    def __init__(self, result: dict, status_code: int = 200) -> None:
+        self.status_code = status_code
+        self.result = result
+        self.text = json.dumps(self.result)
+
+    def json(self) -> dict:
+        return self.result
+
+
+def stub_result(method_name: str, params: dict):
+    """Правдоподобный результат метода для разбора в telebot"""
+    if method_name == 'sendMediaGroup':
+        return []
+    if method_name == 'copyMessage':
+        return {'message_id': 0}
+    if method_name.startswith('send') or method_name == 'forwardMessage':
+        return {
+            'message_id': 0,
+            'date': int(time.time()),
+            'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+        }
+    return True
+
+
+def update_chat_id(update: Update):
+    """Чат, к которому относится обновление"""
+    if update.message is not None:
+        return update.message.chat.id
+    if update.callback_query is not None:
+        return update.callback_query.from_user.id
+    return None
+
+
+class AsyncBot(AsyncTeleBot):
+    """AsyncTeleBot, который передаёт обновления обработчикам handler_worker"""
+
+    def __init__(self, token: str, max_workers: int = ASYNC_DB_WORKERS,
+                 **kwargs) -> None:
+        super().__init__(token, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers,
+                                           thread_name_prefix='handler')
+        # Обработка обновлений чата и отправка в чат
+        self.chat_locks = {}
+        self.send_locks = {}
+        self.loop = None
+        bot.threaded = False
+        apihelper.CUSTOM_REQUEST_SENDER = self.capture_request
+
+    def capture_request(self, method, url, params=None, files=None,
+                        **kwargs):
+        """
+        Подменяет отправку запросов синхронного бота.
+        Внутри обработки обновления запрос откладывается, из других
+        потоков - отправляется из цикла в очереди своего чата. Запросы
+        без чата и до запуска цикла идут через диспетчер как обычно
+        """
+        method_name = url.rsplit('/', 1)[-1]
+        call = (method_name, method, dict(params or {}), files,
+                current_priority())
+        calls = getattr(outbox, 'calls', None)
+        if calls is not None:
+            # Запрос уйдёт позже, вне обработчика: считаем его здесь
+            count_api_call()
+            calls.append(call)
+            return ApiResponse(
+                {'ok': True, 'result': stub_result(method_name,
+                                                   params or {})})
+        if (call[2].get('chat_id') is None or self.loop is None or
+                not self.loop.is_running() or self.loop is asyncio_loop()):
+            return dispatcher.request(method, url, params=params,
+                                      files=files, **kwargs)
+        future = asyncio.run_coroutine_threadsafe(
+            self.send_chain([call]), self.loop)
+        try:
+            [result] = future.result()
+        except ApiTelegramException as e:
+            # Ошибку разберёт apihelper._check_result, как обычно
+            return ApiResponse(e.result_json, e.error_code)
+        return ApiResponse({'ok': True, 'result': result})
+
+    @contextlib.asynccontextmanager
+    async def locked(self, locks: dict, key):
+        """Замок key из locks. Замок удаляется, когда его никто не ждёт"""
+        # [замок, сколько задач его держат или ждут]
+        entry = locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del locks[key]
+
+    async def process_new_updates(self, updates: list) -> None:
+        self.loop = asyncio.get_running_loop()
+        await asyncio.gather(*(self.process_update(update)
+                               for update in updates))
+
+    async def process_update(self, update: Update) -> None:
+        async with self.locked(self.chat_locks, update_chat_id(update)):
+            loop = asyncio.get_running_loop()
+            calls = await loop.run_in_executor(
+                self.executor, run_handlers, update)
+            await self.send_calls(calls)
+
+    async def send_calls(self, calls: list) -> None:
+        """
+        Отправляем отложенные запросы: в один чат (сообщения и правки) -
+        по порядку, в разные чаты и без чата - одновременно
+        """
+        chains = {}
+        for index, call in enumerate(calls):
+            chat_id = call[2].get('chat_id')
+            if chat_id is not None:
+                chains.setdefault(str(chat_id), []).append(call)
+            else:
+                chains[('independent', index)] = [call]
+
+        results = await asyncio.gather(
+            *(self.send_chain(chain) for chain in chains.values()),
+            return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f'Ошибка: {result}')
+
+    async def send_chain(self, chain: list) -> list:
+        """Запросы в один чат: по порядку и без чужих запросов между ними"""
+        chat_id = chain[0][2].get('chat_id')
+        # telebot передаёт chat_id то числом, то строкой
+        lock = (contextlib.nullcontext() if chat_id is None
+                else self.locked(self.send_locks, str(chat_id)))
+        async with lock:
+            return [await self.send_call(*call) for call in chain]
+
+    async def send_call(self, method_name, method, params, files,
+                        priority):
+        """Запрос через очередь диспетчера с повтором после 429"""
+        chat_id = params.get('chat_id')
+        for attempt in range(dispatcher.max_retries + 1):
+            if chat_id is not None:
+                await dispatcher.acquire_async(chat_id, priority)
+            rewind(files)
+            started = time.perf_counter()
+            try:
+                return await asyncio_helper._process_request(
+                    self.token, method_name, method=method,
+                    params=dict(params), files=files)
+            except ApiTelegramException as e:
+                if (e.error_code != 429 or chat_id is None
+                        or attempt == dispatcher.max_retries):
+                    raise
+                parameters = e.result_json.get('parameters') or {}
+                dispatcher.backoff(chat_id,
+                                   parameters.get('retry_after', 1))
+            finally:
+                elapsed = time.perf_counter() - started
+                for observer in dispatcher.observers:
+                    observer(method_name, elapsed)
+
+
+def asyncio_loop():
+    """Цикл asyncio текущего потока, None - если поток не цикла"""
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def run_handlers(update: Update) -> list:
+    """Выполняем обработчики синхронного бота и возвращаем запросы к API"""
+    outbox.calls = []
+    try:
+        bot.process_new_updates([update])
+        return outbox.calls
+    finally:
+        outbox.calls = None
+
+
+async def main() -> None:
+    async_bot = AsyncBot(BOT_TOKEN)
+    await async_bot.set_my_commands(
+        [BotCommand(*cmd) for cmd in DEFAULT_COMMANDS])
+    await async_bot.infinity_polling()
+
+
+if __name__ == '__main__':
+    run_migrations()
+    bot.add_custom_filter(StateFilter(bot))
+    start_metrics_server()
+    asyncio.run(main())
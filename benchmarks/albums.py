@@ -0,0 +1,72 @@
+"""
+Вызовы Bot API на пересылку альбома исполнителю.
+
+Менеджер прикладывает к задаче альбом из N фото. Раньше каждое фото
+уходило отдельно и за ним - своя клавиатура (2N вызовов), теперь
+альбом уходит одним send_media_group и одной клавиатурой.
+
+    python -m benchmarks.albums --photos 10
+"""
+import argparse
+import os
+import tempfile
+import time
+
+WORK_DIR = tempfile.mkdtemp(prefix='manager_bot_bench_')
+os.environ.setdefault('BOT_TOKEN', '1:benchmark')
+os.environ['DB_PATH'] = os.path.join(WORK_DIR, 'database.db')
+os.environ.setdefault('ALBUM_WINDOW', '0.2')
+os.chdir(WORK_DIR)
+
+from telebot import apihelper  # noqa: E402
+from telebot.custom_filters import StateFilter  # noqa: E402
+
+from benchmarks.fake_api import FakeBotApi  # noqa: E402
+from benchmarks.updates import message_update, parse  # noqa: E402
+from config import ALBUM_WINDOW  # noqa: E402
+from handler_worker import bot  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from models import UserManager, UserWorker  # noqa: E402
+from states import UserState  # noqa: E402
+
+MANAGER_ID = 1
+WORKER_ID = 2
+
+
+def photo_sizes(index: int) -> list:
+    return [{'file_id': f'photo{index}_{size}',
+             'file_unique_id': f'unique{index}_{size}',
+             'width': size, 'height': size}
+            for size in (90, 320, 1280)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--photos', type=int, default=10)
+    args = parser.parse_args()
+
+    run_migrations()
+    UserManager.create(user_id=MANAGER_ID, user_name='manager')
+    UserWorker.create(user_id=WORKER_ID, user_name='worker')
+    bot.add_custom_filter(StateFilter(bot))
+    bot.threaded = False
+    bot.set_state(MANAGER_ID, UserState.forward_to_worker)
+    bot.add_data(MANAGER_ID, task_name='Задача', workers=[WORKER_ID])
+
+    album = [message_update(MANAGER_ID, media_group_id='album1',
+                            photo=photo_sizes(index))
+             for index in range(args.photos)]
+    with FakeBotApi(latency=0) as api:
+        apihelper.API_URL = api.url
+        bot.process_new_updates(parse(album))
+        time.sleep(ALBUM_WINDOW + 0.5)
+        calls = dict(api.calls)
+
+    print(f'Альбом из {args.photos} фото')
+    print(f'раньше: {2 * args.photos} вызовов '
+          f'(sendPhoto и клавиатура на каждое фото)')
+    print(f'сейчас: {sum(calls.values())} вызовов {calls}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Пропускная способность: потоковый TeleBot против async_main.AsyncBot.
+
+Оба режима обрабатывают одинаковые синтетические обновления от многих
+менеджеров (/start и возврат в меню) против локального фейкового Bot API
+с задержкой ответа.
+
+    python -m benchmarks.async_vs_threaded --updates 2000 --chats 500
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+WORK_DIR = tempfile.mkdtemp(prefix='manager_bot_bench_')
+os.environ.setdefault('BOT_TOKEN', '1:benchmark')
+os.environ['DB_PATH'] = os.path.join(WORK_DIR, 'database.db')
+# Сравниваем режимы, а не лимиты Telegram
+os.environ.setdefault('OUTBOUND_GLOBAL_RATE', '1000000')
+os.environ.setdefault('OUTBOUND_CHAT_BURST', '1000000')
+os.chdir(WORK_DIR)
+
+from telebot import apihelper, asyncio_helper, util  # noqa: E402
+from telebot.custom_filters import StateFilter  # noqa: E402
+
+from benchmarks.fake_api import FakeBotApi  # noqa: E402
+from benchmarks.updates import (  # noqa: E402
+    callback_update, message_update, parse)
+from handler_worker import bot  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from models import UserManager  # noqa: E402
+
+
+def make_updates(count: int, chats: int) -> list:
+    updates = []
+    for index in range(count):
+        chat_id = 1000 + index % chats
+        if index % 2:
+            updates.append(callback_update(chat_id, 'menu'))
+        else:
+            updates.append(message_update(chat_id, '/start'))
+    return updates
+
+
+def run_threaded(updates: list, threads: int) -> float:
+    """Обычный режим bot.polling(): пул из threads потоков TeleBot"""
+    done = threading.Semaphore(0)
+    pool = util.ThreadPool(bot, num_threads=threads)
+    put = pool.put
+
+    def counted(task):
+        def wrapper(*args, **kwargs):
+            try:
+                task(*args, **kwargs)
+            finally:
+                done.release()
+        return wrapper
+
+    pool.put = lambda task, *args, **kwargs: put(counted(task),
+                                                 *args, **kwargs)
+    bot.threaded = True
+    bot.worker_pool = pool
+
+    started = time.perf_counter()
+    bot.process_new_updates(parse(updates))
+    for _ in updates:
+        done.acquire()
+    elapsed = time.perf_counter() - started
+    pool.close()
+    return elapsed
+
+
+def run_async(updates: list, workers: int) -> float:
+    from async_main import AsyncBot
+
+    async def run():
+        async_bot = AsyncBot(bot.token, max_workers=workers)
+        started = time.perf_counter()
+        await async_bot.process_new_updates(parse(updates))
+        elapsed = time.perf_counter() - started
+        await asyncio_helper.session_manager.session.close()
+        return elapsed
+
+    try:
+        return asyncio.run(run())
+    finally:
+        apihelper.CUSTOM_REQUEST_SENDER = None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--chats', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='задержка ответа фейкового API, сек')
+    parser.add_argument('--threads', type=int, default=2,
+                        help='потоки TeleBot (по умолчанию как в TeleBot)')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='потоки б/д асинхронного режима')
+    args = parser.parse_args()
+
+    run_migrations()
+    UserManager.insert_many(
+        [{'user_id': 1000 + i, 'user_name': f'manager{i}'}
+         for i in range(args.chats)]).execute()
+    bot.add_custom_filter(StateFilter(bot))
+
+    with FakeBotApi(latency=args.latency) as api:
+        apihelper.API_URL = api.url
+        asyncio_helper.API_URL = api.url
+        results = (
+            (f'threaded ({args.threads} потоков)',
+             run_threaded(make_updates(args.updates, args.chats),
+                          args.threads)),
+            (f'asyncio ({args.workers} потоков б/д)',
+             run_async(make_updates(args.updates, args.chats),
+                       args.workers)),
+        )
+        calls = sum(api.calls.values())
+
+    print(f'{args.updates} обновлений, {args.chats} чатов, '
+          f'задержка API {args.latency * 1000:.0f} мс, '
+          f'{calls} вызовов API')
+    for name, elapsed in results:
+        print(f'{name:<28} {args.updates / elapsed:8.1f} обновлений/с')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Повтор потока обновлений через пул TeleBot и через chat_executor.
+
+Каждый чат шлёт чередующиеся /start и нажатие "Вернуться в меню",
+фейковый Bot API отвечает с задержкой. Для каждого размера пула
+выводится пропускная способность и число случаев, когда два обновления
+одного чата обрабатывались одновременно.
+
+    python -m benchmarks.chat_replay --updates 2000 --chats 50
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+WORK_DIR = tempfile.mkdtemp(prefix='manager_bot_bench_')
+os.environ.setdefault('BOT_TOKEN', '1:benchmark')
+os.environ['DB_PATH'] = os.path.join(WORK_DIR, 'database.db')
+os.environ.setdefault('OUTBOUND_GLOBAL_RATE', '1000000')
+os.environ.setdefault('OUTBOUND_CHAT_BURST', '1000000')
+os.chdir(WORK_DIR)
+
+from telebot import apihelper, util  # noqa: E402
+from telebot.custom_filters import StateFilter  # noqa: E402
+
+from benchmarks.fake_api import FakeBotApi  # noqa: E402
+from benchmarks.updates import (  # noqa: E402
+    callback_update, message_update, parse)
+from chat_executor import ChatExecutor, chat_key  # noqa: E402
+from handler_worker import bot  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from models import UserManager  # noqa: E402
+
+
+def make_updates(count: int, chats: int) -> list:
+    updates = []
+    for index in range(count):
+        chat_id = 1000 + index % chats
+        if (index // chats) % 2:
+            updates.append(callback_update(chat_id, 'menu'))
+        else:
+            updates.append(message_update(chat_id, '/start'))
+    return updates
+
+
+class Recorder:
+    """
+    Оборачивает задачи пула: считает завершённые и случаи, когда
+    обновление чата начало обрабатываться, пока предыдущее ещё не
+    закончилось, - это и есть гонка set_state/Task.get внутри чата
+    """
+
+    def __init__(self, pool) -> None:
+        self.done = threading.Semaphore(0)
+        self.lock = threading.Lock()
+        self.active = set()
+        self.overlaps = 0
+        put = pool.put
+        pool.put = lambda func, *args, **kwargs: put(
+            self.wrap(func, chat_key(args[0])), *args, **kwargs)
+
+    def wrap(self, func, chat_id):
+        def wrapper(*args, **kwargs):
+            with self.lock:
+                if chat_id in self.active:
+                    self.overlaps += 1
+                self.active.add(chat_id)
+            try:
+                func(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.active.discard(chat_id)
+                self.done.release()
+        return wrapper
+
+
+def replay(pool, updates: list) -> tuple:
+    recorder = Recorder(pool)
+    bot.threaded = True
+    bot.worker_pool = pool
+
+    started = time.perf_counter()
+    bot.process_new_updates(parse(updates))
+    for _ in updates:
+        recorder.done.acquire()
+    elapsed = time.perf_counter() - started
+    pool.close()
+    return len(updates) / elapsed, recorder.overlaps
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='задержка ответа фейкового API, сек')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    run_migrations()
+    UserManager.insert_many(
+        [{'user_id': 1000 + i, 'user_name': f'manager{i}'}
+         for i in range(args.chats)]).execute()
+    bot.add_custom_filter(StateFilter(bot))
+
+    print(f'{args.updates} обновлений, {args.chats} чатов, '
+          f'задержка API {args.latency * 1000:.0f} мс, '
+          f'ядер: {os.cpu_count()}')
+    print(f'{"пул":<24} {"обновлений/с":>13} {"гонок в чате":>13}')
+    with FakeBotApi(latency=args.latency) as api:
+        apihelper.API_URL = api.url
+        for workers in args.workers:
+            for name, pool in (
+                    (f'TeleBot ThreadPool({workers})',
+                     util.ThreadPool(bot, num_threads=workers)),
+                    (f'ChatExecutor({workers})',
+                     ChatExecutor(bot, workers))):
+                rate, overlaps = replay(
+                    pool, make_updates(args.updates, args.chats))
+                print(f'{name:<24} {rate:13.1f} {overlaps:13d}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Память и время выгрузки задач (export.py).
+
+Заполняем б/д задачами одного менеджера (--tasks, можно несколько
+размеров по возрастанию) и собираем выгрузку за весь период двумя
+способами: export.build_file (курсор и SpooledTemporaryFile) и
+наивно - список моделей Task и файл целиком в памяти. Для каждого
+выводим время, пик памяти Python (tracemalloc) и размер файла.
+Наивный способ (--naive) дочитывает исполнителя каждой задачи
+отдельным запросом и на больших размерах идёт минутами.
+
+    python -m benchmarks.export --tasks 100000 1000000
+"""
+import argparse
+import csv
+import datetime
+import io
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+WORK_DIR = tempfile.mkdtemp(prefix='manager_bot_bench_')
+os.environ.setdefault('BOT_TOKEN', '1:benchmark')
+os.environ['DB_PATH'] = os.path.join(WORK_DIR, 'database.db')
+os.environ['LOG_DIR'] = WORK_DIR
+os.environ['METRICS_PORT'] = '0'
+os.chdir(WORK_DIR)
+
+import export  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from models import db, Task, UserManager, UserWorker  # noqa: E402
+
+MANAGER_ID = 1
+WORKERS = 100
+SEED_BATCH = 5000
+SEED_DAYS = 730
+
+
+def seed(total: int) -> None:
+    """Доводим число задач менеджера до total"""
+    if not UserManager.select().exists():
+        UserManager.create(user_id=MANAGER_ID, user_name='manager')
+        UserWorker.insert_many(
+            [{'user_id': 1001 + i, 'user_name': f'worker{i}'}
+             for i in range(WORKERS)]).execute()
+    today = datetime.date.today()
+    rng = random.Random(total)
+    missing = total - Task.select().count()
+    while missing > 0:
+        rows = []
+        for _ in range(min(SEED_BATCH, missing)):
+            start = today - datetime.timedelta(days=rng.randrange(SEED_DAYS))
+            rows.append({
+                'task_name': f'Задача {rng.randrange(10 ** 6)}',
+                'id_manager': MANAGER_ID,
+                'id_worker': 1001 + rng.randrange(WORKERS),
+                'date_start': start,
+                'date_finish': start + datetime.timedelta(days=3),
+                'status': 'finish',
+            })
+        with db.atomic():
+            Task.insert_many(rows).execute()
+        missing -= len(rows)
+
+
+def naive_file(left_date, right_date) -> io.BytesIO:
+    """Как выгрузку написали бы в лоб: все модели и весь файл в памяти"""
+    text = io.StringIO()
+    writer = csv.writer(text, delimiter=';')
+    writer.writerow(export.HEADER)
+    tasks = list(Task.select().where(
+        (Task.id_manager == MANAGER_ID) &
+        Task.date_start.between(left_date, right_date)))
+    for task in tasks:
+        writer.writerow((task.task_id, task.task_name, task.worker.user_name,
+                         task.status, task.date_start, task.date_finish))
+    return io.BytesIO(text.getvalue().encode('utf-8-sig'))
+
+
+def measure(name: str, build) -> None:
+    """Время - без tracemalloc (он замедляет в разы), пик - вторым прогоном"""
+    started = time.perf_counter()
+    build().close()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    file = build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size = file.seek(0, io.SEEK_END)
+    file.close()
+    print(f'{name:<12}{elapsed:>9.2f} {peak / 2 ** 20:>10.1f} '
+          f'{size / 2 ** 20:>10.1f}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--tasks', type=int, nargs='+', default=[100000])
+    parser.add_argument('--naive', action='store_true',
+                        help='замерить и наивную выгрузку (N+1 запросов)')
+    args = parser.parse_args()
+
+    run_migrations()
+    right_date = datetime.date.today()
+    left_date = right_date - datetime.timedelta(days=SEED_DAYS)
+    for total in args.tasks:
+        seed(total)
+        print(f'\n{total} задач')
+        print(f'{"способ":<12}{"время, с":>9} {"пик, МиБ":>10} '
+              f'{"файл, МиБ":>10}')
+        for fmt in export.available_formats():
+            measure(fmt, lambda: export.build_file(
+                fmt, MANAGER_ID, left_date, right_date))
+        if args.naive:
+            measure('naive csv', lambda: naive_file(left_date, right_date))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Локальный сервер, изображающий Telegram Bot API, с задержкой ответа"""
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+class FakeApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class FakeBotApi:
+    """
+    Отвечает на любой метод Bot API успешным результатом через latency
+    секунд и считает вызовы по методам. on_call(method_name, params)
+    вызывается на каждый запрос - так симуляция видит, что бот отправил.
+
+    .. code-block:: python3
+
+        with FakeBotApi(latency=0.05) as api:
+            apihelper.API_URL = api.url
+    """
+
+    def __init__(self, latency: float = 0.05, host: str = '127.0.0.1',
+                 port: int = 0, on_call=None) -> None:
+        self.latency = latency
+        self.on_call = on_call
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.server = FakeApiServer((host, port), self._handler_class())
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name='FakeBotApi', daemon=True)
+
+    @property
+    def url(self) -> str:
+        """Шаблон адреса для apihelper.API_URL / asyncio_helper.API_URL"""
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/bot{{0}}/{{1}}'
+
+    def start(self) -> 'FakeBotApi':
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> 'FakeBotApi':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.stop()
+
+    def result(self, method_name: str):
+        if method_name == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'bot',
+                    'username': 'manager_bot'}
+        if method_name == 'getUpdates':
+            return []
+        if method_name == 'sendMediaGroup':
+            return []
+        if method_name == 'copyMessage':
+            return {'message_id': 1}
+        if method_name.startswith('send') or method_name == 'forwardMessage':
+            return {'message_id': 1, 'date': int(time.time()),
+                    'chat': {'id': 0, 'type': 'private'}}
+        return True
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                self.rfile.read(length)
+                url = urlsplit(self.path)
+                method_name = url.path.rsplit('/', 1)[-1]
+                with api.lock:
+                    api.calls[method_name] += 1
+                if api.on_call is not None:
+                    api.on_call(method_name, dict(parse_qsl(url.query)))
+                time.sleep(api.latency)
+
+                body = json.dumps(
+                    {'ok': True, 'result': api.result(method_name)}
+                ).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
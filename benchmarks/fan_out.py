@@ -0,0 +1,84 @@
+"""
+Назначение одной задачи многим исполнителям: последовательная рассылка
+против параллельной (outbound.fan_out).
+
+Менеджер выбирает всех исполнителей, прикладывает сообщение и
+отправляет задачу. Замеряем время от приложения до отправки: это одна
+пересылка и два уведомления каждому исполнителю.
+
+    python -m benchmarks.fan_out --workers 50 --latency 0.1
+"""
+import argparse
+import os
+import tempfile
+import time
+
+WORK_DIR = tempfile.mkdtemp(prefix='manager_bot_bench_')
+os.environ.setdefault('BOT_TOKEN', '1:benchmark')
+os.environ['DB_PATH'] = os.path.join(WORK_DIR, 'database.db')
+# Сравниваем рассылку, а не лимиты Telegram
+os.environ.setdefault('OUTBOUND_GLOBAL_RATE', '1000000')
+os.environ.setdefault('OUTBOUND_CHAT_BURST', '1000000')
+os.chdir(WORK_DIR)
+
+from telebot import apihelper  # noqa: E402
+from telebot.custom_filters import StateFilter  # noqa: E402
+
+import outbound  # noqa: E402
+from benchmarks.fake_api import FakeBotApi  # noqa: E402
+from benchmarks.updates import (  # noqa: E402
+    callback_update, message_update, parse)
+from handler_worker import bot  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from models import Task, UserManager, UserWorker  # noqa: E402
+from states import UserState  # noqa: E402
+
+MANAGER_ID = 1
+
+
+def assign(workers: int) -> float:
+    """Назначаем задачу всем исполнителям, возвращаем время рассылки"""
+    Task.delete().execute()
+    bot.set_state(MANAGER_ID, UserState.choose_workers)
+    bot.add_data(MANAGER_ID, task_name='Задача',
+                 workers=[1000 + i for i in range(workers)])
+    bot.process_new_updates(parse([
+        callback_update(MANAGER_ID, 'pick_done')]))
+
+    started = time.perf_counter()
+    bot.process_new_updates(parse([
+        message_update(MANAGER_ID, 'Подробности задачи'),
+        callback_update(MANAGER_ID, 'send'),
+    ]))
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--workers', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.1,
+                        help='задержка ответа фейкового API, сек')
+    args = parser.parse_args()
+
+    run_migrations()
+    UserManager.create(user_id=MANAGER_ID, user_name='manager')
+    UserWorker.insert_many(
+        [{'user_id': 1000 + i, 'user_name': f'worker{i}'}
+         for i in range(args.workers)]).execute()
+    bot.add_custom_filter(StateFilter(bot))
+    bot.threaded = False
+
+    print(f'{args.workers} исполнителей, '
+          f'задержка API {args.latency * 1000:.0f} мс')
+    with FakeBotApi(latency=args.latency) as api:
+        apihelper.API_URL = api.url
+        for name, fan_out_workers in (('последовательно', 1),
+                                      ('fan_out', args.workers)):
+            outbound.FAN_OUT_WORKERS = fan_out_workers
+            elapsed = assign(args.workers)
+            print(f'{name:<16} {elapsed:6.2f} с '
+                  f'({elapsed / args.latency:.1f} задержки API)')
+
+
+if __name__ == '__main__':
+    main()
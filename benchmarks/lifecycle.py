@@ -0,0 +1,372 @@
+"""
+Нагрузочная симуляция полного цикла задач: N менеджеров и M исполнителей.
+
+Пользователи проходят настоящие состояния states.py через потоковый бот
+(chat_executor) и локальный фейковый Bot API. Задачи появляются
+потоком Пуассона (--task-rate в секунду): свободный менеджер создаёт
+задачу свободному исполнителю, прикладывает фото и текст и отправляет.
+Исполнитель, получив "Принять работу?", через --think секунд принимает
+её, через --work секунд сдаёт с фото. Отчёты менеджеры запрашивают
+потоком --report-rate в секунду.
+
+Для каждой интенсивности (--task-rate можно задать несколько)
+выводятся поданные и обработанные обновления в секунду, p50/p99 от
+поступления обновления до конца обработки, завершённые задачи, ошибки
+"database is locked", число и размер записей хранилища состояний и
+пиковая память процесса. Насыщение - интенсивность, после которой
+обработанные обновления перестают расти, а задержка растёт.
+
+Исполнителей может быть сколько угодно: менеджер листает список
+(по PAGE_SIZE на странице) до страницы исполнителя и выбирает его.
+
+    python -m benchmarks.lifecycle --managers 200 --workers 500 \\
+        --task-rate 5 10 20 --duration 15
+"""
+import argparse
+import datetime
+import heapq
+import json
+import logging
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+
+WORK_DIR = tempfile.mkdtemp(prefix='manager_bot_bench_')
+os.environ.setdefault('BOT_TOKEN', '1:benchmark')
+os.environ['DB_PATH'] = os.path.join(WORK_DIR, 'database.db')
+os.environ['LOG_DIR'] = WORK_DIR
+os.environ['METRICS_PORT'] = '0'
+os.environ.setdefault('OUTBOUND_GLOBAL_RATE', '1000000')
+os.environ.setdefault('OUTBOUND_CHAT_BURST', '1000000')
+os.environ.setdefault('ALBUM_WINDOW', '0.2')
+os.chdir(WORK_DIR)
+
+from telebot import apihelper  # noqa: E402
+from telebot.custom_filters import StateFilter  # noqa: E402
+
+import keyboards  # noqa: E402
+from benchmarks.fake_api import FakeBotApi  # noqa: E402
+from benchmarks.updates import (  # noqa: E402
+    callback_update, message_update, parse)
+from handler_worker import bot, chat_executor, logger  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from models import Task  # noqa: E402
+from queries import PAGE_SIZE  # noqa: E402
+
+FIRST_MANAGER = 1
+FIRST_WORKER = 100_000
+ACCEPT_QUESTION = 'Принять работу?'
+
+
+class Scheduler(threading.Thread):
+    """Выполняет действия пользователей в назначенное время"""
+
+    def __init__(self) -> None:
+        super().__init__(name='Scheduler', daemon=True)
+        self.events = []
+        self.seq = 0
+        self.cond = threading.Condition()
+
+    def at(self, delay: float, action, *args) -> None:
+        with self.cond:
+            self.seq += 1
+            heapq.heappush(self.events, (time.monotonic() + delay, self.seq,
+                                         action, args))
+            self.cond.notify()
+
+    def pending(self) -> int:
+        with self.cond:
+            return len(self.events)
+
+    def run(self) -> None:
+        while True:
+            with self.cond:
+                while not self.events or \
+                        self.events[0][0] > time.monotonic():
+                    timeout = (self.events[0][0] - time.monotonic()
+                               if self.events else None)
+                    self.cond.wait(timeout)
+                _, _, action, args = heapq.heappop(self.events)
+            try:
+                action(*args)
+            except Exception as e:
+                print(f'Ошибка сценария: {e!r}')
+
+
+class LatencyRecorder:
+    """Время от постановки обновления в шард до конца его обработки"""
+
+    def __init__(self, executor) -> None:
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.processed = 0
+        put = executor.put
+
+        def timed_put(func, *args, **kwargs):
+            enqueued = time.perf_counter()
+
+            def run(*run_args, **run_kwargs):
+                try:
+                    func(*run_args, **run_kwargs)
+                finally:
+                    with self.lock:
+                        self.latencies.append(time.perf_counter() - enqueued)
+                        self.processed += 1
+
+            put(run, *args, **kwargs)
+
+        executor.put = timed_put
+
+    def take(self) -> list:
+        with self.lock:
+            latencies, self.latencies = self.latencies, []
+        return latencies
+
+
+class LockedErrors(logging.Handler):
+    """Считает ошибки обработчиков 'database is locked'"""
+
+    def __init__(self) -> None:
+        super().__init__(logging.ERROR)
+        self.errors = 0
+        self.locked = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.errors += 1
+        if 'database is locked' in record.getMessage():
+            self.locked += 1
+
+
+class Simulation:
+    def __init__(self, managers: int, workers: int, think: float,
+                 work: float, step: float) -> None:
+        self.managers = [FIRST_MANAGER + i for i in range(managers)]
+        self.workers = [FIRST_WORKER + i for i in range(workers)]
+        self.think = think
+        self.work = work
+        self.step = step
+        self.rng = random.Random(1)
+        self.lock = threading.Lock()
+        self.idle_managers = set(self.managers)
+        self.idle_workers = set(self.workers)
+        self.assigned = {}  # исполнитель -> менеджер его задачи
+        self.pushed = 0
+        self.skipped = 0
+        self.scheduler = Scheduler()
+        self.scheduler.start()
+
+    def push(self, updates: list) -> None:
+        self.pushed += len(updates)
+        bot.process_new_updates(parse(updates))
+
+    def say(self, updates: list) -> None:
+        """Сообщения и нажатия одного пользователя - через step секунд"""
+        for index, update in enumerate(updates):
+            self.scheduler.at(index * self.step, self.push, [update])
+
+    def on_call(self, method_name: str, params: dict) -> None:
+        """Реакция пользователей на сообщения бота"""
+        if (method_name == 'sendMessage' and
+                params.get('text') == ACCEPT_QUESTION):
+            # Исполнитель нажимает кнопку из сообщения: accept:<task_id>
+            markup = json.loads(params['reply_markup'])
+            data = markup['inline_keyboard'][0][0]['callback_data']
+            self.scheduler.at(self.think, self.accept,
+                              int(params['chat_id']), data)
+
+    def register(self) -> None:
+        for user_id in self.workers:
+            self.push([message_update(user_id, '/start'),
+                       callback_update(user_id, 'worker'),
+                       message_update(user_id, f'Исполнитель {user_id}')])
+        for user_id in self.managers:
+            self.push([message_update(user_id, '/start'),
+                       callback_update(user_id, 'manager'),
+                       message_update(user_id, f'Менеджер {user_id}')])
+
+    def create(self) -> None:
+        with self.lock:
+            if not self.idle_managers or not self.idle_workers:
+                self.skipped += 1
+                return
+            manager = self.rng.choice(sorted(self.idle_managers))
+            worker = self.rng.choice(sorted(self.idle_workers))
+            self.idle_managers.discard(manager)
+            self.idle_workers.discard(worker)
+            self.assigned[worker] = manager
+        # Исполнители в списке по user_id: листаем до страницы исполнителя
+        page = self.workers.index(worker) // PAGE_SIZE
+        picker_page = ([callback_update(
+            manager, f'{keyboards.PICK_PAGE_PREFIX}{page}')] if page else [])
+        self.say([
+            callback_update(manager, 'menu'),
+            callback_update(manager, 'new_task'),
+            message_update(manager, f'Задача для {worker}'),
+            *picker_page,
+            callback_update(manager, f'{keyboards.PICK_PREFIX}{worker}'),
+            callback_update(manager, keyboards.PICK_DONE),
+            message_update(manager, caption='Макет', photo=photo(manager)),
+            message_update(manager, 'Подробности задачи'),
+            callback_update(manager, 'send'),
+        ])
+
+    def accept(self, worker: int, data: str) -> None:
+        self.push([callback_update(worker, data)])
+        self.scheduler.at(self.work, self.submit, worker, 0)
+
+    def submit(self, worker: int, attempt: int) -> None:
+        task = (Task.select(Task.task_id)
+                .where((Task.id_worker == worker) & (Task.status == 'work'))
+                .first())
+        if task is None:
+            # Принятие ещё в очереди обработки
+            if attempt < 50:
+                self.scheduler.at(0.1, self.submit, worker, attempt + 1)
+            return
+        self.release(self.assigned.pop(worker))
+        self.say([
+            callback_update(worker, 'menu_w'),
+            callback_update(worker, 'task_fin'),
+            callback_update(worker, task.task_id),
+            message_update(worker, caption='Готово', photo=photo(worker)),
+            callback_update(worker, 'send_w'),
+        ])
+        with self.lock:
+            self.idle_workers.add(worker)
+
+    def report(self) -> None:
+        with self.lock:
+            if not self.idle_managers:
+                return
+            manager = self.rng.choice(sorted(self.idle_managers))
+            self.idle_managers.discard(manager)
+        right = datetime.date.today()
+        left = right - datetime.timedelta(days=30)
+        updates = [
+            callback_update(manager, 'menu'),
+            callback_update(manager, 'report'),
+            message_update(manager, f'{left.strftime("%d/%m/%Y")} - '
+                                    f'{right.strftime("%d/%m/%Y")}'),
+        ]
+        self.say(updates)
+        # Новую задачу менеджер начнёт после отчёта
+        self.scheduler.at(len(updates) * self.step, self.release, manager)
+
+    def release(self, manager: int) -> None:
+        with self.lock:
+            self.idle_managers.add(manager)
+
+    def arrivals(self, rate: float, duration: float, action) -> None:
+        """Поток Пуассона: события action с интенсивностью rate в секунду"""
+        if rate <= 0:
+            return
+        moment = self.rng.expovariate(rate)
+        while moment < duration:
+            self.scheduler.at(moment, action)
+            moment += self.rng.expovariate(rate)
+
+
+def photo(index: int) -> list:
+    return [{'file_id': f'photo{index}_{size}',
+             'file_unique_id': f'unique{index}_{size}',
+             'width': size, 'height': size}
+            for size in (90, 1280)]
+
+
+def state_size() -> tuple:
+    """(записей, байт JSON) в хранилище состояний бота"""
+    storage = bot.current_states
+    records = getattr(storage, 'records', None)
+    if records is None:
+        records = getattr(storage, 'data', {})
+    with getattr(storage, 'lock', threading.Lock()):
+        records = dict(records)
+    return len(records), len(json.dumps(records, default=str))
+
+
+def wait_idle(simulation: Simulation, recorder: LatencyRecorder,
+              timeout: float) -> None:
+    """Ждём, пока обработаны все поданные обновления и нет событий"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if (recorder.processed >= simulation.pushed and
+                not simulation.scheduler.pending()):
+            return
+        time.sleep(0.05)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--managers', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=500)
+    parser.add_argument('--task-rate', type=float, nargs='+',
+                        default=[2, 5, 10, 20])
+    parser.add_argument('--report-rate', type=float, default=1.0)
+    parser.add_argument('--duration', type=float, default=20.0,
+                        help='длительность шага нагрузки, сек')
+    parser.add_argument('--think', type=float, default=0.5,
+                        help='реакция пользователя, сек')
+    parser.add_argument('--work', type=float, default=2.0,
+                        help='работа над задачей до сдачи, сек')
+    parser.add_argument('--step', type=float, default=0.2,
+                        help='пауза между сообщениями пользователя, сек')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='задержка ответа фейкового API, сек')
+    args = parser.parse_args()
+
+    run_migrations()
+    bot.add_custom_filter(StateFilter(bot))
+    recorder = LatencyRecorder(chat_executor)
+    errors = LockedErrors()
+    logger.addHandler(errors)
+    simulation = Simulation(args.managers, args.workers, args.think,
+                            args.work, args.step)
+
+    with FakeBotApi(latency=args.latency,
+                    on_call=simulation.on_call) as api:
+        apihelper.API_URL = api.url
+        simulation.register()
+        wait_idle(simulation, recorder, 600)
+        recorder.take()
+
+        print(f'{args.managers} менеджеров, {args.workers} исполнителей, '
+              f'задержка API {args.latency * 1000:.0f} мс, '
+              f'отчётов {args.report_rate}/с, шаг {args.duration:.0f} с')
+        print(f'{"задач/с":>7} {"подано/с":>9} {"обраб./с":>9} '
+              f'{"p50, мс":>8} {"p99, мс":>8} {"готово":>6} '
+              f'{"пропуск":>7} {"locked":>6} {"состояний":>9} '
+              f'{"КБ":>6} {"RSS, МБ":>7}')
+        for rate in args.task_rate:
+            finished = Task.select().where(Task.status == 'finish').count()
+            pushed = simulation.pushed
+            processed = recorder.processed
+            skipped = simulation.skipped
+            locked = errors.locked
+
+            simulation.arrivals(rate, args.duration, simulation.create)
+            simulation.arrivals(args.report_rate, args.duration,
+                                simulation.report)
+            time.sleep(args.duration)
+            offered = (simulation.pushed - pushed) / args.duration
+            throughput = (recorder.processed - processed) / args.duration
+            wait_idle(simulation, recorder, 120)
+
+            latencies = sorted(recorder.take()) or [0]
+            done = Task.select().where(
+                Task.status == 'finish').count() - finished
+            entries, size = state_size()
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(f'{rate:>7.1f} {offered:>9.1f} {throughput:>9.1f} '
+                  f'{latencies[len(latencies) // 2] * 1000:>8.1f} '
+                  f'{latencies[int(len(latencies) * 0.99)] * 1000:>8.1f} '
+                  f'{done:>6} {simulation.skipped - skipped:>7} '
+                  f'{errors.locked - locked:>6} {entries:>9} '
+                  f'{size / 1024:>6.1f} {rss:>7.1f}')
+        print(f'ошибок обработчиков всего: {errors.errors}')
+
+
+if __name__ == '__main__':
+    main()
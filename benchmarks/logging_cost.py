@@ -0,0 +1,143 @@
+"""
+Задержка обработчиков с журналом и без него.
+
+Повторяем поток /start и "Вернуться в меню" от нескольких менеджеров и
+замеряем время обработки каждого обновления в трёх режимах: журнал
+выключен, прежние синхронные FileHandler и очередь log_pipeline.py.
+--disk-latency добавляет задержку к каждой записи в файл - так ведёт
+себя медленный или занятый диск.
+
+    python -m benchmarks.logging_cost --updates 2000 --disk-latency 0.002
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+WORK_DIR = tempfile.mkdtemp(prefix='manager_bot_bench_')
+os.environ.setdefault('BOT_TOKEN', '1:benchmark')
+os.environ['DB_PATH'] = os.path.join(WORK_DIR, 'database.db')
+os.environ['LOG_DIR'] = WORK_DIR
+os.environ.setdefault('OUTBOUND_GLOBAL_RATE', '1000000')
+os.environ.setdefault('OUTBOUND_CHAT_BURST', '1000000')
+os.chdir(WORK_DIR)
+
+from telebot import apihelper  # noqa: E402
+from telebot.custom_filters import StateFilter  # noqa: E402
+
+from benchmarks.fake_api import FakeBotApi  # noqa: E402
+from benchmarks.updates import (  # noqa: E402
+    callback_update, message_update, parse)
+from handler_worker import bot, logger  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from models import UserManager  # noqa: E402
+
+MANAGERS = 20
+
+
+class SlowFileHandler(logging.FileHandler):
+    """FileHandler, запись которого занимает не меньше latency секунд"""
+
+    def __init__(self, filename: str, latency: float) -> None:
+        super().__init__(filename)
+        self.latency = latency
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        super().emit(record)
+
+
+def sync_handlers(latency: float) -> list:
+    """Прежняя настройка журнала: два FileHandler в потоке обработчика"""
+    formatter = logging.Formatter(
+        '%(asctime)s - %(levelname)s - %(message)s - %(filename)s'
+        ' - Line: %(lineno)d', '%H:%M')
+    info_handler = SlowFileHandler('sync_info.log', latency)
+    info_handler.setLevel(logging.INFO)
+    info_handler.addFilter(lambda record: record.levelno < logging.ERROR)
+    error_handler = SlowFileHandler('sync_errors.log', latency)
+    error_handler.setLevel(logging.ERROR)
+    for handler in (info_handler, error_handler):
+        handler.setFormatter(formatter)
+    return [info_handler, error_handler]
+
+
+def slow_down_listener(latency: float) -> None:
+    """Та же задержка записи для файлов очереди"""
+    from log_pipeline import listener
+
+    for handler in listener.handlers:
+        emit = handler.emit
+
+        def slow_emit(record, emit=emit):
+            time.sleep(latency)
+            emit(record)
+
+        handler.emit = slow_emit
+
+
+def make_updates(count: int) -> list:
+    updates = []
+    for index in range(count):
+        chat_id = 1000 + index % MANAGERS
+        if (index // MANAGERS) % 2:
+            updates.append(callback_update(chat_id, 'menu'))
+        else:
+            updates.append(message_update(chat_id, '/start'))
+    return parse(updates)
+
+
+def measure(updates: list) -> list:
+    """Время обработки каждого обновления, мс"""
+    timings = []
+    for update in updates:
+        started = time.perf_counter()
+        bot.process_new_updates([update])
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--disk-latency', type=float, default=0.0,
+                        help='задержка записи строки в файл, сек')
+    args = parser.parse_args()
+
+    run_migrations()
+    UserManager.insert_many(
+        [{'user_id': 1000 + i, 'user_name': f'manager{i}'}
+         for i in range(MANAGERS)]).execute()
+    bot.add_custom_filter(StateFilter(bot))
+    bot.threaded = False
+    if args.disk_latency:
+        slow_down_listener(args.disk_latency)
+
+    queue_handlers = list(logger.handlers)
+    modes = (
+        ('выключен', lambda: setattr(logger, 'disabled', True)),
+        ('FileHandler', lambda: setattr(
+            logger, 'handlers', sync_handlers(args.disk_latency))),
+        ('очередь', lambda: setattr(logger, 'handlers', queue_handlers)),
+    )
+
+    print(f'{args.updates} обновлений, '
+          f'задержка записи {args.disk_latency * 1000:.1f} мс')
+    with FakeBotApi(latency=0) as api:
+        apihelper.API_URL = api.url
+        # Прогрев: соединения, кэши клавиатур и запросов
+        measure(make_updates(MANAGERS * 2))
+        for name, enable in modes:
+            logger.disabled = False
+            enable()
+            timings = sorted(measure(make_updates(args.updates)))
+            print(f'{name:<12} '
+                  f'p50 {statistics.median(timings):6.2f} мс  '
+                  f'p99 {timings[int(len(timings) * 0.99)]:6.2f} мс')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Стоимость клавиатуры на одну отправку: сборка из новых кнопок с
+сериализацией в JSON (как было) против готовой клавиатуры из keyboards.
+
+    python -m benchmarks.markup_cost --repeat 100000
+"""
+import argparse
+import timeit
+
+import keyboards
+
+CASES = (
+    ('ROLE', keyboards.ROLE_BUTTONS, keyboards.ROLE),
+    ('MANAGER_TO_DO', keyboards.MANAGER_TO_DO_BUTTONS,
+     keyboards.MANAGER_TO_DO),
+    ('TIP_OF_TASKS_W', keyboards.TIP_OF_TASKS_W_BUTTONS,
+     keyboards.TIP_OF_TASKS_W),
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--repeat', type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f'{"клавиатура":<16} {"сборка, мкс":>12} {"кэш, мкс":>10}')
+    for name, buttons, frozen in CASES:
+        before = timeit.timeit(
+            lambda: keyboards.build(*buttons).to_json(), number=args.repeat)
+        after = timeit.timeit(frozen.to_json, number=args.repeat)
+        print(f'{name:<16} {before / args.repeat * 1e6:12.2f} '
+              f'{after / args.repeat * 1e6:10.3f}')
+
+    borders = '01/01/2024 - 31/01/2024'
+    before = timeit.timeit(
+        lambda: keyboards.status_task.__wrapped__(borders).to_json(),
+        number=args.repeat)
+    after = timeit.timeit(
+        lambda: keyboards.status_task(borders).to_json(), number=args.repeat)
+    print(f'{"status_task":<16} {before / args.repeat * 1e6:12.2f} '
+          f'{after / args.repeat * 1e6:10.3f}')
+
+
+if __name__ == '__main__':
+    main()
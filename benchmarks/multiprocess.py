@@ -0,0 +1,125 @@
+"""
+Пропускная способность update_queue.py в зависимости от числа процессов.
+
+Запускаем N процессов-обработчиков, складываем в очередь поток
+обновлений от многих чатов и ждём, пока очередь опустеет. Фейковый
+Bot API отвечает с задержкой, как настоящий.
+
+    python -m benchmarks.multiprocess --updates 2000 --workers 1 2 4
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Дочерние процессы работают в каталоге родителя
+WORK_DIR = os.environ.get('BENCH_WORK_DIR') or tempfile.mkdtemp(
+    prefix='manager_bot_bench_')
+os.environ['BENCH_WORK_DIR'] = WORK_DIR
+os.environ.setdefault('BOT_TOKEN', '1:benchmark')
+os.environ['DB_PATH'] = os.path.join(WORK_DIR, 'database.db')
+os.environ['UPDATE_QUEUE_PATH'] = os.path.join(WORK_DIR, 'updates.db')
+os.environ.setdefault('OUTBOUND_GLOBAL_RATE', '1000000')
+os.environ.setdefault('OUTBOUND_CHAT_BURST', '1000000')
+PACKAGE_DIR = os.getcwd()
+os.chdir(WORK_DIR)
+
+from telebot import apihelper  # noqa: E402
+
+from benchmarks.fake_api import FakeBotApi  # noqa: E402
+from benchmarks.updates import callback_update, message_update  # noqa: E402
+from update_queue import UpdateQueue  # noqa: E402
+
+
+def make_updates(count: int, chats: int) -> list:
+    updates = []
+    for index in range(count):
+        chat_id = 1000 + index % chats
+        if (index // chats) % 2:
+            updates.append(callback_update(chat_id, 'menu'))
+        else:
+            updates.append(message_update(chat_id, '/start'))
+    return updates
+
+
+def child(worker: int, workers: int, api_url: str) -> None:
+    """Процесс-обработчик: как `update_queue.py worker`, но с фейковым API"""
+    from telebot.custom_filters import StateFilter
+
+    from handler_worker import bot
+    from update_queue import run_worker, share_outbound_limit
+
+    apihelper.API_URL = api_url
+    bot.add_custom_filter(StateFilter(bot))
+    share_outbound_limit(workers)
+    print('ready', flush=True)
+    run_worker(bot, UpdateQueue(), worker, workers)
+
+
+def measure(queue: UpdateQueue, workers: int, updates: list,
+            api_url: str) -> float:
+    env = dict(os.environ, PYTHONPATH=PACKAGE_DIR)
+    processes = [
+        subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.multiprocess', '--child',
+             str(worker), str(workers), api_url],
+            env=env, stdout=subprocess.PIPE, text=True)
+        for worker in range(workers)
+    ]
+    try:
+        for process in processes:
+            process.stdout.readline()
+
+        started = time.perf_counter()
+        queue.push(updates)
+        while queue.depth():
+            time.sleep(0.01)
+        return len(updates) / (time.perf_counter() - started)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='задержка ответа фейкового API, сек')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        worker, workers, api_url = args.child
+        child(int(worker), int(workers), api_url)
+        return
+
+    from migrations import run_migrations
+    from models import UserManager
+
+    run_migrations()
+    UserManager.insert_many(
+        [{'user_id': 1000 + i, 'user_name': f'manager{i}'}
+         for i in range(args.chats)]).execute()
+    queue = UpdateQueue()
+
+    print(f'{args.updates} обновлений, {args.chats} чатов, '
+          f'задержка API {args.latency * 1000:.0f} мс, '
+          f'ядер: {os.cpu_count()}')
+    with FakeBotApi(latency=args.latency) as api:
+        base = None
+        for workers in args.workers:
+            rate = measure(queue, workers,
+                           make_updates(args.updates, args.chats),
+                           api.url)
+            base = base or rate / workers
+            print(f'{workers:>3} процессов {rate:8.1f} обновлений/с '
+                  f'(x{rate / base:.1f})')
+
+
+if __name__ == '__main__':
+    main()
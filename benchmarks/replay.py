@@ -0,0 +1,259 @@
+"""
+Повтор сценариев бота через bot.process_new_updates на фейковом Bot API.
+
+Б/д заполняется задачами (--tasks, можно несколько размеров по
+возрастанию - задачи добавляются к уже созданным), затем каждый
+сценарий повторяется --rounds раз:
+
+    registration  /start, выбор роли и имя исполнителя и менеджера
+    create        новая задача, выбор исполнителя, фото и текст, отправка
+    accept        исполнитель принимает задачу
+    submit        исполнитель сдаёт задачу с фото
+    lists         списки задач менеджера и исполнителя с листанием
+    reports       отчёты менеджера и исполнителя за два года
+
+Списки и отчёты смотрят пользователи, у которых уже есть задачи из
+заполнения. Для каждого сценария выводятся обновлений в секунду, p50 и
+p99 времени обработки обновления и запросов к Bot API на обновление.
+--updates повторяет записанные обновления (JSON Update по строке).
+
+    python -m benchmarks.replay --tasks 10000 100000 1000000 --rounds 50
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import tempfile
+import time
+
+WORK_DIR = tempfile.mkdtemp(prefix='manager_bot_bench_')
+os.environ.setdefault('BOT_TOKEN', '1:benchmark')
+os.environ['DB_PATH'] = os.path.join(WORK_DIR, 'database.db')
+os.environ['LOG_DIR'] = WORK_DIR
+os.environ['METRICS_PORT'] = '0'
+os.environ.setdefault('OUTBOUND_GLOBAL_RATE', '1000000')
+os.environ.setdefault('OUTBOUND_CHAT_BURST', '1000000')
+os.chdir(WORK_DIR)
+
+from telebot import apihelper  # noqa: E402
+from telebot.custom_filters import StateFilter  # noqa: E402
+from telebot.types import Update  # noqa: E402
+
+import keyboards  # noqa: E402
+import report_cache  # noqa: E402
+from benchmarks.fake_api import FakeBotApi  # noqa: E402
+from benchmarks.updates import callback_update, message_update  # noqa: E402
+from handler_worker import bot  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from models import db, Task, UserManager, UserWorker  # noqa: E402
+from queries import rebuild_daily_stats  # noqa: E402
+
+SEED_MANAGERS = 50
+SEED_WORKERS = 500
+SEED_BATCH = 2000
+SEED_DAYS = 730
+STATUSES = ('process', 'work', 'finishing', 'finish')
+
+# Пользователи сценариев: новые на каждый повтор, после заполненных
+FIRST_ACTOR = 10_000_000
+
+
+def seed(total: int) -> None:
+    """Доводим число задач до total: случайные пары, статусы и даты"""
+    if not UserManager.select().exists():
+        UserManager.insert_many(
+            [{'user_id': 1 + i, 'user_name': f'manager{i}'}
+             for i in range(SEED_MANAGERS)]).execute()
+        UserWorker.insert_many(
+            [{'user_id': 1001 + i, 'user_name': f'worker{i}'}
+             for i in range(SEED_WORKERS)]).execute()
+
+    today = datetime.date.today()
+    rng = random.Random(total)
+    missing = total - Task.select().count()
+    while missing > 0:
+        rows = []
+        for _ in range(min(SEED_BATCH, missing)):
+            status = rng.choice(STATUSES)
+            start = today - datetime.timedelta(days=rng.randrange(SEED_DAYS))
+            rows.append({
+                'task_name': f'Задача {rng.randrange(10 ** 6)}',
+                'id_manager': 1 + rng.randrange(SEED_MANAGERS),
+                'id_worker': 1001 + rng.randrange(SEED_WORKERS),
+                'date_start': start if status != 'process' else None,
+                'date_finish': (start + datetime.timedelta(
+                    days=rng.randrange(30))) if status == 'finish' else None,
+                'status': status,
+            })
+        with db.atomic():
+            Task.insert_many(rows).execute()
+        missing -= len(rows)
+    rebuild_daily_stats()
+    report_cache.reports.clear()
+
+
+def photo(index: int) -> list:
+    return [{'file_id': f'photo{index}_{size}',
+             'file_unique_id': f'unique{index}_{size}',
+             'width': size, 'height': size}
+            for size in (90, 1280)]
+
+
+def period() -> tuple:
+    """Отчётный период: последние два года"""
+    right = datetime.date.today()
+    left = right - datetime.timedelta(days=SEED_DAYS)
+    text = f'{left.strftime("%d/%m/%Y")} - {right.strftime("%d/%m/%Y")}'
+    return text, left, right
+
+
+# Сценарий - генератор обновлений: следующее обновление строится после
+# обработки предыдущего и может зависеть от его результата
+
+def registration(manager: int, worker: int):
+    for user_id, role, name in ((worker, 'worker', 'Исполнитель'),
+                                (manager, 'manager', 'Менеджер')):
+        yield message_update(user_id, '/start')
+        yield callback_update(user_id, role)
+        yield message_update(user_id, f'{name} {user_id}')
+
+
+def create(manager: int, worker: int):
+    yield callback_update(manager, 'new_task')
+    yield message_update(manager, f'Задача для {worker}')
+    yield callback_update(manager, f'{keyboards.PICK_PREFIX}{worker}')
+    yield callback_update(manager, keyboards.PICK_DONE)
+    yield message_update(manager, caption='Макет', photo=photo(manager))
+    yield message_update(manager, 'Подробности задачи')
+    yield callback_update(manager, 'send')
+
+
+def accept(manager: int, worker: int):
+    task = Task.get((Task.id_worker == worker) & (Task.status == 'process'))
+    yield callback_update(worker, f'{keyboards.ACCEPT_PREFIX}{task.task_id}')
+
+
+def submit(manager: int, worker: int):
+    yield callback_update(worker, 'task_fin')
+    task = Task.get((Task.id_worker == worker) & (Task.status == 'work'))
+    yield callback_update(worker, task.task_id)
+    yield message_update(worker, caption='Готово', photo=photo(worker))
+    yield callback_update(worker, 'send_w')
+
+
+def lists(manager: int, worker: int):
+    text, left, right = period()
+    middle = Task.select().count() // 2
+    manager, worker = 1, 1001
+    yield callback_update(manager, 'menu')
+    yield callback_update(manager, 'task_list_manager')
+    yield callback_update(manager, 'all')
+    yield message_update(manager, text)
+    yield callback_update(manager, keyboards.page_data(
+        'all', f'n{middle}', (left.isoformat(), right.isoformat())))
+    yield callback_update(worker, 'menu_w')
+    yield callback_update(worker, 'task_list_worker')
+    yield callback_update(worker, 'status_w')
+    yield message_update(worker, text)
+    yield callback_update(worker, f'finish, {text}')
+
+
+def reports(manager: int, worker: int):
+    text = period()[0]
+    manager, worker = 1, 1001
+    yield callback_update(manager, 'menu')
+    yield callback_update(manager, 'report')
+    yield message_update(manager, text)
+    yield callback_update(worker, 'menu_w')
+    yield callback_update(worker, 'report_w')
+    yield message_update(worker, text)
+
+
+FLOWS = {
+    'registration': registration,
+    'create': create,
+    'accept': accept,
+    'submit': submit,
+    'lists': lists,
+    'reports': reports,
+}
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.timings = []
+        self.api_calls = 0
+
+    def run(self, api: FakeBotApi, update) -> None:
+        if isinstance(update, dict):
+            update = Update.de_json(update)
+        calls = sum(api.calls.values())
+        started = time.perf_counter()
+        bot.process_new_updates([update])
+        self.timings.append(time.perf_counter() - started)
+        self.api_calls += sum(api.calls.values()) - calls
+
+    def row(self, name: str) -> str:
+        timings = sorted(self.timings)
+        count = len(timings)
+        return (f'{name:<14}{count:>7} {count / sum(timings):>9.1f} '
+                f'{timings[count // 2] * 1000:>8.2f} '
+                f'{timings[min(count - 1, int(count * 0.99))] * 1000:>8.2f} '
+                f'{self.api_calls / count:>8.2f}')
+
+
+def run_flows(api: FakeBotApi, names: list, rounds: int,
+              actor: int) -> int:
+    stats = {name: Stats() for name in names}
+    for _ in range(rounds):
+        manager, worker = actor, actor + 1
+        actor += 2
+        for name in FLOWS:
+            flow = FLOWS[name](manager, worker)
+            # Сценарии вне выборки выполняем ради состояния, без замера
+            target = stats.get(name) or Stats()
+            for update in flow:
+                target.run(api, update)
+    for name in names:
+        print(stats[name].row(name))
+    return actor
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--tasks', type=int, nargs='+', default=[10000])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--flows', nargs='+', choices=list(FLOWS),
+                        default=list(FLOWS))
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='задержка ответа фейкового API, сек')
+    parser.add_argument('--updates', help='файл с записанными обновлениями')
+    args = parser.parse_args()
+
+    run_migrations()
+    bot.add_custom_filter(StateFilter(bot))
+    bot.threaded = False
+    actor = FIRST_ACTOR
+    with FakeBotApi(latency=args.latency) as api:
+        apihelper.API_URL = api.url
+        for total in args.tasks:
+            started = time.perf_counter()
+            seed(total)
+            print(f'\n{total} задач (заполнение '
+                  f'{time.perf_counter() - started:.1f} с), '
+                  f'задержка API {args.latency * 1000:.0f} мс')
+            print(f'{"сценарий":<14}{"обновл.":>7} {"обн./с":>9} '
+                  f'{"p50, мс":>8} {"p99, мс":>8} {"API/обн.":>8}')
+            actor = run_flows(api, args.flows, args.rounds, actor)
+            if args.updates:
+                stats = Stats()
+                with open(args.updates) as file:
+                    for line in file:
+                        if line.strip():
+                            stats.run(api, json.loads(line))
+                print(stats.row('recorded'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Задержка поиска задач по названию (search.py, FTS5).
+
+Заполняем б/д задачами (--tasks) со случайными названиями из словаря:
+менеджеров MANAGERS, исполнителей WORKERS. Для запросов разного вида
+(редкое слово, частое слово, начало слова, несколько слов) выводим
+p50 и p99 времени первой страницы search_tasks для случайных
+пользователей в роли менеджера и исполнителя.
+
+    python -m benchmarks.search --tasks 1000000
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import time
+
+WORK_DIR = tempfile.mkdtemp(prefix='manager_bot_bench_')
+os.environ.setdefault('BOT_TOKEN', '1:benchmark')
+os.environ['DB_PATH'] = os.path.join(WORK_DIR, 'database.db')
+os.environ['LOG_DIR'] = WORK_DIR
+os.environ['METRICS_PORT'] = '0'
+os.chdir(WORK_DIR)
+
+from migrations import run_migrations  # noqa: E402
+from models import db, Task, UserManager, UserWorker  # noqa: E402
+from search import index_tasks, search_tasks  # noqa: E402
+
+MANAGERS = 100
+WORKERS = 1000
+SEED_BATCH = 20000
+# Первые слова словаря встречаются в названиях чаще (закон Ципфа)
+WORDS = ('отчёт квартал договор клиент проверка склад поставка оплата '
+         'сверка счёт заявка ремонт монтаж закупка доставка аудит '
+         'презентация бюджет реклама сайт обучение инвентаризация '
+         'лицензия сервер резерв архив перевод налог касса маршрут').split()
+WEIGHTS = [1 / (rank + 1) for rank in range(len(WORDS))]
+QUERIES = {
+    'частое слово': 'отчёт',
+    'редкое слово': 'маршрут',
+    'начало слова': 'пре',
+    'два слова': 'договор клиент',
+    'три слова': 'сверка счёт оплата',
+    'нет совпадений': 'космодром',
+}
+
+
+def seed(total: int) -> None:
+    """Доводим число задач до total"""
+    if not UserManager.select().exists():
+        UserManager.insert_many(
+            [{'user_id': 1 + i, 'user_name': f'manager{i}'}
+             for i in range(MANAGERS)]).execute()
+        UserWorker.insert_many(
+            [{'user_id': 10001 + i, 'user_name': f'worker{i}'}
+             for i in range(WORKERS)]).execute()
+    today = datetime.date.today()
+    rng = random.Random(total)
+    missing = total - Task.select().count()
+    while missing > 0:
+        rows = []
+        for _ in range(min(SEED_BATCH, missing)):
+            words = rng.choices(WORDS, WEIGHTS, k=rng.randint(2, 4))
+            rows.append({
+                'task_name': ' '.join(words).capitalize(),
+                'id_manager': 1 + rng.randrange(MANAGERS),
+                'id_worker': 10001 + rng.randrange(WORKERS),
+                'date_start': today,
+                'status': 'work',
+            })
+        with db.atomic():
+            index_tasks([row.task_id for row in Task.insert_many(rows)
+                         .returning(Task.task_id).execute()])
+        missing -= len(rows)
+
+
+def measure(text: str, role: str, users: range, runs: int) -> tuple:
+    """p50 и p99 в мс и среднее число найденных на первой странице"""
+    rng = random.Random(text)
+    times, found = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        tasks, _ = search_tasks(text, rng.choice(users), [role])
+        times.append((time.perf_counter() - started) * 1000)
+        found.append(len(tasks))
+    quantiles = statistics.quantiles(times, n=100)
+    return quantiles[49], quantiles[98], statistics.mean(found)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--tasks', type=int, default=1000000)
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    run_migrations()
+    started = time.perf_counter()
+    seed(args.tasks)
+    print(f'{args.tasks} задач, заполнение '
+          f'{time.perf_counter() - started:.0f} с')
+    users = {
+        'manager': range(1, MANAGERS + 1),
+        'worker': range(10001, 10001 + WORKERS),
+    }
+    print(f'{"запрос":<16}{"роль":<9}{"p50, мс":>9}{"p99, мс":>9}'
+          f'{"найдено":>9}')
+    for name, text in QUERIES.items():
+        for role, ids in users.items():
+            p50, p99, found = measure(text, role, ids, args.runs)
+            print(f'{name:<16}{role:<9}{p50:>9.2f}{p99:>9.2f}'
+                  f'{found:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
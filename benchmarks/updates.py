@@ -0,0 +1,54 @@
+"""Синтетические обновления Telegram для бенчмарков"""
+import itertools
+import time
+
+from telebot.types import Update
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+def user_json(user_id: int) -> dict:
+    return {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+
+
+def message_json(user_id: int, text: str = None, **fields) -> dict:
+    message = {
+        'message_id': next(_message_ids),
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': user_json(user_id),
+    }
+    if text is not None:
+        message['text'] = text
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0,
+                                    'length': len(text.split()[0])}]
+    message.update(fields)
+    return message
+
+
+def message_update(user_id: int, text: str = None, **fields) -> dict:
+    """JSON обновления с сообщением пользователя"""
+    return {'update_id': next(_update_ids),
+            'message': message_json(user_id, text, **fields)}
+
+
+def callback_update(user_id: int, data) -> dict:
+    """JSON обновления с нажатием inline-кнопки"""
+    message = message_json(user_id, 'Выберите действие')
+    message['from'] = {'id': 1, 'is_bot': True, 'first_name': 'bot'}
+    return {
+        'update_id': next(_update_ids),
+        'callback_query': {
+            'id': str(next(_update_ids)),
+            'chat_instance': str(user_id),
+            'from': user_json(user_id),
+            'message': message,
+            'data': str(data),
+        },
+    }
+
+
+def parse(updates: list) -> list:
+    return [Update.de_json(update) for update in updates]
@@ -0,0 +1,60 @@
+"""
+Ограниченный кэш в памяти процесса: LRU с временем жизни записей.
+Попадания и промахи - в bot_cache_requests_total{cache,result}
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import Counter
+
+CACHE_REQUESTS = Counter(
+    'bot_cache_requests_total', 'Обращения к кэшам в памяти',
+    ['cache', 'result'])
+
+
+class TTLCache:
+    """
+    LRU на OrderedDict: ключ -> (значение, когда устареет). Поколение
+    ключа (и всего кэша - epoch) растёт при каждом сбросе: значение,
+    загруженное до сброса, в кэш не попадёт
+    """
+
+    def __init__(self, name: str, size: int, ttl: float) -> None:
+        self.name = name
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.epoch = 0
+
+    def get(self, key, load):
+        """Значение по ключу, при промахе - load() с сохранением"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.entries.move_to_end(key)
+                CACHE_REQUESTS.inc(self.name, 'hit')
+                return entry[0]
+            generation = (self.epoch, self.generations.get(key, 0))
+        CACHE_REQUESTS.inc(self.name, 'miss')
+        value = load()
+        with self.lock:
+            if (self.epoch, self.generations.get(key, 0)) == generation:
+                self.entries[key] = (value, now + self.ttl)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key) -> None:
+        with self.lock:
+            self.generations[key] = self.generations.get(key, 0) + 1
+            self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.epoch += 1
+            self.entries.clear()
@@ -0,0 +1,167 @@
+"""
+Пул обработчиков обновлений для потокового TeleBot.
+
+Обычный пул TeleBot берёт задачи из общей очереди, и два обновления
+одного пользователя (нажатие и следующее сообщение) могут обработаться
+в разных потоках в обратном порядке. Здесь обновления делятся на шарды
+по chat_id: у каждого шарда свой поток и своя очередь, поэтому обновления
+одного чата идут строго по порядку, а разные чаты - параллельно.
+
+Подключение: install(bot) до запуска polling/вебхука. Глубина очередей и
+задержки по шардам - ChatExecutor.stats().
+"""
+import contextvars
+import logging
+import queue
+import threading
+import time
+
+from telebot import TeleBot
+
+from config import UPDATE_WORKERS
+from log_pipeline import log_scope
+
+logger = logging.getLogger('manager_bot_logger')
+
+
+def chat_key(obj):
+    """chat_id сообщения, нажатия кнопки и других частей обновления"""
+    chat = getattr(obj, 'chat', None)
+    if chat is not None:
+        return chat.id
+    message = getattr(obj, 'message', None)
+    if getattr(message, 'chat', None) is not None:
+        return message.chat.id
+    user = getattr(obj, 'from_user', None)
+    if user is not None:
+        return user.id
+    return None
+
+
+class Shard(threading.Thread):
+    """Поток, который по порядку выполняет задачи своих чатов"""
+
+    def __init__(self, number: int, on_exception) -> None:
+        super().__init__(name=f'ChatShard-{number}', daemon=True)
+        self.tasks = queue.Queue()
+        self.on_exception = on_exception
+        self.processed = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.busy_seconds = 0.0
+        self.max_latency_seconds = 0.0
+
+    def put(self, func, args, kwargs) -> None:
+        # Контекст журнала (update_id) переходит в поток шарда
+        self.tasks.put((func, args, kwargs, contextvars.copy_context(),
+                        time.monotonic()))
+
+    def run(self) -> None:
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            func, args, kwargs, context, enqueued = task
+            started = time.monotonic()
+            try:
+                context.run(func, *args, **kwargs)
+            except Exception as e:
+                self.on_exception(e)
+            finished = time.monotonic()
+
+            self.processed += 1
+            self.wait_seconds += started - enqueued
+            self.max_wait_seconds = max(self.max_wait_seconds,
+                                        started - enqueued)
+            self.busy_seconds += finished - started
+            self.max_latency_seconds = max(self.max_latency_seconds,
+                                           finished - enqueued)
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': self.tasks.qsize(),
+            'processed': self.processed,
+            'wait_seconds': self.wait_seconds,
+            'max_wait_seconds': self.max_wait_seconds,
+            'busy_seconds': self.busy_seconds,
+            'max_latency_seconds': self.max_latency_seconds,
+        }
+
+
+class ChatExecutor:
+    """
+    Замена util.ThreadPool для TeleBot: тот же интерфейс (put,
+    raise_exceptions, clear_exceptions, close), но с шардами по chat_id
+    """
+
+    def __init__(self, telebot: TeleBot, workers: int = UPDATE_WORKERS):
+        self.telebot = telebot
+        self.exception_event = threading.Event()
+        self.exception_info = None
+        self.shards = [Shard(number, self.on_exception)
+                       for number in range(workers)]
+        for shard in self.shards:
+            shard.start()
+
+    def shard(self, chat_id) -> Shard:
+        if chat_id is None:
+            return self.shards[0]
+        return self.shards[hash(chat_id) % len(self.shards)]
+
+    def put(self, func, *args, **kwargs) -> None:
+        chat_id = chat_key(args[0]) if args else None
+        self.shard(chat_id).put(func, args, kwargs)
+
+    def on_exception(self, exception: Exception) -> None:
+        logger.error(f'Ошибка: {exception}')
+        handled = False
+        if self.telebot.exception_handler is not None:
+            handled = self.telebot.exception_handler.handle(exception)
+        if not handled:
+            self.exception_info = exception
+            self.exception_event.set()
+
+    def raise_exceptions(self) -> None:
+        if self.exception_event.is_set():
+            raise self.exception_info
+
+    def clear_exceptions(self) -> None:
+        self.exception_event.clear()
+
+    def close(self) -> None:
+        """Дожидаемся обработки очередей и останавливаем потоки"""
+        for shard in self.shards:
+            shard.tasks.put(None)
+        for shard in self.shards:
+            if shard is not threading.current_thread():
+                shard.join()
+
+    def stats(self) -> dict:
+        """Глубина очередей и задержки: всего и по каждому шарду"""
+        shards = [shard.stats() for shard in self.shards]
+        return {
+            'queue_depth': sum(shard['queue_depth'] for shard in shards),
+            'processed': sum(shard['processed'] for shard in shards),
+            'shards': shards,
+        }
+
+
+def install(bot: TeleBot, workers: int = UPDATE_WORKERS) -> ChatExecutor:
+    """Переводим потоковый TeleBot на шардированный пул"""
+    executor = ChatExecutor(bot, workers)
+    if bot.worker_pool is not None:
+        bot.worker_pool.close()
+    bot.threaded = True
+    bot.worker_pool = executor
+
+    process_new_updates = bot.process_new_updates
+
+    def process_in_order(updates: list) -> None:
+        # TeleBot разбирает пачку по типам: сначала все сообщения, потом
+        # все нажатия. По одному обновлению сохраняем порядок в чате
+        for update in updates:
+            with log_scope(update_id=update.update_id):
+                process_new_updates([update])
+
+    bot.process_new_updates = process_in_order
+    return executor
@@ -0,0 +1,78 @@
+"""
+Подключение к б/д по DB_URL.
+
+sqlite+pool:///путь - пул соединений SQLite с настройками для
+многопоточного бота: WAL (чтение не ждёт запись), busy_timeout,
+mmap и увеличенный кэш страниц. sqlite:///путь - те же настройки
+без пула. postgres+pool://... - PooledPostgresqlExtDatabase, драйвер
+psycopg2 (psycopg2-binary в requirements.txt): Ext-версия умеет
+читать курсором на сервере (выгрузка в export.py).
+
+Обработчики получают соединение на время одного обновления через
+DatabaseMiddleware и возвращают его в пул после обработки.
+"""
+from peewee import Database, SqliteDatabase
+from playhouse.db_url import connect
+from telebot.handler_backends import BaseMiddleware
+
+from config import (
+    DB_URL,
+    DB_MAX_CONNECTIONS,
+    DB_STALE_TIMEOUT,
+    DB_POOL_TIMEOUT,
+)
+
+# Postgres подключаем как PostgresqlExtDatabase
+POSTGRES_SCHEMES = {
+    'postgres': 'postgresext',
+    'postgresql': 'postgresqlext',
+}
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,  # мс
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # в КиБ, 64 МиБ на соединение
+}
+
+
+def connect_database(url: str = DB_URL) -> Database:
+    """Б/д по адресу вида sqlite+pool:///data/database.db"""
+    scheme, _, rest = url.partition('://')
+    name, plus, pool = scheme.partition('+')
+    if name in POSTGRES_SCHEMES:
+        url = f'{POSTGRES_SCHEMES[name]}{plus}{pool}://{rest}'
+    options = {}
+    if url.startswith('sqlite'):
+        options['pragmas'] = SQLITE_PRAGMAS
+    if '+pool' in url.split('://')[0]:
+        options.update(max_connections=DB_MAX_CONNECTIONS,
+                       stale_timeout=DB_STALE_TIMEOUT,
+                       timeout=DB_POOL_TIMEOUT)
+        if url.startswith('sqlite'):
+            # Соединение из пула достаётся потоку, который его не создавал
+            options['check_same_thread'] = False
+    return connect(url, **options)
+
+
+def is_sqlite(database: Database) -> bool:
+    # models.db - DatabaseProxy, смотрим на б/д за ним
+    return isinstance(getattr(database, 'obj', database), SqliteDatabase)
+
+
+class DatabaseMiddleware(BaseMiddleware):
+    """Соединение с б/д открывается на обновление и закрывается после"""
+
+    def __init__(self, database: Database) -> None:
+        super().__init__()
+        self.database = database
+        self.update_sensitive = False
+        self.update_types = ['message', 'edited_message', 'callback_query']
+
+    def pre_process(self, message, data) -> None:
+        self.database.connect(reuse_if_open=True)
+
+    def post_process(self, message, data, exception) -> None:
+        if not self.database.is_closed():
+            self.database.close()
@@ -0,0 +1,141 @@
+"""
+Выгрузка задач менеджера за период в CSV или XLSX.
+
+Строки читаются курсором без создания моделей и пишутся в
+SpooledTemporaryFile: до EXPORT_SPOOL_BYTES файл лежит в памяти, дальше -
+на диске, поэтому память не растёт с числом задач. SQLite отдаёт строки
+курсора по одной (.iterator()); psycopg2 обычным курсором получает весь
+результат сразу, поэтому на Postgres строки читаются именованным
+курсором на сервере (ServerSide) пачками.
+Файл собирается в отдельном потоке (EXPORT_WORKERS), а не в потоке
+обработчика, и отправляется через send_document.
+
+XLSX пишется через openpyxl (pip install openpyxl), без него
+выгрузка доступна только в CSV.
+"""
+import contextvars
+import csv
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+from tempfile import SpooledTemporaryFile
+
+from peewee import JOIN
+from playhouse.postgres_ext import PostgresqlExtDatabase, ServerSide
+from telebot import TeleBot
+
+from config import EXPORT_WORKERS, EXPORT_SPOOL_BYTES, EXPORT_MAX_BYTES
+from models import db, Task, UserWorker
+from queries import format_date, tasks_in_range
+
+logger = logging.getLogger('manager_bot_logger')
+
+HEADER = ('ID', 'Задача', 'Исполнитель', 'Статус', 'Дата начала',
+          'Дата завершения')
+STATUSES = {
+    'process': 'Создаётся',
+    'work': 'В работе',
+    'finishing': 'Сдаётся',
+    'finish': 'Завершена',
+}
+
+executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS,
+                              thread_name_prefix='Export')
+
+
+def export_rows(manager_id: int, left_date, right_date):
+    """Задачи менеджера за период кортежами, по одной строке из курсора"""
+    query = (tasks_in_range(left_date, right_date, id_manager=manager_id)
+             .select(Task.task_id, Task.task_name, UserWorker.user_name,
+                     Task.status, Task.date_start, Task.date_finish)
+             .join_from(Task, UserWorker, JOIN.LEFT_OUTER)
+             .tuples())
+    if isinstance(db.obj, PostgresqlExtDatabase):
+        rows = ServerSide(query)
+    else:
+        rows = query.iterator()
+    for task_id, name, worker, status, date_start, date_finish in rows:
+        yield (task_id, name, worker, STATUSES.get(status, status),
+               date_start, date_finish)
+
+
+def write_csv(rows, file) -> None:
+    # utf-8-sig и ';' - чтобы Excel с русской локалью открыл файл сразу
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text, delimiter=';')
+    writer.writerow(HEADER)
+    for row in rows:
+        writer.writerow(row[:4] + (format_date(row[4]),
+                                   format_date(row[5])))
+    text.flush()
+    text.detach()
+
+
+def write_xlsx(rows, file) -> None:
+    from openpyxl import Workbook
+
+    # write_only: строки сразу уходят во временный файл книги
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Задачи')
+    sheet.append(HEADER)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(file)
+
+
+# Формат: (запись в файл, расширение)
+FORMATS = {
+    'csv': (write_csv, 'csv'),
+    'xlsx': (write_xlsx, 'xlsx'),
+}
+
+
+def available_formats() -> list:
+    if find_spec('openpyxl') is None:
+        return ['csv']
+    return list(FORMATS)
+
+
+def build_file(fmt: str, manager_id: int, left_date,
+               right_date) -> SpooledTemporaryFile:
+    """Файл выгрузки, готовый к чтению с начала"""
+    write, _ = FORMATS[fmt]
+    file = SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    # Курсор на сервере живёт только внутри транзакции
+    with db.connection_context(), db.atomic():
+        write(export_rows(manager_id, left_date, right_date), file)
+    file.seek(0)
+    return file
+
+
+def send_export(bot: TeleBot, chat_id: int, fmt: str, left_date,
+                right_date) -> None:
+    try:
+        with build_file(fmt, chat_id, left_date, right_date) as file:
+            size = file.seek(0, io.SEEK_END)
+            if size > EXPORT_MAX_BYTES:
+                bot.send_message(chat_id,
+                                 '❌ Файл слишком большой для Telegram.\n'
+                                 'Выберите период короче')
+                return
+            file.seek(0)
+            bot.send_document(
+                chat_id, file,
+                caption=f'📤 Задачи в период:\n{format_date(left_date)}'
+                        f' - {format_date(right_date)}',
+                visible_file_name=f'tasks_{left_date.isoformat()}_'
+                                  f'{right_date.isoformat()}.'
+                                  f'{FORMATS[fmt][1]}')
+        logger.info(f'Выгрузка {fmt} отправлена, {size} байт')
+    except Exception as e:
+        logger.error(f'Ошибка выгрузки: {e}')
+        bot.send_message(chat_id, '❌ Не удалось выгрузить задачи')
+
+
+def submit(bot: TeleBot, chat_id: int, fmt: str, left_date,
+           right_date) -> None:
+    """Собираем и отправляем выгрузку в фоновом потоке"""
+    context = contextvars.copy_context()
+    executor.submit(context.run, send_export, bot, chat_id, fmt,
+                    left_date, right_date)
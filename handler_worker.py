@@ -6,64 +6,83 @@ from telebot.types import (
     InlineKeyboardButton,
 )
 from peewee import IntegrityError, State
-from models import UserWorker, UserManager, Task
-from telebot import StateMemoryStorage, TeleBot
+from models import (
+    db,
+    UserWorker,
+    UserManager,
+    Task,
+    TaskDailyStats,
+)
+from queries import (
+    parse_borders,
+    format_date,
+    tasks_in_range,
+    task_page,
+    PAGE_SIZE,
+    touch_tasks,
+    count_day,
+    save_attachments,
+    task_attachments,
+)
+from telebot import TeleBot
 from states import UserState
+from state_storage import create_state_storage
+from database import DatabaseMiddleware
+from chat_executor import install as install_chat_executor
+from outbound import bulk, fan_out, install as install_outbound
+from albums import AlbumBuffer, send_attachments, send_stored
+from log_pipeline import handler_scope, setup_logging
+import metrics
+import keyboards
+import user_directory
+import task_cards
+import report_cache
+import export
+from search import index_tasks, search_tasks
 from telebot.types import Message
 import logging
 
 
-state_storage = StateMemoryStorage()
-bot = TeleBot(BOT_TOKEN, state_storage=state_storage)
+state_storage = create_state_storage()
+bot = TeleBot(BOT_TOKEN, state_storage=state_storage,
+              use_class_middlewares=True)
+bot.setup_middleware(DatabaseMiddleware(db))
+chat_executor = install_chat_executor(bot)
+install_outbound()
+metrics.install(db.obj, chat_executor)
+album_buffer = AlbumBuffer(submit=chat_executor.put)
 
 
 logger = logging.getLogger('manager_bot_logger')
-logger.setLevel(logging.DEBUG)
-
-info_handler = logging.FileHandler('info.log')
-info_handler.setLevel(logging.INFO)
-
-error_handler = logging.FileHandler('errors.log')
-error_handler.setLevel(logging.ERROR)
-
-formatter = logging.Formatter(
-    '%(asctime)s - %(levelname)s - %(message)s - %(filename)s'
-    ' - Line: %(lineno)d', '%H:%M')
-info_handler.setFormatter(formatter)
-error_handler.setFormatter(formatter)
-
-
-class InfoFilter(logging.Filter):
-    def filter(self, record):
-        return record.levelno < logging.ERROR
-
-
-info_handler.addFilter(InfoFilter())
-
-logger.addHandler(info_handler)
-logger.addHandler(error_handler)
+setup_logging()
 
 
 def error_handler(func):
-    def wrapper(message: Message):
-        try:
-            return func(message)
-        except Exception as e:
-            logger.error(f'Ошибка: {e}')
-            bot.reply_to(message, 'Что-то пошло не так.\n '
-                                  'Попробуйте перезапустить с помощью /start.')
+    def wrapper(message: Message, *args):
+        with handler_scope(func.__name__, message.chat.id), \
+                metrics.observe_handler(func.__name__):
+            try:
+                return func(message, *args)
+            except Exception as e:
+                logger.error(f'Ошибка: {e}')
+                bot.reply_to(message,
+                             'Что-то пошло не так.\n '
+                             'Попробуйте перезапустить с помощью /start.')
     return wrapper
 
 
 def error_handler_callback(func):
     def wrapper(callback):
-        try:
-            return func(callback)
-        except Exception as e:
-            logger.error(f'Ошибка: {e}')
-            bot.send_message(callback.from_user.id,
-                             'Что-то пошло не так.'
-                             '\nПопробуйте перезапустить с помощью /start.')
+        with handler_scope(func.__name__, callback.from_user.id), \
+                metrics.observe_handler(func.__name__):
+            try:
+                return func(callback)
+            except Exception as e:
+                logger.error(f'Ошибка: {e}')
+                bot.send_message(
+                    callback.from_user.id,
+                    'Что-то пошло не так.'
+                    '\nПопробуйте перезапустить с помощью /start.')
     return wrapper
 
 
@@ -80,6 +99,76 @@ def handle_start(message: Message) -> None:
     bot.set_state(message.from_user.id, UserState.choose_role)
 
 
+def user_roles(user_id: int) -> list:
+    """Роли, в которых пользователь зарегистрирован"""
+    return [role for role in ['manager', 'worker']
+            if user_directory.user_name(role, user_id) is not None]
+
+
+def search_markup(user_id: int, text: str, page: int = 0):
+    """Страница результатов поиска. None - ничего не нашлось"""
+    roles = user_roles(user_id)
+    tasks, has_next = search_tasks(text, user_id, roles, page=page)
+    if not tasks:
+        return None
+    back_button = (keyboards.MENU_BUTTON if 'manager' in roles
+                   else keyboards.MENU_W_BUTTON)
+    return keyboards.search_page(
+        [(task_id, task_name) for task_id, task_name, _ in tasks],
+        page, has_next, back_button)
+
+
+def send_search_results(chat_id: int, text: str) -> None:
+    if not user_roles(chat_id):
+        bot.send_message(chat_id, 'Сначала зарегистрируйтесь: /start')
+        return
+    bot.add_data(chat_id, search=text)
+    markup = search_markup(chat_id, text)
+    if markup is None:
+        bot.send_message(chat_id, '❌ Ничего не нашлось.\n'
+                                  'Напишите другие слова из названия')
+        return
+    bot.send_message(chat_id, '🔎 Найденные задачи:\n'
+                              'Выберите, про какую прислать информацию',
+                     reply_markup=markup)
+
+
+@bot.message_handler(commands=['search'])
+@error_handler
+def handle_search(message: Message) -> None:
+    """
+    Поиск задач: /search слова или слова следующим сообщением. Начатый
+    диалог (создание задачи, отчёт) продолжается после поиска
+    """
+
+    logger.info(f'Команда /search от пользователя: {message.from_user.id}')
+    text = message.text.partition(' ')[2]
+    if text.strip():
+        send_search_results(message.chat.id, text)
+        return
+    previous = bot.get_state(message.chat.id)
+    if previous != UserState.search_query.name:
+        bot.set_state(message.chat.id, UserState.search_query)
+        bot.add_data(message.chat.id, search_return=previous)
+    bot.send_message(message.chat.id,
+                     '🔎 Напишите слова из названия задачи')
+
+
+@bot.message_handler(state=UserState.search_query)
+@error_handler
+def handle_search_query(message: Message) -> None:
+    """Ищем задачи по словам из сообщения и возвращаемся в диалог"""
+
+    logger.info('Ищем задачи по словам из сообщения')
+    send_search_results(message.chat.id, message.text or '')
+    with bot.retrieve_data(message.chat.id) as data:
+        previous = data.pop('search_return', None)
+    if previous is None:
+        bot.delete_state(message.chat.id)
+    else:
+        bot.set_state(message.chat.id, previous)
+
+
 @bot.callback_query_handler(
     func=lambda callback: callback.data in ['menu'])
 @error_handler_callback
@@ -94,22 +183,178 @@ def handler_back_to_manager_menu(callback) -> None:
     handle_manager_to_do(callback.message)
 
 
-def gen_buttons_role():
-    """Создаём кнопки дял выбора роли."""
-    logger.debug('Генерация кнопок для выбора роли')
-    manager = InlineKeyboardButton(
-        text='🧑Менеджер ',
-        callback_data='manager',
+# Подписи статусов в списках задач
+MANAGER_LIST_STATUSES = {
+    'work': 'В работе у исполнителя',
+    'finish': 'Завершена',
+    'process': 'Вы создаёте работу',
+}
+WORKER_LIST_STATUSES = {
+    'work': 'В работе(у вас)',
+    'finish': 'Завершена',
+    'process': 'Менеджер создаёт работу',
+}
+# Куда возвращает кнопка под списком
+TASK_LIST_BACK = {
+    'all': keyboards.MENU_BUTTON,
+    'status': keyboards.MENU_BUTTON,
+    'all_w': keyboards.MENU_W_BUTTON,
+    'status_w': keyboards.MENU_W_BUTTON,
+    'mgr': keyboards.MENU_W_BUTTON,
+    'fin': None,
+}
+
+
+def task_list_query(kind: str, user_id: int, args: list):
+    """Запрос списка задач по его виду и параметрам из callback_data"""
+    if kind in ['all', 'all_w', 'status', 'status_w']:
+        left_date = datetime.date.fromisoformat(args[0])
+        right_date = datetime.date.fromisoformat(args[1])
+        status = args[2] if kind in ['status', 'status_w'] else None
+        return tasks_in_range(left_date, right_date, status=status)
+    if kind == 'fin':
+        return Task.select().where((Task.status == 'work') &
+                                   (Task.id_worker == user_id))
+    if kind == 'mgr':
+        return Task.select().where((Task.id_worker == user_id) &
+                                   (Task.id_manager == args[0]))
+    raise ValueError(f'Неизвестный список задач: {kind}')
+
+
+def task_list_button_text(kind: str, task: Task) -> str:
+    if kind == 'fin':
+        return task.task_name
+    if kind in ['status', 'status_w']:
+        return f'"{task.task_name}"'
+    statuses = WORKER_LIST_STATUSES
+    if kind == 'all':
+        statuses = MANAGER_LIST_STATUSES
+    status = statuses.get(task.status, 'Неизвестный статус')
+    return f'"{task.task_name}". {status}'
+
+
+def task_list_markup(kind: str, user_id: int, args: list,
+                     after=None, before=None):
+    """
+    Страница списка задач: один запрос по индексу при любом числе задач.
+    None - в списке нет задач
+    """
+    tasks, has_prev, has_next = task_page(
+        task_list_query(kind, user_id, args), after=after, before=before)
+    if not tasks:
+        if after is None and before is None:
+            return None
+        # Задачи страницы пропали, пока список был открыт
+        return task_list_markup(kind, user_id, args)
+    return keyboards.task_page(
+        [(task_list_button_text(kind, task), task.task_id) for task in tasks],
+        kind, args, has_prev, has_next,
+        first_id=tasks[0].task_id, last_id=tasks[-1].task_id,
+        back_button=TASK_LIST_BACK[kind],
     )
-    worker = InlineKeyboardButton(
-        text='🧑‍💻Исполнитель',
-        callback_data='worker',
+
+
+@bot.callback_query_handler(
+    func=lambda callback: (callback.data or '').startswith(
+        keyboards.PAGE_PREFIX))
+@error_handler_callback
+def handle_task_list_page(callback) -> None:
+    """Листаем список задач, редактируя сообщение со списком"""
+
+    logger.info(f'Листание списка задач: {callback.data}')
+
+    kind, after, before, args = keyboards.parse_page_data(callback.data)
+    bot.edit_message_reply_markup(
+        chat_id=callback.message.chat.id,
+        message_id=callback.message.message_id,
+        reply_markup=task_list_markup(kind, callback.from_user.id, args,
+                                      after=after, before=before)
+    )
+
+
+@bot.callback_query_handler(
+    func=lambda callback: (callback.data or '').startswith(
+        keyboards.FILES_PREFIX))
+@error_handler_callback
+def handle_task_files(callback) -> None:
+    """Отправляем сохранённые вложения задачи менеджеру или исполнителю"""
+
+    logger.info(f'Вложения задачи: {callback.data}')
+
+    task = Task.get_or_none(
+        Task.task_id == int(callback.data[len(keyboards.FILES_PREFIX):]))
+    user_id = callback.from_user.id
+    if task is None or user_id not in (task.id_manager, task.id_worker):
+        bot.answer_callback_query(callback.id, 'Задача не найдена')
+        return
+    bot.answer_callback_query(callback.id)
+    send_stored(bot, user_id, task_attachments(task.task_id))
+
+
+@bot.callback_query_handler(
+    func=lambda callback: (callback.data or '').startswith(
+        keyboards.EXPORT_PREFIX))
+@error_handler_callback
+def handle_export(callback) -> None:
+    """Собираем файл выгрузки в фоне и возвращаемся в меню"""
+
+    logger.info(f'Выгрузка задач: {callback.data}')
+
+    fmt, left, right = keyboards.parse_export_data(callback.data)
+    bot.answer_callback_query(callback.id, '⏳ Готовим файл')
+    bot.edit_message_reply_markup(
+        chat_id=callback.message.chat.id,
+        message_id=callback.message.message_id
+    )
+    export.submit(bot, callback.from_user.id, fmt,
+                  datetime.date.fromisoformat(left),
+                  datetime.date.fromisoformat(right))
+    handle_manager_to_do(callback.message)
+
+
+@bot.callback_query_handler(
+    func=lambda callback: (callback.data or '').startswith(
+        keyboards.SEARCH_PREFIX))
+@error_handler_callback
+def handle_search_page(callback) -> None:
+    """Листаем результаты поиска, редактируя сообщение с ними"""
+
+    logger.info(f'Листание поиска: {callback.data}')
+
+    page = int(callback.data[len(keyboards.SEARCH_PREFIX):])
+    with bot.retrieve_data(callback.from_user.id) as data:
+        text = (data or {}).get('search', '')
+    bot.edit_message_reply_markup(
+        chat_id=callback.message.chat.id,
+        message_id=callback.message.message_id,
+        reply_markup=search_markup(callback.from_user.id, text, page)
     )
 
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(manager)
-    keyboard.add(worker)
-    return keyboard
+
+@bot.callback_query_handler(
+    func=lambda callback: (callback.data or '').startswith(
+        keyboards.FOUND_PREFIX))
+@error_handler_callback
+def handle_found_task(callback) -> None:
+    """Карточка найденной задачи в роли пользователя в этой задаче"""
+
+    logger.info(f'Карточка найденной задачи: {callback.data}')
+
+    task = Task.get_or_none(
+        Task.task_id == int(callback.data[len(keyboards.FOUND_PREFIX):]))
+    user_id = callback.from_user.id
+    if task is None or user_id not in (task.id_manager, task.id_worker):
+        bot.answer_callback_query(callback.id, 'Задача не найдена')
+        return
+    role = 'manager' if task.id_manager == user_id else 'worker'
+    text, markup = task_cards.card(task.task_id, role)
+    bot.answer_callback_query(callback.id)
+    bot.send_message(user_id, text, reply_markup=markup)
+
+
+def gen_buttons_role():
+    """Кнопки для выбора роли."""
+    return keyboards.ROLE
 
 
 @bot.callback_query_handler(state=UserState.choose_role,
@@ -140,13 +385,14 @@ def handle_data(message: Message) -> None:
     user_name = message.text
 
     try:
-        user = UserManager.get_or_none(UserManager.user_id == user_id)
-        if user is None:
+        known_name = user_directory.user_name('manager', user_id)
+        if known_name is None:
             UserManager.create(
                 user_id=user_id,
                 user_name=user_name,
                 id_task=0
             )
+            user_directory.invalidate('manager', user_id)
             bot.send_message(
                 message.chat.id,
                 'Регистрация прошла успешно!',
@@ -155,7 +401,7 @@ def handle_data(message: Message) -> None:
         else:
             bot.reply_to(
                 message,
-                f'Рад вас снова видеть, {user.user_name}!',
+                f'Рад вас снова видеть, {known_name}!',
                 reply_markup=ReplyKeyboardRemove()
             )
         bot.set_state(message.chat.id, UserState.to_do_manager)
@@ -181,24 +427,7 @@ def handle_manager_to_do(message: Message) -> None:
 
 def gen_buttons_manager_to_do():
     """Функция кнопок выбора действия для менеджера"""
-    new_task = InlineKeyboardButton(
-        text='💡Назначить работу',
-        callback_data='new_task',
-    )
-    task_list = InlineKeyboardButton(
-        text='📑Смотреть список работ',
-        callback_data='task_list_manager',
-    )
-    report = InlineKeyboardButton(
-        text='📊Смотреть отчет',
-        callback_data='report',
-    )
-
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(new_task)
-    keyboard.add(task_list)
-    keyboard.add(report)
-    return keyboard
+    return keyboards.MANAGER_TO_DO
 
 
 @bot.callback_query_handler(
@@ -224,55 +453,149 @@ def handler_new_task_name(callback) -> None:
 @bot.message_handler(state=UserState.task_name)
 @error_handler
 def handler_info_for_task(message: Message) -> None:
-    """Создаём задачу в б/д. Узнаем информацию для задачи"""
+    """Запоминаем название задачи. Предлагаем выбрать исполнителей"""
 
-    logger.info('Создаём задачу в б/д. Узнаем информацию для задачи')
-    new_task_name = message.text
-    manager_id = message.chat.id
-    worker = UserWorker.get()
-    Task.create(
-        task_name=new_task_name,
-        id_worker=worker.user_id,
-        id_manager=manager_id,
-        date_start='',
-        date_finish='',
-        status='process'
-    )
+    logger.info('Запоминаем название задачи. Предлагаем выбрать исполнителей')
+    bot.set_state(message.chat.id, UserState.choose_workers)
+    bot.add_data(message.chat.id, task_name=message.text, workers=[],
+                 picker_page=0)
     bot.send_message(message.chat.id,
+                     '🧑‍💻Выберите исполнителей задачи:',
+                     reply_markup=gen_buttons_workers([]))
+
+
+def gen_buttons_workers(selected, page: int = 0):
+    """Страница кнопок выбора исполнителей, выбранные отмечены"""
+    workers = user_directory.roster('worker')
+    # Исполнителей могло стать меньше, пока менеджер листал список
+    page = max(0, min(page, (len(workers) - 1) // PAGE_SIZE))
+    start = page * PAGE_SIZE
+    return keyboards.worker_picker(workers[start:start + PAGE_SIZE],
+                                   selected, page,
+                                   len(workers) > start + PAGE_SIZE)
+
+
+@bot.callback_query_handler(
+    state=UserState.choose_workers,
+    func=lambda callback: (callback.data or '').startswith(
+        keyboards.PICK_PREFIX))
+@error_handler_callback
+def handler_toggle_worker(callback) -> None:
+    """Отмечаем исполнителя задачи или снимаем отметку"""
+
+    logger.info(f'Выбор исполнителя: {callback.data}')
+    worker_id = int(callback.data[len(keyboards.PICK_PREFIX):])
+    with bot.retrieve_data(callback.from_user.id) as data:
+        selected = data['workers']
+        if worker_id in selected:
+            selected.remove(worker_id)
+        else:
+            selected.append(worker_id)
+        data['workers'] = selected
+        page = data.get('picker_page', 0)
+    bot.edit_message_reply_markup(
+        chat_id=callback.message.chat.id,
+        message_id=callback.message.message_id,
+        reply_markup=gen_buttons_workers(selected, page)
+    )
+
+
+@bot.callback_query_handler(
+    state=UserState.choose_workers,
+    func=lambda callback: (callback.data or '').startswith(
+        keyboards.PICK_PAGE_PREFIX))
+@error_handler_callback
+def handler_picker_page(callback) -> None:
+    """Листаем список исполнителей, редактируя сообщение с ним"""
+
+    logger.info(f'Листание исполнителей: {callback.data}')
+    page = int(callback.data[len(keyboards.PICK_PAGE_PREFIX):])
+    with bot.retrieve_data(callback.from_user.id) as data:
+        data['picker_page'] = page
+        selected = data['workers']
+    bot.edit_message_reply_markup(
+        chat_id=callback.message.chat.id,
+        message_id=callback.message.message_id,
+        reply_markup=gen_buttons_workers(selected, page)
+    )
+
+
+@bot.callback_query_handler(
+    state=UserState.choose_workers,
+    func=lambda callback: callback.data in [keyboards.PICK_DONE])
+@error_handler_callback
+def handler_create_tasks(callback) -> None:
+    """Создаём задачу каждому выбранному исполнителю одной транзакцией"""
+
+    logger.info('Создаём задачи выбранным исполнителям')
+    manager_id = callback.from_user.id
+    with bot.retrieve_data(manager_id) as data:
+        task_name = data['task_name']
+        workers = data['workers']
+    if not workers:
+        bot.send_message(manager_id, '❗️Выберите хотя бы одного исполнителя')
+        return
+
+    with db.atomic():
+        task_ids = [row.task_id for row in Task.insert_many([
+            {'task_name': task_name,
+             'id_worker': worker_id,
+             'id_manager': manager_id,
+             'date_start': None,
+             'date_finish': None,
+             'status': 'process'}
+            for worker_id in workers
+        ]).returning(Task.task_id).execute()]
+        index_tasks(task_ids)
+    bot.add_data(manager_id, task_ids=task_ids)
+    bot.edit_message_reply_markup(
+        chat_id=callback.message.chat.id,
+        message_id=callback.message.message_id
+    )
+    bot.send_message(manager_id,
                      "📋Добавьте файл/информацию к задаче:", )
-    bot.set_state(message.chat.id, UserState.forward_to_worker)
+    bot.set_state(manager_id, UserState.forward_to_worker)
+
+
+def task_assignees(manager_id: int) -> list:
+    """Исполнители задачи, которую сейчас назначает менеджер"""
+    with bot.retrieve_data(manager_id) as data:
+        return list(data.get('workers', []))
+
+
+def assigned_task_ids(manager_id: int) -> list:
+    """Задачи (по одной на исполнителя), которые сейчас назначает менеджер"""
+    with bot.retrieve_data(manager_id) as data:
+        return list(data.get('task_ids', []))
+
+
+def assigned_tasks(manager_id: int) -> list:
+    """Задачи из assigned_task_ids, которые исполнители ещё не приняли"""
+    return list(Task.select().where(
+        Task.task_id.in_(assigned_task_ids(manager_id)) &
+        (Task.id_manager == manager_id) &
+        (Task.status == 'process')))
+
 
 @bot.message_handler(state=UserState.forward_to_worker,
                      content_types=['photo', 'document', 'text'])
 @error_handler
 def forward_message_task_to_worker(message: Message) -> None:
-    """Получаем файл у менеджера и пересылаем его воркеру"""
-
-    logger.info('Получаем файл у менеджера и пересылаем его воркеру')
-    worker = UserWorker.get()
-    worker_id = worker.user_id
-    if message.content_type == 'document':
-        bot.send_document(worker_id, message.document.file_id)
-    elif message.content_type == 'photo':
-        bot.send_photo(worker_id, message.photo[0].file_id)
-    elif message.content_type == 'text':
-        bot.send_message(worker_id, message.text)
-    else:
-        bot.send_message(worker_id,
-                         'Произошла ошибка при пересылки сообщения')
-    markup = InlineKeyboardMarkup()
-    markup.add(InlineKeyboardButton(
-        text='Добавить ещё файл/информацию',
-        callback_data='send_more',
-    ))
-    markup.add(InlineKeyboardButton(
-        text='Отправить задачу исполнителю',
-        callback_data='send',
-    ))
-    bot.send_message(message.chat.id,
-                     'Выберите действие: ',
-                     reply_markup=markup)
-    return
+    """Получаем файл у менеджера и пересылаем его исполнителям"""
+
+    logger.info('Получаем файл у менеджера и пересылаем его исполнителям')
+    workers = task_assignees(message.chat.id)
+    save_attachments(assigned_task_ids(message.chat.id), message)
+
+    @error_handler
+    def forward_album_to_workers(message: Message, messages: list) -> None:
+        fan_out(lambda worker_id: send_attachments(bot, worker_id, messages),
+                workers)
+        bot.send_message(message.chat.id,
+                         'Выберите действие: ',
+                         reply_markup=keyboards.SEND_OR_MORE_TO_WORKER)
+
+    album_buffer.add(message, forward_album_to_workers)
 
 @bot.callback_query_handler(
     func=lambda callback: callback.data in ['send', 'send_more'])
@@ -280,7 +603,7 @@ def forward_message_task_to_worker(message: Message) -> None:
 def handler_send_or_send_more_to_worker(callback) -> None:
     """Отправляем задачу, либо получаем ещё файл"""
 
-    logger.info('')
+    logger.info(f'Менеджер выбрал: {callback.data}')
     if callback.data == 'send':
         bot.edit_message_reply_markup(
             chat_id=callback.message.chat.id,
@@ -304,34 +627,34 @@ def handler_send_or_send_more_to_worker(callback) -> None:
 def handle_new_task_send_to_worker(message: Message) -> None:
     """"""
 
-    logger.info('')
+    logger.info('Отправляем задачу исполнителю')
 
     manager_id = message.from_user.id
-    id_manager = Task.id_manager
-    status = Task.status
-    task = Task.get((id_manager == manager_id) &
-                    (status == 'process'))
-
-    manager = UserManager.get(UserManager.user_id == manager_id)
-    bot.send_message(task.id_worker,
-                     f'📩Новая задача "{task.task_name}"\n от: '
-                     f' {manager.user_name}!')
+    manager_name = user_directory.user_name('manager', manager_id)
+    with bulk():
+        fan_out(lambda task: bot.send_message(
+            task.id_worker,
+            f'📩Новая задача "{task.task_name}"\n от: '
+            f' {manager_name}!'), assigned_tasks(manager_id))
 
 @bot.message_handler(state=UserState.info_for_task_1)
 @error_handler
 def handle_new_task_send_to_worker(message: Message) -> None:
-    """Отправляем задачу воркеру"""
+    """Отправляем задачу исполнителям"""
 
-    logger.info('Отправляем задачу воркеру')
+    logger.info('Отправляем задачу исполнителям')
 
     manager_id = message.chat.id
-    task = Task.get((Task.id_manager == manager_id) &
-                    (Task.status == 'process'))
-    manager = UserManager.get(UserManager.user_id == manager_id)
+    with bot.retrieve_data(manager_id) as data:
+        task_name = data['task_name']
+        workers = data['workers']
+    manager_name = user_directory.user_name('manager', manager_id)
 
-    bot.send_message(task.id_worker,
-                     f'📩Новая задача "{task.task_name}"\n от: '
-                     f' {manager.user_name}!')
+    with bulk():
+        fan_out(lambda worker_id: bot.send_message(
+            worker_id,
+            f'📩Новая задача "{task_name}"\n от: '
+            f' {manager_name}!'), workers)
 
     bot.send_message(message.chat.id, '🚀Задача успешно отправлена!')
     handle_accept_question_to_worker(message)
@@ -346,25 +669,17 @@ def handle_accept_question_to_worker(message: Message) -> None:
 
     logger.info('Спрашиваем worker принять работу или нет.')
 
-    task = Task.get((Task.id_manager == message.chat.id) &
-                    (Task.status == 'process'))
-    bot.send_message(task.id_worker,
-                     'Принять работу?',
-                     reply_markup=gen_buttons_finish_or_stop())
+    with bulk():
+        fan_out(lambda task: bot.send_message(
+            task.id_worker,
+            'Принять работу?',
+            reply_markup=gen_buttons_finish_or_stop(task.task_id)),
+            assigned_tasks(message.chat.id))
 
 
-def gen_buttons_finish_or_stop():
+def gen_buttons_finish_or_stop(task_id: int):
     """Функция кнопки принять работу"""
-
-    logger.info('')
-    yes = InlineKeyboardButton(
-        text='✅',
-        callback_data='accept',
-    )
-
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(yes)
-    return keyboard
+    return keyboards.finish_or_stop(task_id)
 
 
 @bot.message_handler(state=UserState.worker_end_task)
@@ -374,12 +689,12 @@ def handle_accept_question_to_worker(message: Message) -> None:
 
     logger.info('Спрашиваем worker принять работу или нет')
 
-    id_manager = Task.id_manager
-    task = Task.get((id_manager == message.chat.id) &
-                    (Task.status == 'process'))
-    bot.send_message(task.id_worker,
-                     'Принять работу?',
-                     reply_markup=gen_buttons_finish_or_stop())
+    with bulk():
+        fan_out(lambda task: bot.send_message(
+            task.id_worker,
+            'Принять работу?',
+            reply_markup=gen_buttons_finish_or_stop(task.task_id)),
+            assigned_tasks(message.chat.id))
 
 
 @bot.callback_query_handler(
@@ -401,38 +716,11 @@ def handler_task_list_to_manager(callback) -> None:
 
 def gen_buttons_tip_of_tasks():
     """
-    Создаём кнопки дял выбора типа заданий
+    Кнопки для выбора типа заданий
     all - Все
     status - Работы в определённом статусе
-    time - Работы за временной промежуток
-    worker - Работы одного исполнителя
     """
-
-    logger.info('Создаём кнопки дял выбора типа заданий'
-    'all - Все'
-    'status - Работы в определённом статусе'
-    'time - Работы за временной промежуток'
-    'worker - Работы одного исполнителя')
-
-    all_tasks = InlineKeyboardButton(
-        text='Все задания',
-        callback_data='all',
-    )
-    status_task = InlineKeyboardButton(
-        text='В определённом статусе',
-        callback_data='status',
-    )
-    menu = InlineKeyboardButton(
-        text='Вернуться в меню',
-        callback_data='menu',
-    )
-
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(all_tasks)
-    keyboard.add(status_task)
-    keyboard.add(menu)
-
-    return keyboard
+    return keyboards.TIP_OF_TASKS
 
 
 @bot.callback_query_handler(state=UserState.chose_task_info_id_manager)
@@ -442,31 +730,8 @@ def handler_task_list_to_manager_send(callback) -> None:
 
     logger.info('Отправляем информацию конкретной задачи')
 
-    task = Task.get(Task.task_id == callback.data)
-    worker = UserWorker.get(task.id_worker == UserWorker.user_id)
-    date_finish = task.date_finish
-    status = task.status
-    date_start = task.date_start
-
-    if status == 'finishing':
-        status = 'Исполнитель завершает и вот-вот отправит задание'
-        date_finish = 'Работа не завершена'
-    elif status == 'process':
-        status = 'Исполнитель ещё не принял работу'
-        date_start = 'Работа не начата'
-        date_finish = 'Работа не завершена'
-    elif status == 'work':
-        status = 'Исполнитель работает над задачей'
-        date_finish = 'Работа не завершена'
-    elif status == 'finish':
-        status = 'Работа завершена'
-
-    bot.send_message(callback.from_user.id,
-                     f'Имя работы: \n{task.task_name}\n\n'
-                     f'🧑‍💻Исполнитель: \n{worker.user_name}\n\n'
-                     f'📆Дата начала работы: \n{date_start}\n\n'
-                     f'Статус: \n{status}\n\n'
-                     f'📆Дата завершения работы: \n{date_finish}')
+    text, markup = task_cards.card(callback.data, 'manager')
+    bot.send_message(callback.from_user.id, text, reply_markup=markup)
 
     bot.edit_message_reply_markup(
         chat_id=callback.message.chat.id,
@@ -492,37 +757,16 @@ def handler_task_list_to_manager_ask_status(message) -> None:
 
 def gen_buttons_status_task(time_borders):
     """Создаем кнопки статусов, чтобы узнать какие задания отправлять"""
-
-    logger.info(
-        'Создаем кнопки статусов, чтобы узнать какие задания отправлять')
-
-    work = InlineKeyboardButton(
-        text='В работе (у исполнителя)',
-        callback_data=f'work, {time_borders}',
-    )
-    finish = InlineKeyboardButton(
-        text='Завершенные работы',
-        callback_data=f'finish, {time_borders}',
-    )
-    menu = InlineKeyboardButton(
-        text='Вернуться в меню',
-        callback_data='menu',
-    )
-
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(work)
-    keyboard.add(finish)
-    keyboard.add(menu)
-    return keyboard
+    return keyboards.status_task(time_borders)
 
 
 @bot.callback_query_handler(state=UserState.send_task_status)
+@error_handler_callback
 def handler_task_list_to_manager_time_status(callback) -> None:
     """Узнали отрезок времени. Запрашиваем статус"""
 
     logger.info('Узнали отрезок времени. Запрашиваем статус')
 
-    tasks = []
     try:
         bot.edit_message_reply_markup(
             chat_id=callback.message.chat.id,
@@ -530,45 +774,16 @@ def handler_task_list_to_manager_time_status(callback) -> None:
         )
         status, borders = callback.data.split(', ')
 
-        left_border, right_border = borders.split(' - ')
-
-        left_date = datetime.datetime.strptime(left_border.strip(),
-                                               '%d/%m/%Y')
-        right_date = datetime.datetime.strptime(right_border.strip(),
-                                                '%d/%m/%Y')
-
-        for task in Task.select():
-            if task.date_start == '':
-                task_start_date = '12/12/1000'
-            else:
-                task_start_date = task.date_start
-            task_start_date = datetime.datetime.strptime(task_start_date,
-                                                         "%d/%m/%Y")
-            if task.date_finish == '':
-                task_finish_date = '12/12/9999'
-            else:
-                task_finish_date = task.date_finish
-            task_finish_date = datetime.datetime.strptime(task_finish_date,
-                                                          "%d/%m/%Y")
-            if ((left_date <= task_start_date <= right_date or
-                 left_date <= task_finish_date <= right_date)
-                    and (task.status == status)):
-                tasks.append(task)
-
-        markup = InlineKeyboardMarkup()
-        if tasks:
+        left_date, right_date = parse_borders(borders)
+        markup = task_list_markup(
+            'status', callback.from_user.id,
+            [left_date.isoformat(), right_date.isoformat(), status])
+
+        if markup is not None:
             bot.send_message(callback.from_user.id,
                              f'📋 Задачи в период:\n'
-                             f'{left_border} - {right_border}')
-            for task_i in tasks:
-                markup.add(InlineKeyboardButton(
-                    text=f'"{task_i.task_name}"',
-                    callback_data=task_i.task_id,
-                ))
-            markup.add(InlineKeyboardButton(
-                text='Вернуться в меню',
-                callback_data='menu',
-            ))
+                             f'{format_date(left_date)} - '
+                             f'{format_date(right_date)}')
             bot.send_message(callback.from_user.id,
                              'Выберите, про какую прислать информацию',
                              reply_markup=markup)
@@ -585,18 +800,14 @@ def handler_task_list_to_manager_time_status(callback) -> None:
         bot.send_message(callback.from_user.id,
                          '❌Ошибка. Проверьте формат даты')
 
-        markup = InlineKeyboardMarkup()
-        markup.add(InlineKeyboardButton(
-            text='Вернуться в меню',
-            callback_data='menu',
-        ))
         bot.send_message(callback.from_user.id,
                          'Выберите действие: ',
-                         reply_markup=markup)
+                         reply_markup=keyboards.MENU)
 
 
 @bot.callback_query_handler(
-    func=lambda callback: callback.data in ['all', 'report', 'status'])
+    func=lambda callback: callback.data in ['all', 'report', 'status',
+                                            'export'])
 @error_handler_callback
 def handler_task_list_to_manager_time_borders(callback) -> None:
     """Отправляем задачи за нужный отрезок времени. Узнаем периоды"""
@@ -622,61 +833,29 @@ def handler_task_list_to_manager_time_borders(callback) -> None:
     elif callback.data in ['status']:
         bot.set_state(callback.from_user.id,
                       UserState.chose_times_borders_status)
+    elif callback.data in ['export']:
+        bot.set_state(callback.from_user.id,
+                      UserState.chose_times_borders_export)
 
 
 @bot.message_handler(state=UserState.chose_times_borders)
+@error_handler
 def handler_task_list_to_manager_time_all(message: Message) -> None:
     """Отправляем ВСЕ задачи за нужный отрезок времени"""
 
     logger.info('Отправляем ВСЕ задачи за нужный отрезок времени')
 
-    tasks = []
     try:
-        left_border, right_border = message.text.split(' - ')
-
-        left_date = datetime.datetime.strptime(left_border.strip(),
-                                               '%d/%m/%Y')
-        right_date = datetime.datetime.strptime(right_border.strip(),
-                                                '%d/%m/%Y')
-        for task in Task.select():
-            if task.date_start == '':
-                task_start_date = '12/12/1000'
-            else:
-                task_start_date = task.date_start
-            task_start_date = datetime.datetime.strptime(task_start_date,
-                                                         "%d/%m/%Y")
-            if task.date_finish == '':
-                task_finish_date = '12/12/9999'
-            else:
-                task_finish_date = task.date_finish
-            task_finish_date = datetime.datetime.strptime(task_finish_date,
-                                                          "%d/%m/%Y")
-            if (left_date <= task_start_date <= right_date or
-                    left_date <= task_finish_date <= right_date):
-                tasks.append(task)
-
-        markup = InlineKeyboardMarkup()
-        if tasks:
+        left_date, right_date = parse_borders(message.text)
+        markup = task_list_markup(
+            'all', message.from_user.id,
+            [left_date.isoformat(), right_date.isoformat()])
+
+        if markup is not None:
             bot.send_message(message.chat.id,
                              f'📋 Задачи в период:\n'
-                             f'{left_border} - {right_border}')
-            for task_i in tasks:
-                if task_i.status == 'work':
-                    status = 'В работе у исполнителя'
-                elif task_i.status == 'finish':
-                    status = 'Завершена'
-                elif task_i.status == 'process':
-                    status = 'Вы создаёте работу'
-                else:
-                    status = 'Неизвестный статус'
-                markup.add(InlineKeyboardButton(
-                    text=f'"{task_i.task_name}". {status}',
-                    callback_data=task_i.task_id,
-                ))
-            markup.add(InlineKeyboardButton(
-                text='Вернуться в меню',
-                callback_data='menu',
-            ))
+                             f'{format_date(left_date)} - '
+                             f'{format_date(right_date)}')
             bot.send_message(message.chat.id,
                              'Выберите, про какую прислать информацию',
                              reply_markup=markup)
@@ -693,18 +872,9 @@ def handler_task_list_to_manager_time_all(message: Message) -> None:
         bot.send_message(message.chat.id,
                          '❌Ошибка. Проверьте формат даты')
 
-        markup = InlineKeyboardMarkup()
-        markup.add(InlineKeyboardButton(
-            text='Вернуться в меню',
-            callback_data='menu',
-        ))
-        markup.add(InlineKeyboardButton(
-            text='Попробовать снова',
-            callback_data='all',
-        ))
         bot.send_message(message.chat.id,
                          'Выберите действие: ',
-                         reply_markup=markup)
+                         reply_markup=keyboards.MENU_OR_RETRY_ALL)
 
 
 @bot.message_handler(state=UserState.chose_times_borders_report)
@@ -714,39 +884,15 @@ def handler_task_report(message: Message) -> None:
 
     logger.info('Отправляем ОТЧЕТ о работах')
 
-    tasks_started = []
-    tasks_finished = []
+    left_date, right_date = parse_borders(message.text)
+    len_started, len_finished = report_cache.counts(
+        'manager', message.from_user.id, left_date, right_date)
 
-    left_border, right_border = message.text.split(' - ')
-
-    left_date = datetime.datetime.strptime(left_border.strip(),
-                                           '%d/%m/%Y')
-    right_date = datetime.datetime.strptime(right_border.strip(),
-                                            '%d/%m/%Y')
-    for task in Task.select():
-        if task.date_start == '':
-            task_start_date = '12/12/1000'
-        else:
-            task_start_date = task.date_start
-        task_start_date = datetime.datetime.strptime(task_start_date,
-                                                     "%d/%m/%Y")
-        if task.date_finish == '':
-            task_finish_date = '12/12/9999'
-        else:
-            task_finish_date = task.date_finish
-        task_finish_date = datetime.datetime.strptime(task_finish_date,
-                                                      "%d/%m/%Y")
-        if left_date <= task_start_date <= right_date:
-            tasks_started.append(task)
-        if left_date <= task_finish_date <= right_date:
-            tasks_finished.append(task)
-
-    if tasks_started or tasks_finished:
-        len_started = len(tasks_started)
-        len_finished = len(tasks_finished)
+    if len_started or len_finished:
         bot.send_message(message.chat.id,
                          f'📋 Задачи в период:\n'
-                         f'{left_border} - {right_border}')
+                         f'{format_date(left_date)} - '
+                         f'{format_date(right_date)}')
         bot.send_message(message.chat.id,
                          f'🚀Начатых задач: {len_started}\n\n'
                          f'🏁Завершенных задач: {len_finished}')
@@ -758,6 +904,29 @@ def handler_task_report(message: Message) -> None:
         handle_manager_to_do(message)
 
 
+@bot.message_handler(state=UserState.chose_times_borders_export)
+@error_handler
+def handler_task_export_format(message: Message) -> None:
+    """Узнали период выгрузки. Предлагаем формат файла"""
+
+    logger.info('Узнали период выгрузки. Предлагаем формат файла')
+
+    try:
+        left_date, right_date = parse_borders(message.text)
+    except ValueError as e:
+        logger.info(f'Неверный период выгрузки: {e}')
+        bot.send_message(message.chat.id,
+                         '❌Ошибка. Проверьте формат даты',
+                         reply_markup=keyboards.MENU_OR_RETRY_EXPORT)
+        return
+
+    bot.send_message(message.chat.id,
+                     '📤 В каком формате выгрузить задачи?',
+                     reply_markup=keyboards.export_formats(
+                         export.available_formats(), left_date, right_date))
+    bot.set_state(message.chat.id, UserState.to_do_manager)
+
+
 ########################################################################
 
 
@@ -809,13 +978,14 @@ def handle_data(message: Message) -> None:
     user_id = message.from_user.id
     user_name = message.text
 
-    user = UserWorker.get_or_none(UserWorker.user_id == user_id)
-    if user is None:
+    known_name = user_directory.user_name('worker', user_id)
+    if known_name is None:
         UserWorker.create(
             user_id=user_id,
             user_name=user_name,
             id_task=0
         )
+        user_directory.invalidate('worker', user_id)
         bot.send_message(
             message.chat.id,
             'Регистрация прошла успешно!',
@@ -824,24 +994,43 @@ def handle_data(message: Message) -> None:
     else:
         bot.reply_to(
             message,
-            f"Рад вас снова видеть, {user.user_name}!",
+            f"Рад вас снова видеть, {known_name}!",
             reply_markup=ReplyKeyboardRemove()
         )
     handle_worker_to_do(message)
 
 
-@bot.callback_query_handler(func=lambda callback: callback.data in ['accept'])
+@bot.callback_query_handler(
+    func=lambda callback: callback.data == 'accept' or
+    (callback.data or '').startswith(keyboards.ACCEPT_PREFIX))
 @error_handler_callback
 def handle_accept_task(callback) -> None:
-    """Принимаем новую задачу. Меняем статус в Task"""
+    """Принимаем задачу из callback_data. Меняем статус в Task"""
 
-    logger.info('Принимаем новую задачу. Меняем статус в Task')
+    logger.info(f'Принимаем новую задачу: {callback.data}')
 
-    task = Task.get((Task.id_worker == callback.from_user.id) &
-                    (Task.status == 'process'))
+    tasks = Task.select().where((Task.id_worker == callback.from_user.id) &
+                                (Task.status == 'process'))
+    if callback.data == 'accept':
+        # Кнопка без task_id, отправленная до accept:<task_id>
+        task = tasks.order_by(Task.task_id).first()
+    else:
+        task_id = int(callback.data[len(keyboards.ACCEPT_PREFIX):])
+        task = tasks.where(Task.task_id == task_id).first()
+    if task is None:
+        bot.send_message(callback.from_user.id, '❗️Задача уже принята')
+        bot.edit_message_reply_markup(
+            chat_id=callback.message.chat.id,
+            message_id=callback.message.message_id
+        )
+        return
     task.status = 'work'
-    task.date_start = datetime.date.today().strftime("%d/%m/%Y")
-    task.save()
+    task.date_start = datetime.date.today()
+    with db.atomic():
+        task.save(only=[Task.status, Task.date_start])
+        touch_tasks([task.task_id])
+        count_day(task, task.date_start, TaskDailyStats.started)
+    report_cache.task_counted(task, task.date_start)
     bot.send_message(callback.from_user.id,
                      '✅ Задача принята!',
                      )
@@ -868,26 +1057,7 @@ def handle_worker_to_do(message: Message) -> None:
 
 def gen_buttons_worker_to_do():
     """Функция кнопок выбора действия для worker"""
-
-    logger.info('Функция кнопок выбора действия для worker')
-
-    task_info = InlineKeyboardButton(
-        text='📑 Список задач',
-        callback_data='task_list_worker',
-    )
-    task_fin = InlineKeyboardButton(
-        text='☑️Сдать работу',
-        callback_data='task_fin',
-    )
-    report = InlineKeyboardButton(
-        text='📊Смотреть отчет',
-        callback_data='report_w',
-    )
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(task_info)
-    keyboard.add(task_fin)
-    keyboard.add(report)
-    return keyboard
+    return keyboards.WORKER_TO_DO
 
 
 @bot.callback_query_handler(
@@ -898,29 +1068,20 @@ def handle_fin_task_task_id(callback) -> None:
 
     logger.info('Узнаем id для задачи, которую надо закончить')
 
-    markup = InlineKeyboardMarkup()
-    tasks = Task.select().where((Task.status == 'work') &
-                                (Task.id_worker == callback.from_user.id))
+    markup = task_list_markup('fin', callback.from_user.id, [])
 
     bot.edit_message_reply_markup(
         chat_id=callback.message.chat.id,
         message_id=callback.message.message_id
     )
 
-    if not tasks.exists():
+    if markup is None:
         bot.send_message(callback.from_user.id,
                          '📭Задач пока нет📭')
         bot.set_state(callback.from_user.id, UserState.to_do_worker)
         handle_worker_to_do(callback.message)
         return
     else:
-        for task in tasks:
-            markup.add(InlineKeyboardButton(
-                text=task.task_name,
-                callback_data=task.task_id,
-            ),
-            )
-
         bot.send_message(callback.from_user.id,
                          "Выберите задачу:",
                          reply_markup=markup)
@@ -935,9 +1096,13 @@ def handle_fin_task_chak(callback) -> None:
     logger.info('Сдаем работу менеджеру')
 
     task_id = callback.data
-    task = Task.get(Task.task_id == task_id)
+    task = Task.get((Task.task_id == task_id) &
+                    (Task.id_worker == callback.from_user.id))
     task.status = 'finishing'
-    task.save()
+    with db.atomic():
+        task.save(only=[Task.status])
+        touch_tasks([task.task_id])
+    bot.add_data(callback.from_user.id, finishing_task=task.task_id)
     bot.edit_message_reply_markup(
         chat_id=callback.message.chat.id,
         message_id=callback.message.message_id
@@ -946,6 +1111,15 @@ def handle_fin_task_chak(callback) -> None:
     bot.set_state(callback.from_user.id, UserState.forward_to_manager)
 
 
+def finishing_task(worker_id: int) -> Task:
+    """Задача, которую сейчас сдаёт исполнитель (handle_fin_task_chak)"""
+    with bot.retrieve_data(worker_id) as data:
+        task_id = data['finishing_task']
+    return Task.get((Task.task_id == task_id) &
+                    (Task.id_worker == worker_id) &
+                    (Task.status == 'finishing'))
+
+
 @bot.message_handler(state=UserState.send_task)
 @error_handler
 def handle_send_task_to_manager(message: Message):
@@ -953,15 +1127,15 @@ def handle_send_task_to_manager(message: Message):
 
     logger.info('Сообщаем менеджеру об окончании работы')
 
-    task = Task.get((Task.id_worker == message.chat.id) &
-                    (Task.status == 'finishing'))
+    task = finishing_task(message.chat.id)
 
-    worker = UserWorker.get(UserWorker.user_id == task.id_worker)
+    worker_name = user_directory.user_name('worker', task.id_worker)
     bot.send_message(message.chat.id,
                      '🎊Отлично, работа завершена!')
-    bot.send_message(task.id_manager,
-                     f'💡{worker.user_name} - сдаёт работу'
-                     f' "{task.task_name}!"')
+    with bulk():
+        bot.send_message(task.id_manager,
+                         f'💡{worker_name} - сдаёт работу'
+                         f' "{task.task_name}!"')
 
     handle_end_circle(message)
     handle_worker_to_do(message)
@@ -969,22 +1143,7 @@ def handle_send_task_to_manager(message: Message):
 
 def gen_buttons_yes_no():
     """Функция кнопки да\нет"""
-
-    logger.info('Функция кнопки да\нет')
-
-    yes = InlineKeyboardButton(
-        text='✅',
-        callback_data='finish_finish',
-    )
-    no = InlineKeyboardButton(
-        text='❌',
-        callback_data='stop',
-    )
-
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(yes)
-    keyboard.add(no)
-    return keyboard
+    return keyboards.YES_NO
 
 
 @bot.message_handler(state=UserState.end_task)
@@ -994,28 +1153,23 @@ def handle_end_circle(message: Message) -> None:
 
     logger.info('Спрашиваем worker принять работу или нет.')
 
-    task = Task.get((Task.id_worker == message.chat.id) &
-                    (Task.status == 'finishing'))
+    task = finishing_task(message.chat.id)
     task.status = 'finish'
-    task.date_finish = datetime.date.today().strftime("%d/%m/%Y")
-    task.save()
-    bot.send_message(task.id_manager,
-                     f'Работа "{task.task_name}" завершена',
-                     reply_markup=gen_buttons_end_circle())
+    task.date_finish = datetime.date.today()
+    with db.atomic():
+        task.save(only=[Task.status, Task.date_finish])
+        touch_tasks([task.task_id])
+        count_day(task, task.date_finish, TaskDailyStats.finished)
+    report_cache.task_counted(task, task.date_finish)
+    with bulk():
+        bot.send_message(task.id_manager,
+                         f'Работа "{task.task_name}" завершена',
+                         reply_markup=gen_buttons_end_circle())
 
 
 def gen_buttons_end_circle():
     """Функция кнопки принять работу"""
-
-    logger.info('Функция кнопки принять работу')
-
-    end = InlineKeyboardButton(
-        text='OK',
-        callback_data='end_circle',
-    )
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(end)
-    return keyboard
+    return keyboards.END_CIRCLE
 
 
 @bot.callback_query_handler(
@@ -1038,41 +1192,12 @@ def handler_task_list_to_worker(callback) -> None:
 
 def gen_buttons_tip_of_tasks_w():
     """
-    Создаём кнопки дял выбора типа заданий
+    Кнопки для выбора типа заданий
     all_w - Все
     status_w - Работы в определённом статусе
     need_manager - Работы одного менеджера
     """
-
-    logger.info('Создаём кнопки дял выбора типа заданий'
-    'all_w - Все'
-    'status_w - Работы в определённом статусе'
-    'need_manager - Работы одного менеджера')
-
-    all_tasks = InlineKeyboardButton(
-        text='Все задания',
-        callback_data='all_w',
-    )
-    status_task = InlineKeyboardButton(
-        text='В определённом статусе',
-        callback_data='status_w',
-    )
-    worker_tasks = InlineKeyboardButton(
-        text='От определённого менеджера',
-        callback_data='need_manager',
-    )
-    menu = InlineKeyboardButton(
-        text='Вернуться в меню',
-        callback_data='menu_w',
-    )
-
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(all_tasks)
-    keyboard.add(status_task)
-    keyboard.add(worker_tasks)
-    keyboard.add(menu)
-
-    return keyboard
+    return keyboards.TIP_OF_TASKS_W
 
 
 @bot.callback_query_handler(state=UserState.chose_task_info_id_worker)
@@ -1082,31 +1207,8 @@ def handler_task_list_to_worker_send(callback) -> None:
 
     logger.info('Отправляем информацию конкретной задачи')
 
-    task = Task.get(Task.task_id == callback.data)
-    manager = UserManager.get(task.id_manager == UserManager.user_id)
-    date_finish = task.date_finish
-    status = task.status
-    date_start = task.date_start
-
-    if status == 'finishing':
-        status = 'Вы завершает задание'
-        date_finish = 'Работа не завершена'
-    elif status == 'process':
-        status = 'Вы ещё не приняли работу'
-        date_start = 'Работа не начата'
-        date_finish = 'Работа не завершена'
-    elif status == 'work':
-        status = 'Вы работает над задачей'
-        date_finish = 'Работа не завершена'
-    elif status == 'finish':
-        status = 'Работа завершена'
-
-    bot.send_message(callback.from_user.id,
-                     f'Имя работы: \n{task.task_name}\n\n'
-                     f'Работу назначил: \n{manager.user_name}\n\n'
-                     f'📆Дата начала работы: \n{date_start}\n\n'
-                     f'Статус: \n{status}\n\n'
-                     f'📆Дата завершения работы: \n{date_finish}')
+    text, markup = task_cards.card(callback.data, 'worker')
+    bot.send_message(callback.from_user.id, text, reply_markup=markup)
 
     bot.edit_message_reply_markup(
         chat_id=callback.message.chat.id,
@@ -1132,37 +1234,16 @@ def handler_task_list_to_worker_ask_status(message) -> None:
 
 def gen_buttons_status_task_w(time_borders):
     """Создаем кнопки статусов, чтобы узнать какие задания отправлять"""
-
-    logger.info(
-        'Создаем кнопки статусов, чтобы узнать какие задания отправлять')
-
-    work = InlineKeyboardButton(
-        text='В работе (у вас)',
-        callback_data=f'work, {time_borders}',
-    )
-    finish = InlineKeyboardButton(
-        text='Завершенные работы',
-        callback_data=f'finish, {time_borders}',
-    )
-    menu = InlineKeyboardButton(
-        text='Вернуться в меню',
-        callback_data='menu_w',
-    )
-
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(work)
-    keyboard.add(finish)
-    keyboard.add(menu)
-    return keyboard
+    return keyboards.status_task_w(time_borders)
 
 
 @bot.callback_query_handler(state=UserState.send_task_status_w)
+@error_handler_callback
 def handler_task_list_to_worker_time_status(callback) -> None:
     """Узнали отрезок времени. Запрашиваем статус"""
 
     logger.info('Узнали отрезок времени. Запрашиваем статус')
 
-    tasks = []
     try:
         bot.edit_message_reply_markup(
             chat_id=callback.message.chat.id,
@@ -1170,44 +1251,16 @@ def handler_task_list_to_worker_time_status(callback) -> None:
         )
         status, borders = callback.data.split(', ')
 
-        left_border, right_border = borders.split(' - ')
-
-        left_date = datetime.datetime.strptime(left_border.strip(),
-                                               '%d/%m/%Y')
-        right_date = datetime.datetime.strptime(right_border.strip(),
-                                                '%d/%m/%Y')
-        for task in Task.select():
-            if task.date_start == '':
-                task_start_date = '12/12/1000'
-            else:
-                task_start_date = task.date_start
-            task_start_date = datetime.datetime.strptime(task_start_date,
-                                                         "%d/%m/%Y")
-            if task.date_finish == '':
-                task_finish_date = '12/12/9999'
-            else:
-                task_finish_date = task.date_finish
-            task_finish_date = datetime.datetime.strptime(task_finish_date,
-                                                          "%d/%m/%Y")
-            if ((left_date <= task_start_date <= right_date or
-                 left_date <= task_finish_date <= right_date)
-                    and (task.status == status)):
-                tasks.append(task)
-
-        markup = InlineKeyboardMarkup()
-        if tasks:
+        left_date, right_date = parse_borders(borders)
+        markup = task_list_markup(
+            'status_w', callback.from_user.id,
+            [left_date.isoformat(), right_date.isoformat(), status])
+
+        if markup is not None:
             bot.send_message(callback.from_user.id,
                              f'📋 Задачи в период:\n'
-                             f'{left_border} - {right_border}')
-            for task_i in tasks:
-                markup.add(InlineKeyboardButton(
-                    text=f'"{task_i.task_name}"',
-                    callback_data=task_i.task_id,
-                ))
-            markup.add(InlineKeyboardButton(
-                text='Вернуться в меню',
-                callback_data='menu_w',
-            ))
+                             f'{format_date(left_date)} - '
+                             f'{format_date(right_date)}')
             bot.send_message(callback.from_user.id,
                              'Выберите, про какую прислать информацию',
                              reply_markup=markup)
@@ -1224,14 +1277,9 @@ def handler_task_list_to_worker_time_status(callback) -> None:
         bot.send_message(callback.from_user.id,
                          '❌Ошибка. Проверьте формат даты')
 
-        markup = InlineKeyboardMarkup()
-        markup.add(InlineKeyboardButton(
-            text='Вернуться в меню',
-            callback_data='menu_w',
-        ))
         bot.send_message(callback.from_user.id,
                          'Выберите действие: ',
-                         reply_markup=markup)
+                         reply_markup=keyboards.MENU_W)
 
 
 @bot.callback_query_handler(
@@ -1273,53 +1321,16 @@ def handler_task_list_to_manager_time_all(message: Message) -> None:
 
     logger.info('Отправляем ВСЕ задачи за нужный отрезок времени')
 
-    tasks = []
-
-    left_border, right_border = message.text.split(' - ')
-
-    left_date = datetime.datetime.strptime(left_border.strip(),
-                                           '%d/%m/%Y')
-    right_date = datetime.datetime.strptime(right_border.strip(),
-                                            '%d/%m/%Y')
-    for task in Task.select():
-        if task.date_start == '':
-            task_start_date = '12/12/1000'
-        else:
-            task_start_date = task.date_start
-        task_start_date = datetime.datetime.strptime(task_start_date,
-                                                     "%d/%m/%Y")
-        if task.date_finish == '':
-            task_finish_date = '12/12/9999'
-        else:
-            task_finish_date = task.date_finish
-        task_finish_date = datetime.datetime.strptime(task_finish_date,
-                                                      "%d/%m/%Y")
-        if (left_date <= task_start_date <= right_date or
-                left_date <= task_finish_date <= right_date):
-            tasks.append(task)
+    left_date, right_date = parse_borders(message.text)
+    markup = task_list_markup(
+        'all_w', message.from_user.id,
+        [left_date.isoformat(), right_date.isoformat()])
 
-    markup = InlineKeyboardMarkup()
-    if tasks:
+    if markup is not None:
         bot.send_message(message.chat.id,
                          f'📋 Задачи в период:\n'
-                         f'{left_border} - {right_border}')
-        for task_i in tasks:
-            if task_i.status == 'work':
-                status = 'В работе(у вас)'
-            elif task_i.status == 'finish':
-                status = 'Завершена'
-            elif task_i.status == 'process':
-                status = 'Менеджер создаёт работу'
-            else:
-                status = 'Неизвестный статус'
-            markup.add(InlineKeyboardButton(
-                text=f'"{task_i.task_name}". {status}',
-                callback_data=task_i.task_id,
-            ))
-        markup.add(InlineKeyboardButton(
-            text='Вернуться в меню',
-            callback_data='menu_w',
-        ))
+                         f'{format_date(left_date)} - '
+                         f'{format_date(right_date)}')
         bot.send_message(message.chat.id,
                          'Выберите, про какую прислать информацию',
                          reply_markup=markup)
@@ -1340,40 +1351,15 @@ def handler_task_report_to_worker(message: Message) -> None:
 
     logger.info('Отправляем ОТЧЕТ о работах')
 
-    tasks_started = []
-    tasks_finished = []
-
-    left_border, right_border = message.text.split(' - ')
+    left_date, right_date = parse_borders(message.text)
+    len_started, len_finished = report_cache.counts(
+        'worker', message.from_user.id, left_date, right_date)
 
-    left_date = datetime.datetime.strptime(left_border.strip(),
-                                           '%d/%m/%Y')
-    right_date = datetime.datetime.strptime(right_border.strip(),
-                                            '%d/%m/%Y')
-
-    for task in Task.select():
-        if task.date_start == '':
-            task_start_date = '12/12/1000'
-        else:
-            task_start_date = task.date_start
-        task_start_date = datetime.datetime.strptime(task_start_date,
-                                                     "%d/%m/%Y")
-        if task.date_finish == '':
-            task_finish_date = '12/12/9999'
-        else:
-            task_finish_date = task.date_finish
-        task_finish_date = datetime.datetime.strptime(task_finish_date,
-                                                      "%d/%m/%Y")
-        if left_date <= task_start_date <= right_date:
-            tasks_started.append(task)
-        if left_date <= task_finish_date <= right_date:
-            tasks_finished.append(task)
-
-    if tasks_started or tasks_finished:
-        len_started = len(tasks_started)
-        len_finished = len(tasks_finished)
+    if len_started or len_finished:
         bot.send_message(message.chat.id,
                          f'📋 Задачи в период:\n'
-                         f'{left_border} - {right_border}')
+                         f'{format_date(left_date)} - '
+                         f'{format_date(right_date)}')
         bot.send_message(message.chat.id,
                          f'🚀Начатых задач: {len_started}\n\n'
                          f'🏁Завершенных задач: {len_finished}')
@@ -1395,11 +1381,10 @@ def handler_task_list_to_worker_choose_need_worker(callback) -> None:
 
 
     markup = InlineKeyboardMarkup()
-    managers = UserManager.select()
-    for manager in managers:
+    for manager_id, manager_name in user_directory.roster('manager'):
         markup.add(InlineKeyboardButton(
-            text=manager.user_name,
-            callback_data=manager.user_id,
+            text=manager_name,
+            callback_data=manager_id,
         ),
         )
 
@@ -1425,28 +1410,9 @@ def handler_task_list_to_worker_need_worker(callback) -> None:
     logger.info('Отправляем список нужных по статусу заданий')
 
 
-    tasks = Task.select().where((Task.id_worker == callback.from_user.id) &
-                                (Task.id_manager == callback.data))
-    markup = InlineKeyboardMarkup()
-    for task in tasks:
-        if task.status == 'work':
-            status = 'В работе(у вас)'
-        elif task.status == 'finish':
-            status = 'Завершена'
-        elif task.status == 'process':
-            status = 'Менеджер создаёт работу'
-        else:
-            status = 'Неизвестный статус'
-
-        markup.add(InlineKeyboardButton(
-            text=f'"{task.task_name}". {status}',
-            callback_data=task.task_id,
-        ),
-        )
-    markup.add(InlineKeyboardButton(
-        text='Вернуться в меню',
-        callback_data='menu_w',
-    ))
+    markup = task_list_markup('mgr', callback.from_user.id, [callback.data])
+    if markup is None:
+        markup = keyboards.MENU_W
     bot.send_message(callback.from_user.id,
                      'Список задач:\n'
                      'Выберите, про какую прислать информацию',
@@ -1466,30 +1432,18 @@ def forward_message_task_to_manager(message: Message) -> None:
     """Получаем файл от воркера и отправляем менеджеру"""
     logger.info('Отправляем задачу, либо получаем ещё файл')
 
-    manager = UserManager.get()
-    manager_id = manager.user_id
-    if message.content_type == 'document':
-        bot.send_document(manager_id, message.document.file_id)
-    elif message.content_type == 'photo':
-        bot.send_photo(manager_id, message.photo[0].file_id)
-    elif message.content_type == 'text':
-        bot.send_message(manager_id, message.text)
-    else:
-        bot.send_message(manager_id,
-                         'Произошла ошибка при пересылки сообщения')
-    markup = InlineKeyboardMarkup()
-    markup.add(InlineKeyboardButton(
-        text='Добавить ещё файл/информацию',
-        callback_data='send_more_w',
-    ))
-    markup.add(InlineKeyboardButton(
-        text='Отправить задачу менеджеру',
-        callback_data='send_w',
-    ))
-    bot.send_message(message.chat.id,
-                     'Выберите действие: ',
-                     reply_markup=markup)
-    return
+    task = finishing_task(message.chat.id)
+    manager_id = task.id_manager
+    save_attachments([task.task_id], message)
+
+    @error_handler
+    def forward_album_to_manager(message: Message, messages: list) -> None:
+        send_attachments(bot, manager_id, messages)
+        bot.send_message(message.chat.id,
+                         'Выберите действие: ',
+                         reply_markup=keyboards.SEND_OR_MORE_TO_MANAGER)
+
+    album_buffer.add(message, forward_album_to_manager)
 
 
 @bot.callback_query_handler(
@@ -1510,6 +1464,7 @@ def handler_send_or_send_more_to_manager(callback) -> None:
 
 
 @bot.message_handler(func=lambda message: True)
+@error_handler
 def handle_unexpected_messages(message: Message):
     """Ловим все неожиданные сообщения"""
 
@@ -0,0 +1,247 @@
+"""
+Клавиатуры бота.
+
+Статические клавиатуры собираются один раз при импорте и хранят готовый
+JSON: telebot при каждой отправке вызывает to_json(), и он возвращает одну
+и ту же строку. Клавиатуры с параметрами собираются функциями с LRU-кэшем.
+"""
+from functools import lru_cache
+
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+
+class FrozenMarkup(InlineKeyboardMarkup):
+    """Клавиатура, которая сериализуется один раз. Не изменять после сборки"""
+
+    def __init__(self, *buttons) -> None:
+        super().__init__()
+        for text, callback_data in buttons:
+            self.add(InlineKeyboardButton(text=text,
+                                          callback_data=callback_data))
+        self.json = super().to_json()
+
+    def to_json(self) -> str:
+        return self.json
+
+
+def build(*buttons) -> InlineKeyboardMarkup:
+    """Новая клавиатура по кнопке в ряд, как собирались все меню раньше"""
+    keyboard = InlineKeyboardMarkup()
+    for text, callback_data in buttons:
+        keyboard.add(InlineKeyboardButton(text=text,
+                                          callback_data=callback_data))
+    return keyboard
+
+
+MENU_BUTTON = ('Вернуться в меню', 'menu')
+MENU_W_BUTTON = ('Вернуться в меню', 'menu_w')
+
+ROLE_BUTTONS = (
+    ('🧑Менеджер ', 'manager'),
+    ('🧑‍💻Исполнитель', 'worker'),
+)
+MANAGER_TO_DO_BUTTONS = (
+    ('💡Назначить работу', 'new_task'),
+    ('📑Смотреть список работ', 'task_list_manager'),
+    ('📊Смотреть отчет', 'report'),
+    ('📤Выгрузить задачи', 'export'),
+)
+WORKER_TO_DO_BUTTONS = (
+    ('📑 Список задач', 'task_list_worker'),
+    ('☑️Сдать работу', 'task_fin'),
+    ('📊Смотреть отчет', 'report_w'),
+)
+# all - Все, status - Работы в определённом статусе
+TIP_OF_TASKS_BUTTONS = (
+    ('Все задания', 'all'),
+    ('В определённом статусе', 'status'),
+    MENU_BUTTON,
+)
+# need_manager - Работы одного менеджера
+TIP_OF_TASKS_W_BUTTONS = (
+    ('Все задания', 'all_w'),
+    ('В определённом статусе', 'status_w'),
+    ('От определённого менеджера', 'need_manager'),
+    MENU_W_BUTTON,
+)
+
+ROLE = FrozenMarkup(*ROLE_BUTTONS)
+MANAGER_TO_DO = FrozenMarkup(*MANAGER_TO_DO_BUTTONS)
+WORKER_TO_DO = FrozenMarkup(*WORKER_TO_DO_BUTTONS)
+TIP_OF_TASKS = FrozenMarkup(*TIP_OF_TASKS_BUTTONS)
+TIP_OF_TASKS_W = FrozenMarkup(*TIP_OF_TASKS_W_BUTTONS)
+YES_NO = FrozenMarkup(('✅', 'finish_finish'), ('❌', 'stop'))
+END_CIRCLE = FrozenMarkup(('OK', 'end_circle'))
+MENU = FrozenMarkup(MENU_BUTTON)
+MENU_W = FrozenMarkup(MENU_W_BUTTON)
+MENU_OR_RETRY_ALL = FrozenMarkup(MENU_BUTTON, ('Попробовать снова', 'all'))
+MENU_OR_RETRY_EXPORT = FrozenMarkup(MENU_BUTTON,
+                                    ('Попробовать снова', 'export'))
+SEND_OR_MORE_TO_WORKER = FrozenMarkup(
+    ('Добавить ещё файл/информацию', 'send_more'),
+    ('Отправить задачу исполнителю', 'send'),
+)
+SEND_OR_MORE_TO_MANAGER = FrozenMarkup(
+    ('Добавить ещё файл/информацию', 'send_more_w'),
+    ('Отправить задачу менеджеру', 'send_w'),
+)
+
+
+@lru_cache(maxsize=256)
+def status_task(time_borders: str) -> FrozenMarkup:
+    """Кнопки статусов для менеджера, период передаётся в callback_data"""
+    return FrozenMarkup(
+        ('В работе (у исполнителя)', f'work, {time_borders}'),
+        ('Завершенные работы', f'finish, {time_borders}'),
+        MENU_BUTTON,
+    )
+
+
+@lru_cache(maxsize=256)
+def status_task_w(time_borders: str) -> FrozenMarkup:
+    """Кнопки статусов для worker, период передаётся в callback_data"""
+    return FrozenMarkup(
+        ('В работе (у вас)', f'work, {time_borders}'),
+        ('Завершенные работы', f'finish, {time_borders}'),
+        MENU_W_BUTTON,
+    )
+
+
+# Листание списка задач: page:<список>:<курсор>:<параметры через запятую>.
+# Курсор n<task_id> - страница после задачи, p<task_id> - перед ней.
+# Всё нужное для следующей страницы лежит в callback_data (до 64 байт)
+PAGE_PREFIX = 'page:'
+
+
+def page_data(kind: str, cursor: str, args=()) -> str:
+    return f'{PAGE_PREFIX}{kind}:{cursor}:{",".join(map(str, args))}'
+
+
+def parse_page_data(data: str) -> tuple:
+    """Разбираем callback_data листания: (список, after, before, параметры)"""
+    kind, cursor, args = data[len(PAGE_PREFIX):].split(':')
+    after = before = None
+    if cursor.startswith('n'):
+        after = int(cursor[1:])
+    elif cursor.startswith('p'):
+        before = int(cursor[1:])
+    return kind, after, before, args.split(',') if args else []
+
+
+def task_page(buttons, kind: str, args, has_prev: bool, has_next: bool,
+              first_id=None, last_id=None,
+              back_button=None) -> InlineKeyboardMarkup:
+    """
+    Страница списка задач: кнопка на задачу, ряд листания и кнопка
+    возврата в меню
+    """
+    keyboard = build(*buttons)
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton(
+            text='◀️', callback_data=page_data(kind, f'p{first_id}', args)))
+    if has_next:
+        navigation.append(InlineKeyboardButton(
+            text='▶️', callback_data=page_data(kind, f'n{last_id}', args)))
+    if navigation:
+        keyboard.row(*navigation)
+    if back_button is not None:
+        keyboard.add(InlineKeyboardButton(text=back_button[0],
+                                          callback_data=back_button[1]))
+    return keyboard
+
+
+# Выбор исполнителей задачи: pick:<user_id> отмечает/снимает исполнителя,
+# pick_page:<страница> листает список (в сообщении до 100 кнопок)
+PICK_PREFIX = 'pick:'
+PICK_PAGE_PREFIX = 'pick_page:'
+PICK_DONE = 'pick_done'
+
+
+def worker_picker(workers, selected, page: int = 0,
+                  has_next: bool = False) -> InlineKeyboardMarkup:
+    """
+    Страница исполнителей ((user_id, user_name)) с листанием,
+    отмеченные - с ✅
+    """
+    keyboard = build(*(
+        (f'✅ {user_name}' if user_id in selected else user_name,
+         f'{PICK_PREFIX}{user_id}')
+        for user_id, user_name in workers
+    ))
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(
+            text='◀️', callback_data=f'{PICK_PAGE_PREFIX}{page - 1}'))
+    if has_next:
+        navigation.append(InlineKeyboardButton(
+            text='▶️', callback_data=f'{PICK_PAGE_PREFIX}{page + 1}'))
+    if navigation:
+        keyboard.row(*navigation)
+    keyboard.add(InlineKeyboardButton(text='Готово', callback_data=PICK_DONE))
+    keyboard.add(InlineKeyboardButton(text=MENU_BUTTON[0],
+                                      callback_data=MENU_BUTTON[1]))
+    return keyboard
+
+
+# Принять задачу: accept:<task_id>
+ACCEPT_PREFIX = 'accept:'
+
+
+def finish_or_stop(task_id: int) -> InlineKeyboardMarkup:
+    """Кнопка принять задачу task_id"""
+    return build(('✅', f'{ACCEPT_PREFIX}{task_id}'))
+
+
+# Вложения задачи: files:<task_id> отправляет их по file_id
+FILES_PREFIX = 'files:'
+
+
+def task_card(task_id: int) -> InlineKeyboardMarkup:
+    """Кнопка под карточкой задачи, у которой есть вложения"""
+    return build(('📎 Показать вложения', f'{FILES_PREFIX}{task_id}'))
+
+
+# Выгрузка задач: export:<формат>:<первый день>:<последний день>
+EXPORT_PREFIX = 'export:'
+
+
+def export_formats(formats, left_date, right_date) -> InlineKeyboardMarkup:
+    """Кнопка на формат файла выгрузки за период"""
+    period = f'{left_date.isoformat()}:{right_date.isoformat()}'
+    keyboard = build(*((fmt.upper(), f'{EXPORT_PREFIX}{fmt}:{period}')
+                       for fmt in formats))
+    keyboard.add(InlineKeyboardButton(text=MENU_BUTTON[0],
+                                      callback_data=MENU_BUTTON[1]))
+    return keyboard
+
+
+def parse_export_data(data: str) -> tuple:
+    """Разбираем callback_data выгрузки: (формат, первый день, последний)"""
+    fmt, left, right = data[len(EXPORT_PREFIX):].split(':')
+    return fmt, left, right
+
+
+# Поиск задач: search:<страница> листает результаты (запрос - в данных
+# диалога), found:<task_id> присылает карточку найденной задачи
+SEARCH_PREFIX = 'search:'
+FOUND_PREFIX = 'found:'
+
+
+def search_page(tasks, page: int, has_next: bool,
+                back_button) -> InlineKeyboardMarkup:
+    """Страница результатов поиска ((task_id, task_name)) с листанием"""
+    keyboard = build(*((task_name, f'{FOUND_PREFIX}{task_id}')
+                       for task_id, task_name in tasks))
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(
+            text='◀️', callback_data=f'{SEARCH_PREFIX}{page - 1}'))
+    if has_next:
+        navigation.append(InlineKeyboardButton(
+            text='▶️', callback_data=f'{SEARCH_PREFIX}{page + 1}'))
+    if navigation:
+        keyboard.row(*navigation)
+    keyboard.add(InlineKeyboardButton(text=back_button[0],
+                                      callback_data=back_button[1]))
+    return keyboard
@@ -0,0 +1,133 @@
+"""
+Журнал бота без записи на диск в потоке обработки.
+
+Обработчики только кладут запись в очередь (QueueHandler), в файл её
+пишет QueueListener из своего потока. Каждая строка - JSON с полями
+update_id, user_id и handler того обновления, при обработке которого
+она записана. По завершении обработчика пишется строка с duration_ms.
+info.log и errors.log ротируются по размеру.
+
+Подключение: setup_logging() один раз при запуске. Контекст задают
+log_scope (обновление - chat_executor.install) и handler_scope
+(обработчик - декораторы ошибок в handler_worker.py).
+"""
+import atexit
+import contextvars
+import copy
+import datetime
+import json
+import logging
+import os
+import queue
+import time
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from config import LOG_DIR, LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT
+
+logger = logging.getLogger('manager_bot_logger')
+
+# Обновление и обработчик, которые выполняются в текущем контексте
+log_context = contextvars.ContextVar('log_context', default={})
+
+CONTEXT_FIELDS = ('update_id', 'user_id', 'handler')
+
+listener = None
+
+
+@contextmanager
+def log_scope(**fields):
+    """Поля, которые получат все записи внутри блока"""
+    token = log_context.set({**log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        log_context.reset(token)
+
+
+@contextmanager
+def handler_scope(handler: str, user_id=None):
+    """Обработчик обновления: имя в записях и строка с длительностью"""
+    started = time.perf_counter()
+    with log_scope(handler=handler, user_id=user_id):
+        try:
+            yield
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            logger.info('Обработчик завершён',
+                        extra={'duration_ms': round(duration, 3)})
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Кладёт запись в очередь. Контекст и текст сообщения собираются
+    здесь: в потоке записи контекста обработчика уже нет
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        for field, value in log_context.get().items():
+            if not hasattr(record, field):
+                setattr(record, field, value)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.datetime.fromtimestamp(
+                record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS + ('duration_ms',):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        entry['file'] = record.filename
+        entry['line'] = record.lineno
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def file_handler(path: str, level: int) -> RotatingFileHandler:
+    handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES,
+                                  backupCount=LOG_BACKUP_COUNT,
+                                  encoding='utf-8', delay=True)
+    handler.setLevel(level)
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def setup_logging(log_dir: str = LOG_DIR) -> QueueListener:
+    """Подключаем очередь к manager_bot_logger и запускаем поток записи"""
+    global listener
+    if listener is not None:
+        return listener
+
+    os.makedirs(log_dir, exist_ok=True)
+    info_handler = file_handler(os.path.join(log_dir, 'info.log'),
+                                logging.DEBUG)
+    info_handler.addFilter(lambda record: record.levelno < logging.ERROR)
+    error_handler = file_handler(os.path.join(log_dir, 'errors.log'),
+                                 logging.ERROR)
+
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, info_handler, error_handler,
+                             respect_handler_level=True)
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(ContextQueueHandler(records))
+    listener.start()
+    # Дописываем очередь при выходе
+    atexit.register(listener.stop)
+    return listener
@@ -1,11 +1,19 @@
-from config import DEFAULT_COMMANDS
+from config import DEFAULT_COMMANDS, BOT_MODE
 from telebot.custom_filters import StateFilter
 from telebot.types import BotCommand
 from handler_worker import bot
-from models import create_models
+from metrics import start_server as start_metrics_server
+from models import db
+from migrations import run_migrations
+from webhook import run_webhook
 
 if __name__ == '__main__':
-    create_models()
+    with db.connection_context():
+        run_migrations()
     bot.add_custom_filter(StateFilter(bot))
+    start_metrics_server()
     bot.set_my_commands([BotCommand(*cmd) for cmd in DEFAULT_COMMANDS])
-    bot.polling()
+    if BOT_MODE == 'webhook':
+        run_webhook(bot)
+    else:
+        bot.polling()
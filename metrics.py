@@ -0,0 +1,358 @@
+"""
+Метрики обработчиков в текстовом формате Prometheus.
+
+За каждый вызов обработчика (декораторы ошибок в handler_worker.py)
+считаем время, запросы к б/д с их временем и запросы к Bot API. Время
+запросов к Bot API по методам сообщает диспетчер outbound.py. Вложенный
+вызов обработчика (меню после действия) считается в вызвавшем его.
+
+    bot_handler_duration_seconds{handler}       время вызова
+    bot_handler_db_queries{handler}             запросов к б/д за вызов
+    bot_handler_db_seconds_total{handler}       время запросов к б/д
+    bot_db_queries_total{handler,statement}     запросы по типу (select...)
+    bot_handler_api_calls{handler}              запросов к Bot API за вызов
+    bot_api_request_duration_seconds{method}    время запроса к Bot API
+    bot_update_queue_depth, bot_outbound_queue_depth{priority}
+    bot_outbound_wait_seconds{priority}         ожидание в очереди диспетчера
+    bot_outbound_max_wait_seconds{priority}     самое долгое ожидание
+    bot_update_shard_queue_depth{shard}         обновления в очереди шарда
+    bot_update_shard_wait_seconds{shard}        ожидание обновления в шарде
+    bot_update_shard_max_latency_seconds{shard} самое долгое от очереди до
+                                                конца обработки
+
+Подключение: install(db, chat_executor) и start_server() при запуске,
+метрики - на http://METRICS_HOST:METRICS_PORT/metrics.
+"""
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger('manager_bot_logger')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def format_value(value) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def label_text(names, values, extra=()) -> str:
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"')
+               .replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"'
+                          for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labels=()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.series = {}
+        REGISTRY.append(self)
+
+    def render(self) -> list:
+        return [f'# HELP {self.name} {self.help_text}',
+                f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, value=1) -> None:
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self) -> list:
+        lines = super().render()
+        with self.lock:
+            series = sorted(self.series.items())
+        for labels, value in series:
+            lines.append(f'{self.name}{label_text(self.labels, labels)} '
+                         f'{format_value(value)}')
+        return lines
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels=(),
+                 buckets=LATENCY_BUCKETS) -> None:
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels) -> None:
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                # Счётчики корзин, число наблюдений, сумма
+                series = self.series[labels] = [0] * len(self.buckets) + [0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> list:
+        lines = super().render()
+        with self.lock:
+            series = sorted((labels, list(values))
+                            for labels, values in self.series.items())
+        for labels, values in series:
+            for bound, count in zip(self.buckets, values):
+                lines.append(
+                    f'{self.name}_bucket'
+                    f'{label_text(self.labels, labels, [("le", bound)])} '
+                    f'{count}')
+            lines.append(
+                f'{self.name}_bucket'
+                f'{label_text(self.labels, labels, [("le", "+Inf")])} '
+                f'{values[-2]}')
+            lines.append(f'{self.name}_sum{label_text(self.labels, labels)} '
+                         f'{format_value(values[-1])}')
+            lines.append(f'{self.name}_count'
+                         f'{label_text(self.labels, labels)} {values[-2]}')
+        return lines
+
+
+class Gauge(Metric):
+    """Значение снимается при каждом запросе метрик: collect() -> {метки: x}"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, collect, labels=()) -> None:
+        super().__init__(name, help_text, labels)
+        self.collect = collect
+
+    def render(self) -> list:
+        lines = super().render()
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f'{self.name}{label_text(self.labels, labels)} '
+                         f'{format_value(value)}')
+        return lines
+
+
+class Summary(Gauge):
+    """
+    Число и сумма наблюдений, снимаются при каждом запросе метрик:
+    collect() -> {метки: (число, сумма)}
+    """
+    kind = 'summary'
+
+    def render(self) -> list:
+        lines = Metric.render(self)
+        for labels, (count, total) in sorted(self.collect().items()):
+            text = label_text(self.labels, labels)
+            lines.append(f'{self.name}_sum{text} {format_value(total)}')
+            lines.append(f'{self.name}_count{text} {format_value(count)}')
+        return lines
+
+
+REGISTRY = []
+
+HANDLER_DURATION = Histogram(
+    'bot_handler_duration_seconds', 'Время обработчика', ['handler'])
+HANDLER_DB_QUERIES = Histogram(
+    'bot_handler_db_queries', 'Запросов к б/д за вызов обработчика',
+    ['handler'], COUNT_BUCKETS)
+HANDLER_DB_SECONDS = Counter(
+    'bot_handler_db_seconds_total', 'Время запросов к б/д', ['handler'])
+DB_QUERIES = Counter(
+    'bot_db_queries_total', 'Запросы к б/д по типу',
+    ['handler', 'statement'])
+HANDLER_API_CALLS = Histogram(
+    'bot_handler_api_calls', 'Запросов к Bot API за вызов обработчика',
+    ['handler'], COUNT_BUCKETS)
+API_DURATION = Histogram(
+    'bot_api_request_duration_seconds', 'Время запроса к Bot API',
+    ['method'])
+
+
+class HandlerStats:
+    """Запросы текущего вызова обработчика, в т.ч. из потоков fan_out"""
+    __slots__ = ('handler', 'lock', 'queries', 'db_seconds', 'api_calls')
+
+    def __init__(self, handler: str) -> None:
+        self.handler = handler
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.api_calls = 0
+
+
+current_stats = contextvars.ContextVar('handler_stats', default=None)
+
+
+@contextmanager
+def observe_handler(handler: str):
+    """Считаем время и запросы вызова обработчика"""
+    if current_stats.get() is not None:
+        yield
+        return
+
+    stats = HandlerStats(handler)
+    token = current_stats.set(stats)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current_stats.reset(token)
+        HANDLER_DURATION.observe(time.perf_counter() - started, handler)
+        HANDLER_DB_QUERIES.observe(stats.queries, handler)
+        HANDLER_DB_SECONDS.inc(handler, value=stats.db_seconds)
+        HANDLER_API_CALLS.observe(stats.api_calls, handler)
+
+
+def instrument_database(database) -> None:
+    """Считаем запросы к б/д, выполненные внутри обработчиков"""
+    execute_sql = database.execute_sql
+    if getattr(execute_sql, 'instrumented', False):
+        return
+
+    def timed_execute_sql(sql, *args, **kwargs):
+        stats = current_stats.get()
+        if stats is None:
+            return execute_sql(sql, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return execute_sql(sql, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            with stats.lock:
+                stats.queries += 1
+                stats.db_seconds += elapsed
+            statement = sql.lstrip().split(None, 1)[0].lower()
+            DB_QUERIES.inc(stats.handler, statement)
+
+    timed_execute_sql.instrumented = True
+    database.execute_sql = timed_execute_sql
+
+
+def count_api_call() -> None:
+    """+1 запрос к Bot API у текущего вызова обработчика"""
+    stats = current_stats.get()
+    if stats is not None:
+        with stats.lock:
+            stats.api_calls += 1
+
+
+def observe_api_call(method_name: str, seconds: float) -> None:
+    API_DURATION.observe(seconds, method_name)
+    count_api_call()
+
+
+def gauge(name: str, help_text: str, collect, labels=(),
+          kind=Gauge) -> Gauge:
+    """
+    Gauge (или Summary) с именем name. Уже зарегистрированный снимает
+    collect
+    """
+    for metric in REGISTRY:
+        if metric.name == name:
+            metric.collect = collect
+            return metric
+    return kind(name, help_text, collect, labels)
+
+
+def outbound_waits(stats: dict) -> dict:
+    """{(приоритет,): (отправлено, суммарное ожидание)} диспетчера"""
+    return {(priority,): (sent, stats['wait_seconds'][priority])
+            for priority, sent in stats['sent'].items()}
+
+
+def shard_stats(executor, key=None) -> dict:
+    """{(номер шарда,): статистика или её поле key} пула обновлений"""
+    return {(str(number),): stats if key is None else stats[key]
+            for number, stats in enumerate(executor.stats()['shards'])}
+
+
+def install(database, executor=None) -> None:
+    """
+    Подключаем счётчики к б/д, диспетчеру Bot API и пулу обновлений.
+    Повторный вызов не добавляет счётчиков и метрик
+    """
+    from outbound import dispatcher
+
+    instrument_database(database)
+    if observe_api_call not in dispatcher.observers:
+        dispatcher.observers.append(observe_api_call)
+    gauge('bot_outbound_queue_depth', 'Запросы к Bot API в очереди',
+          lambda: {(priority,): depth for priority, depth
+                   in dispatcher.stats()['queue_depth'].items()},
+          ['priority'])
+    gauge('bot_outbound_wait_seconds', 'Ожидание запроса в очереди Bot API',
+          lambda: outbound_waits(dispatcher.stats()), ['priority'],
+          Summary)
+    gauge('bot_outbound_max_wait_seconds',
+          'Самое долгое ожидание в очереди Bot API',
+          lambda: {(priority,): seconds for priority, seconds
+                   in dispatcher.stats()['max_wait_seconds'].items()},
+          ['priority'])
+    if executor is not None:
+        gauge('bot_update_queue_depth', 'Обновления в очереди шардов',
+              lambda: {(): executor.stats()['queue_depth']})
+        gauge('bot_update_shard_queue_depth', 'Обновления в очереди шарда',
+              lambda: shard_stats(executor, 'queue_depth'), ['shard'])
+        gauge('bot_update_shard_wait_seconds',
+              'Ожидание обновления в очереди шарда',
+              lambda: {labels: (stats['processed'], stats['wait_seconds'])
+                       for labels, stats
+                       in shard_stats(executor).items()},
+              ['shard'], Summary)
+        gauge('bot_update_shard_max_latency_seconds',
+              'Самое долгое время обновления от очереди до конца обработки',
+              lambda: shard_stats(executor, 'max_latency_seconds'),
+              ['shard'])
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type',
+                         'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        logger.debug(f'Метрики: {format % args}')
+
+
+def start_server(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    """Отдаём /metrics из фонового потока. port=0 - не отдаём"""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        logger.error(f'Метрики недоступны на {host}:{port}: {e}')
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='Metrics',
+                     daemon=True).start()
+    logger.info(f'Метрики: http://{host}:{port}/metrics')
+    return server
@@ -0,0 +1,272 @@
+"""
+Версионные миграции схемы б/д.
+
+Каждая миграция - функция, которая переводит схему на одну версию вперёд.
+Номер последней применённой миграции хранится в таблице SchemaVersion.
+Новая б/д сразу создаётся по актуальным моделям и помечается последней
+версией. Проверка планов запросов: python migrations.py --check
+"""
+import sys
+
+from peewee import fn
+from playhouse.migrate import SchemaMigrator, migrate, make_index_name
+
+from database import is_sqlite
+from models import (
+    db,
+    create_models,
+    Task,
+    TaskAttachment,
+    TaskDailyStats,
+    SchemaVersion,
+)
+from queries import (
+    page_query,
+    tasks_in_range,
+    rebuild_daily_stats,
+    report_query,
+    task_attachments,
+)
+from search import create_index as create_search_index
+
+
+def add_missing_indexes(migrator, table, *column_sets):
+    """Добавляем индексы, которых ещё нет в таблице"""
+    existing = {index.name for index in db.get_indexes(table)}
+    migrate(*(
+        migrator.add_index(table, columns)
+        for columns in column_sets
+        if make_index_name(table, columns) not in existing
+    ))
+
+
+def migration_0001_task_dates(migrator):
+    """
+    Переводим даты задач из строк dd/mm/yyyy в сортируемые yyyy-mm-dd.
+    Пустые строки становятся NULL, на даты добавляются индексы
+    """
+    columns = {column.name: column for column in db.get_columns('task')}
+    if not columns['date_start'].null:
+        migrate(
+            migrator.drop_not_null('task', 'date_start'),
+            migrator.drop_not_null('task', 'date_finish'),
+        )
+    for field in (Task.date_start, Task.date_finish):
+        Task.update({field: None}).where(field == '').execute()
+        Task.update({
+            field: fn.substr(field, 7, 4).concat('-')
+            .concat(fn.substr(field, 4, 2)).concat('-')
+            .concat(fn.substr(field, 1, 2))
+        }).where(field ** '__/__/____').execute()
+    add_missing_indexes(migrator, 'task', ('date_start',), ('date_finish',))
+
+
+def migration_0002_task_lookup_indexes(migrator):
+    """Составные индексы для поиска задач исполнителя/менеджера по статусу"""
+    add_missing_indexes(migrator, 'task',
+                        ('id_worker', 'status'), ('id_manager', 'status'))
+
+
+def migration_0003_task_daily_stats(migrator):
+    """Дневная сводка начатых/завершённых задач по уже сохранённым задачам"""
+    TaskDailyStats.create_table()
+    rebuild_daily_stats()
+
+
+def migration_0004_task_foreign_keys(migrator):
+    """
+    Внешние ключи task.id_worker/id_manager на исполнителя и менеджера.
+    SQLite не добавляет их к существующей таблице - пересоздаём task
+    с теми же данными и индексами
+    """
+    if not is_sqlite(db):
+        migrate(
+            migrator.add_foreign_key_constraint(
+                'task', 'id_worker', 'userworker', 'user_id'),
+            migrator.add_foreign_key_constraint(
+                'task', 'id_manager', 'usermanager', 'user_id'),
+        )
+        return
+
+    rebuild_sqlite_table(Task)
+
+
+def rebuild_sqlite_table(model) -> None:
+    """
+    Пересоздаём таблицу model по модели с теми же данными: так SQLite
+    получает внешние ключи существующей таблицы. Индексы - по модели
+    """
+    table = model._meta.table_name
+    db.execute_sql(f'ALTER TABLE "{table}" RENAME TO "{table}_old"')
+    for index in db.get_indexes(f'{table}_old'):
+        if not index.name.startswith('sqlite_'):
+            db.execute_sql(f'DROP INDEX "{index.name}"')
+    model.create_table()
+    # Колонки, добавленные следующими миграциями, получат значения
+    # по умолчанию
+    existing = {column.name for column in db.get_columns(f'{table}_old')}
+    columns = ', '.join(f'"{field.column_name}"'
+                        for field in model._meta.sorted_fields
+                        if field.column_name in existing)
+    db.execute_sql(f'INSERT INTO "{table}" ({columns}) '
+                   f'SELECT {columns} FROM "{table}_old"')
+    db.execute_sql(f'DROP TABLE "{table}_old"')
+
+
+def migration_0005_task_version(migrator):
+    """Версия задачи для кэша карточек (task_cards.py)"""
+    columns = {column.name for column in db.get_columns('task')}
+    if 'version' not in columns:
+        migrate(migrator.add_column('task', 'version', Task.version))
+
+
+def migration_0006_task_search(migrator):
+    """Полнотекстовый поиск по названиям задач (search.py)"""
+    create_search_index()
+
+
+def migration_0007_task_search_terms(migrator):
+    """
+    Индекс поиска, заполненный триггерами с replace(), пересоздаём по
+    словам из Python (search.py): в нём есть токены из слов, которые
+    триггеры не разделили
+    """
+    if not is_sqlite(db):
+        return
+    triggers = db.execute_sql(
+        "SELECT name FROM sqlite_master "
+        "WHERE type = 'trigger' AND name LIKE 'task_search_%'").fetchall()
+    if not triggers:
+        return
+    for name, in triggers:
+        db.execute_sql(f'DROP TRIGGER "{name}"')
+    db.execute_sql('DROP TABLE IF EXISTS "task_search"')
+    create_search_index()
+
+
+def migration_0008_task_attachments(migrator):
+    """Вложения задач (TaskAttachment) для б/д, созданных до них"""
+    TaskAttachment.create_table()
+
+
+def migration_0009_task_attachment_foreign_key(migrator):
+    """
+    Внешний ключ вложения на задачу с ON DELETE CASCADE. Вложения уже
+    удалённых задач удаляем - иначе ключ не добавить
+    """
+    table = TaskAttachment._meta.table_name
+    if db.get_foreign_keys(table):
+        return
+    (TaskAttachment
+     .delete()
+     .where(TaskAttachment.task_id.not_in(Task.select(Task.task_id)))
+     .execute())
+    if is_sqlite(db):
+        rebuild_sqlite_table(TaskAttachment)
+    else:
+        migrate(migrator.add_foreign_key_constraint(
+            table, 'task_id', 'task', 'task_id', on_delete='CASCADE'))
+
+
+MIGRATIONS = (
+    (1, migration_0001_task_dates),
+    (2, migration_0002_task_lookup_indexes),
+    (3, migration_0003_task_daily_stats),
+    (4, migration_0004_task_foreign_keys),
+    (5, migration_0005_task_version),
+    (6, migration_0006_task_search),
+    (7, migration_0007_task_search_terms),
+    (8, migration_0008_task_attachments),
+    (9, migration_0009_task_attachment_foreign_key),
+)
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version() -> int:
+    """Номер последней применённой миграции, 0 - если миграций не было"""
+    return SchemaVersion.select(fn.MAX(SchemaVersion.version)).scalar() or 0
+
+
+def run_migrations() -> int:
+    """
+    Создаём таблицы и применяем недостающие миграции.
+    Возвращаем версию схемы после запуска
+    """
+    fresh = not Task.table_exists()
+    SchemaVersion.create_table()
+
+    if fresh:
+        create_models()
+        create_search_index()
+        SchemaVersion.create(version=LATEST_VERSION)
+        return LATEST_VERSION
+
+    migrator = SchemaMigrator.from_database(db.obj)
+    version = current_version()
+    for number, migration in MIGRATIONS:
+        if number <= version:
+            continue
+        with db.atomic():
+            migration(migrator)
+            SchemaVersion.create(version=number)
+        version = number
+
+    # Таблицы моделей, появившиеся позже существующей б/д
+    create_models()
+    # Задачи, добавленные в обход index_tasks (search.py)
+    create_search_index()
+    return version
+
+
+# Запросы обработчиков, которые выполняются на каждое нажатие
+HOT_QUERIES = {
+    'handle_accept_task': lambda: Task.select().where(
+        (Task.id_worker == 1) & (Task.status == 'process') &
+        (Task.task_id == 1)),
+    'handle_fin_task_task_id': lambda: Task.select().where(
+        (Task.status == 'work') & (Task.id_worker == 1)),
+    'finishing_task': lambda: Task.select().where(
+        (Task.task_id == 1) & (Task.id_worker == 1) &
+        (Task.status == 'finishing')),
+    'assigned_tasks': lambda: Task.select().where(
+        Task.task_id.in_([1, 2]) & (Task.id_manager == 1) &
+        (Task.status == 'process')),
+    'handler_task_list_to_worker_need_worker': lambda: Task.select().where(
+        (Task.id_worker == 1) & (Task.id_manager == 1)),
+    'task_page': lambda: page_query(
+        Task.select().where((Task.id_worker == 1) & (Task.status == 'work')),
+        after=1),
+    'task_list_page': lambda: page_query(
+        tasks_in_range('2024-01-01', '2024-01-31', status='work'), after=1),
+    'report_counts': lambda: report_query('manager', 1, '2024-01-01',
+                                          '2024-01-31'),
+    'task_attachments': lambda: task_attachments(1),
+}
+
+
+def check_query_plans() -> dict:
+    """
+    Прогоняем горячие запросы через EXPLAIN QUERY PLAN (только SQLite).
+    Возвращаем {имя запроса: план} для запросов с полным сканом таблицы
+    """
+    full_scans = {}
+    for name, build_query in HOT_QUERIES.items():
+        sql, params = build_query().sql()
+        plan = [row[-1] for row in
+                db.execute_sql(f'EXPLAIN QUERY PLAN {sql}', params)]
+        if any(step.startswith('SCAN') for step in plan):
+            full_scans[name] = plan
+    return full_scans
+
+
+if __name__ == '__main__':
+    print(f'Версия схемы: {run_migrations()}')
+    if '--check' in sys.argv:
+        if not is_sqlite(db):
+            sys.exit('Проверка планов запросов работает только для SQLite')
+        full_scans = check_query_plans()
+        for name, plan in full_scans.items():
+            print(f'{name}: {"; ".join(plan)}')
+        if full_scans:
+            sys.exit('Есть запросы с полным сканированием таблицы')
+        print('Все горячие запросы используют индексы')
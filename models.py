@@ -1,14 +1,25 @@
 from peewee import (
     CharField,
     IntegerField,
+    BigIntegerField,
+    DateField,
     Model,
-    SqliteDatabase,
     AutoField,
+    BigAutoField,
+    TimestampField,
+    TextField,
+    CompositeKey,
+    ForeignKeyField,
+    SQL,
+    DatabaseProxy,
 )
 
-from config import DB_PATH
+from database import connect_database
 
-db = SqliteDatabase(DB_PATH)
+# Б/д по DB_URL. Прокси, чтобы тесты могли подставить другую б/д
+# (db.initialize) для всех моделей и модулей, импортировавших db
+db = DatabaseProxy()
+db.initialize(connect_database())
 
 
 class BaseModel(Model):
@@ -17,30 +28,97 @@ class BaseModel(Model):
 
 
 class UserManager(BaseModel):
-    user_id = AutoField(primary_key=True)
+    user_id = BigAutoField(primary_key=True)
     user_name = CharField()
 
 
 class UserWorker(BaseModel):
-    user_id = AutoField(primary_key=True)
+    user_id = BigAutoField(primary_key=True)
     user_name = CharField()
 
 
 class Task(BaseModel):
     task_id = AutoField(primary_key=True)
     task_name = CharField()
-    id_worker = IntegerField()
-    id_manager = IntegerField()
-    date_start = CharField()
-    date_finish = CharField()
+    # task.id_worker/task.id_manager - id пользователя, task.worker и
+    # task.manager - сам пользователь (запрос, если он не выбран join).
+    # Отдельные индексы не нужны: их покрывают составные (…, status)
+    worker = ForeignKeyField(UserWorker, column_name='id_worker',
+                             object_id_name='id_worker', backref='tasks',
+                             index=False)
+    manager = ForeignKeyField(UserManager, column_name='id_manager',
+                              object_id_name='id_manager', backref='tasks',
+                              index=False)
+    date_start = DateField(null=True, index=True)
+    date_finish = DateField(null=True, index=True)
     status = CharField()
     """
-    Статус может быть: 
+    Статус может быть:
     process: Значит что задание создаётся
     work: Находится у worker
     finishing: worker выбрал для сдачи
-    finish: Задание завершено 
+    finish: Задание завершено
+
+    Даты хранятся как yyyy-mm-dd, пока работа не начата/не завершена - NULL
+    """
+    # +1 при каждом изменении карточки задачи: статус, даты, вложения
+    version = IntegerField(default=0, constraints=[SQL('DEFAULT 0')])
+
+    class Meta:
+        indexes = (
+            (('id_worker', 'status'), False),
+            (('id_manager', 'status'), False),
+        )
+
+
+class TaskAttachment(BaseModel):
+    """
+    Вложение задачи: файл Telegram (file_id) или текст.
+    Один и тот же файл (file_unique_id) хранится у задачи один раз,
+    удаляется вместе с задачей (ON DELETE CASCADE)
     """
+    # Отдельный индекс не нужен: его покрывает (task_id, file_unique_id)
+    task = ForeignKeyField(Task, column_name='task_id',
+                           object_id_name='task_id', backref='attachments',
+                           on_delete='CASCADE', index=False)
+    kind = CharField()  # photo, video, audio, document или text
+    file_id = CharField(null=True)
+    file_unique_id = CharField(null=True)
+    caption = TextField(null=True)
+
+    class Meta:
+        indexes = (
+            (('task_id', 'file_unique_id'), True),
+        )
+
+
+class TaskDailyStats(BaseModel):
+    """
+    Сколько задач пользователь начал и завершил за день.
+    role - manager или worker, user_id - id_manager или id_worker задачи.
+    Обновляется вместе со сменой статуса задачи (см. queries.py)
+    """
+    role = CharField()
+    user_id = BigIntegerField()
+    day = DateField()
+    started = IntegerField(default=0)
+    finished = IntegerField(default=0)
+
+    class Meta:
+        primary_key = CompositeKey('role', 'user_id', 'day')
+
+
+class SchemaVersion(BaseModel):
+    """Применённые миграции схемы (см. migrations.py)"""
+    version = IntegerField(primary_key=True)
+    applied_at = TimestampField()
+
+
+class BotState(BaseModel):
+    """Состояния диалогов пользователей (см. state_storage.py)"""
+    key = CharField(primary_key=True)
+    state = CharField(null=True)
+    data = TextField(default='{}')
 
 
 def create_models():
@@ -0,0 +1,337 @@
+"""
+Диспетчер исходящих запросов к Bot API.
+
+Все запросы бота с chat_id проходят через единую очередь с приоритетами:
+ответы пользователю (INTERACTIVE) отправляются раньше массовых
+уведомлений (BULK). Очередь соблюдает лимиты Telegram: общий
+(около 30 сообщений/с) и на чат (около 1 сообщения/с с небольшим
+запасом), а на ответ 429 ждёт retry_after и повторяет запрос.
+
+Синхронный бот подключается через install(), асинхронный режим
+запрашивает разрешение на отправку через acquire_async().
+Рассылка нескольким получателям сразу - fan_out().
+"""
+import asyncio
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from telebot import apihelper
+
+from config import (
+    OUTBOUND_GLOBAL_RATE,
+    OUTBOUND_CHAT_RATE,
+    OUTBOUND_CHAT_BURST,
+    OUTBOUND_MAX_RETRIES,
+    FAN_OUT_WORKERS,
+)
+
+logger = logging.getLogger('manager_bot_logger')
+
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BULK: 'bulk'}
+
+_local = threading.local()
+
+
+def current_priority() -> int:
+    """Приоритет запросов, отправляемых из текущего потока"""
+    return getattr(_local, 'priority', INTERACTIVE)
+
+
+@contextlib.contextmanager
+def bulk():
+    """Запросы внутри блока уходят в очередь массовых уведомлений"""
+    previous = current_priority()
+    _local.priority = BULK
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate: float, capacity: float,
+                 clock=time.monotonic) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = clock()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_at(self, now: float) -> float:
+        """Момент, когда в ведре будет целый токен"""
+        self._refill(now)
+        ready = now
+        if self.tokens < 1:
+            ready = now + (1 - self.tokens) / self.rate
+        return max(ready, self.blocked_until)
+
+    def consume(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, until: float) -> None:
+        self.blocked_until = max(self.blocked_until, until)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+
+class Ticket:
+    """Ожидание разрешения на один запрос в чат"""
+    __slots__ = ('priority', 'seq', 'chat_id', 'grant', 'enqueued')
+
+    def __init__(self, priority, seq, chat_id, grant, enqueued) -> None:
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.grant = grant
+        self.enqueued = enqueued
+
+
+class OutboundDispatcher:
+    """
+    Очередь исходящих запросов с лимитами и приоритетами. clock -
+    часы для лимитов и времени ожидания
+    """
+
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE,
+                 chat_rate: float = OUTBOUND_CHAT_RATE,
+                 chat_burst: float = OUTBOUND_CHAT_BURST,
+                 max_retries: int = OUTBOUND_MAX_RETRIES,
+                 clock=time.monotonic) -> None:
+        self.clock = clock
+        self.global_bucket = TokenBucket(global_rate, global_rate, clock)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.chat_buckets = {}
+        self.waiting = []
+        self.seq = 0
+        self.cond = threading.Condition()
+        self.scheduler = None
+        self.metrics = {
+            'sent': dict.fromkeys(PRIORITY_NAMES.values(), 0),
+            'wait_seconds': dict.fromkeys(PRIORITY_NAMES.values(), 0.0),
+            'max_wait_seconds': dict.fromkeys(PRIORITY_NAMES.values(), 0.0),
+            'retries_429': 0,
+        }
+        # observer(method_name, seconds) после каждого запроса к Bot API
+        self.observers = []
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst,
+                                 self.clock)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _enqueue(self, chat_id, priority: int, grant) -> None:
+        with self.cond:
+            if self.scheduler is None:
+                self.scheduler = threading.Thread(
+                    target=self._schedule, name='OutboundDispatcher',
+                    daemon=True)
+                self.scheduler.start()
+            self.seq += 1
+            self.waiting.append(Ticket(priority, self.seq, str(chat_id),
+                                       grant, self.clock()))
+            self.cond.notify()
+
+    def acquire(self, chat_id, priority: Optional[int] = None) -> None:
+        """Ждём, пока запрос в чат можно отправить"""
+        granted = threading.Event()
+        if priority is None:
+            priority = current_priority()
+        self._enqueue(chat_id, priority, granted.set)
+        granted.wait()
+
+    async def acquire_async(self, chat_id, priority: int = INTERACTIVE):
+        """acquire() для цикла asyncio: ждём без блокировки потока"""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        self._enqueue(
+            chat_id, priority,
+            lambda: loop.call_soon_threadsafe(granted.set_result, None))
+        await granted
+
+    def backoff(self, chat_id, retry_after: float) -> None:
+        """Telegram ответил 429: чат молчит retry_after секунд"""
+        with self.cond:
+            self.metrics['retries_429'] += 1
+            self._chat_bucket(str(chat_id)).block(
+                self.clock() + retry_after)
+
+    def _pick(self, now: float):
+        """
+        Первый по приоритету запрос, чат которого может принять сообщение.
+        Если такого нет - через сколько секунд он появится
+        """
+        delay = None
+        for ticket in sorted(self.waiting,
+                             key=lambda t: (t.priority, t.seq)):
+            ready = self._chat_bucket(ticket.chat_id).ready_at(now)
+            if ready <= now:
+                return ticket, None
+            if delay is None or ready - now < delay:
+                delay = ready - now
+        return None, delay
+
+    def _grant(self, ticket: Ticket, now: float) -> None:
+        self.waiting.remove(ticket)
+        self.global_bucket.consume(now)
+        self._chat_bucket(ticket.chat_id).consume(now)
+
+        name = PRIORITY_NAMES[ticket.priority]
+        waited = now - ticket.enqueued
+        self.metrics['sent'][name] += 1
+        self.metrics['wait_seconds'][name] += waited
+        self.metrics['max_wait_seconds'][name] = max(
+            self.metrics['max_wait_seconds'][name], waited)
+        ticket.grant()
+
+    def _schedule(self) -> None:
+        last_cleanup = self.clock()
+        while True:
+            with self.cond:
+                while not self.waiting:
+                    self.cond.wait()
+                now = self.clock()
+                if now - last_cleanup > 60:
+                    # Забываем чаты, которые давно ничего не получали
+                    self.chat_buckets = {
+                        chat_id: bucket
+                        for chat_id, bucket in self.chat_buckets.items()
+                        if not bucket.idle(now)
+                    }
+                    last_cleanup = now
+
+                delay = self.global_bucket.ready_at(now) - now
+                if delay <= 0:
+                    ticket, delay = self._pick(now)
+                    if ticket is not None:
+                        self._grant(ticket, now)
+                        continue
+                self.cond.wait(timeout=delay)
+
+    def stats(self) -> dict:
+        """Глубина очереди и время ожидания по приоритетам"""
+        with self.cond:
+            depth = dict.fromkeys(PRIORITY_NAMES.values(), 0)
+            for ticket in self.waiting:
+                depth[PRIORITY_NAMES[ticket.priority]] += 1
+            return {
+                'queue_depth': depth,
+                'sent': dict(self.metrics['sent']),
+                'wait_seconds': dict(self.metrics['wait_seconds']),
+                'max_wait_seconds': dict(self.metrics['max_wait_seconds']),
+                'retries_429': self.metrics['retries_429'],
+            }
+
+    def request(self, method, url, params=None, files=None, **kwargs):
+        """
+        Отправка запроса синхронного бота (apihelper.CUSTOM_REQUEST_SENDER).
+        Запросы без chat_id (getUpdates, getMe, ...) идут мимо очереди
+        """
+        session = apihelper._get_req_session()
+        chat_id = (params or {}).get('chat_id')
+        if chat_id is None:
+            return self.send(session, method, url, params=params,
+                             files=files, **kwargs)
+
+        priority = current_priority()
+        for attempt in range(self.max_retries + 1):
+            self.acquire(chat_id, priority)
+            rewind(files)
+            response = self.send(session, method, url, params=params,
+                                 files=files, **kwargs)
+            if response.status_code != 429 or attempt == self.max_retries:
+                return response
+            self.backoff(chat_id, retry_after(response))
+
+    def send(self, session, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            return session.request(method, url, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            for observer in self.observers:
+                observer(url.rsplit('/', 1)[-1], elapsed)
+
+
+def rewind(files: Optional[dict]) -> None:
+    """Перед повтором запроса читаем загружаемые файлы с начала"""
+    for value in (files or {}).values():
+        file = value[1] if isinstance(value, tuple) else value
+        if hasattr(file, 'seek'):
+            file.seek(0)
+
+
+def retry_after(response) -> float:
+    """Сколько ждать после ответа 429"""
+    try:
+        parameters = response.json().get('parameters') or {}
+    except ValueError:
+        parameters = {}
+    return float(parameters.get('retry_after', 1))
+
+
+dispatcher = OutboundDispatcher()
+
+
+def install() -> None:
+    """Направляем все запросы синхронного бота через диспетчер"""
+    apihelper.CUSTOM_REQUEST_SENDER = dispatcher.request
+
+
+def fan_out(func, items, max_workers: Optional[int] = None) -> list:
+    """
+    Вызываем func(item) для всех получателей параллельно и ждём все
+    вызовы: рассылка N исполнителям занимает время одного запроса,
+    а не N (в пределах лимитов диспетчера). Приоритет текущего потока
+    действует и в потоках рассылки. Ошибка одного получателя не мешает
+    остальным. Возвращаем получателей, которым отправить не удалось
+    """
+    items = list(items)
+    priority = current_priority()
+    # Контекст журнала и метрик обработчика - в потоки рассылки
+    context = contextvars.copy_context()
+
+    def send(item):
+        previous = current_priority()
+        _local.priority = priority
+        try:
+            func(item)
+            return None
+        except Exception as e:
+            logger.error(f'Ошибка рассылки {item}: {e}')
+            return item
+        finally:
+            _local.priority = previous
+
+    # Асинхронный режим только собирает запросы, потоки там не нужны
+    if (len(items) < 2 or
+            apihelper.CUSTOM_REQUEST_SENDER != dispatcher.request):
+        failed = [send(item) for item in items]
+    else:
+        workers = min(max_workers or FAN_OUT_WORKERS, len(items))
+        with ThreadPoolExecutor(workers,
+                                thread_name_prefix='FanOut') as executor:
+            failed = list(executor.map(
+                lambda item: context.copy().run(send, item), items))
+    return [item for item in failed if item is not None]
@@ -0,0 +1,211 @@
+import datetime
+
+from peewee import fn
+
+from albums import attachment_fields
+from models import (
+    Task,
+    TaskAttachment,
+    TaskDailyStats,
+    UserManager,
+    UserWorker,
+)
+
+DATE_FORMAT = '%d/%m/%Y'
+
+
+def parse_borders(text: str) -> tuple:
+    """
+    Разбираем период из сообщения 'dd/mm/yyyy - dd/mm/yyyy'.
+    При неверном формате поднимается ValueError
+    """
+    left_border, right_border = text.split(' - ')
+    left_date = datetime.datetime.strptime(left_border.strip(),
+                                           DATE_FORMAT).date()
+    right_date = datetime.datetime.strptime(right_border.strip(),
+                                            DATE_FORMAT).date()
+    return left_date, right_date
+
+
+def format_date(value) -> str:
+    """Дата задачи в формате dd/mm/yyyy. Пустая дата - пустая строка"""
+    if value is None:
+        return ''
+    return value.strftime(DATE_FORMAT)
+
+
+def tasks_in_range(left_date, right_date, status=None,
+                   id_manager=None, id_worker=None):
+    """
+    Задачи, начатые или завершенные в периоде [left_date, right_date].
+    Незаполненные даты (NULL) в период не попадают.
+    OR двух BETWEEN даёт MULTI-INDEX OR и сортировку во временном
+    B-дереве, поэтому task_id берём двумя проходами по индексам
+    date_start/date_finish (UNION ALL), а задачи - по первичному ключу в
+    порядке task_id. Ограничение: страница (page_query) всё равно
+    читает из индексов все task_id периода, но только их, без строк
+    """
+    started = Task.select(Task.task_id).where(
+        Task.date_start.between(left_date, right_date))
+    finished = Task.select(Task.task_id).where(
+        Task.date_finish.between(left_date, right_date))
+    query = Task.select().where(Task.task_id.in_(started + finished))
+    if status is not None:
+        query = query.where(Task.status == status)
+    if id_manager is not None:
+        query = query.where(Task.id_manager == id_manager)
+    if id_worker is not None:
+        query = query.where(Task.id_worker == id_worker)
+    return query.order_by(Task.task_id)
+
+
+# Сколько задач на одной странице списка
+PAGE_SIZE = 10
+
+
+def page_query(query, after=None, before=None, size=PAGE_SIZE):
+    """
+    Запрос одной страницы по курсору task_id (keyset) вместо OFFSET:
+    после задачи after или перед задачей before. Берём на одну задачу
+    больше страницы, чтобы узнать, есть ли следующая
+    """
+    if before is not None:
+        return (query.where(Task.task_id < before)
+                .order_by(Task.task_id.desc()).limit(size + 1))
+    if after is not None:
+        query = query.where(Task.task_id > after)
+    return query.order_by(Task.task_id).limit(size + 1)
+
+
+def task_page(query, after=None, before=None, size=PAGE_SIZE) -> tuple:
+    """
+    Страница задач запроса query, упорядоченная по task_id.
+    Возвращаем (задачи, есть ли предыдущая, есть ли следующая)
+    """
+    tasks = list(page_query(query, after, before, size))
+    more = len(tasks) > size
+    tasks = tasks[:size]
+    if before is not None:
+        return tasks[::-1], more, True
+    return tasks, after is not None, more
+
+
+def tasks_with_users(*users):
+    """
+    Задачи вместе с их пользователями (UserManager, UserWorker) одним
+    запросом: task.manager/task.worker уже загружены
+    """
+    query = Task.select(Task, *users)
+    for user in users:
+        query = query.join_from(Task, user)
+    return query
+
+
+def task_card(task_id) -> Task:
+    """
+    Карточка задачи одним запросом: менеджер, исполнитель и has_files -
+    есть ли у задачи вложения
+    """
+    has_files = fn.EXISTS(TaskAttachment
+                          .select(TaskAttachment.id)
+                          .where(TaskAttachment.task_id == Task.task_id))
+    return (tasks_with_users(UserManager, UserWorker)
+            .select_extend(has_files.alias('has_files'))
+            .where(Task.task_id == task_id)
+            .get())
+
+
+def touch_tasks(task_ids) -> None:
+    """
+    Карточки задач изменились: +1 к версии одним UPDATE, без чтения.
+    Вызывать при каждой смене статуса и дат, в той же транзакции
+    """
+    (Task
+     .update(version=Task.version + 1)
+     .where(Task.task_id.in_(list(task_ids)))
+     .execute())
+
+
+# Чей счётчик в дневной сводке обновляет задача
+STATS_ROLES = (
+    ('manager', Task.id_manager),
+    ('worker', Task.id_worker),
+)
+
+
+def count_day(task: Task, day, column) -> None:
+    """
+    +1 к started/finished задачи в дневной сводке менеджера и исполнителя.
+    Вызывать в той же транзакции, что и смену статуса задачи
+    """
+    for role, field in STATS_ROLES:
+        TaskDailyStats.insert(
+            role=role, user_id=getattr(task, field.object_id_name),
+            day=day,
+            **{column.name: 1},
+        ).on_conflict(
+            conflict_target=[TaskDailyStats.role, TaskDailyStats.user_id,
+                             TaskDailyStats.day],
+            update={column: column + 1},
+        ).execute()
+
+
+def rebuild_daily_stats() -> None:
+    """Пересчитываем дневную сводку по таблице задач (COUNT/GROUP BY)"""
+    TaskDailyStats.delete().execute()
+    for role, field in STATS_ROLES:
+        for date_field, column in ((Task.date_start, TaskDailyStats.started),
+                                   (Task.date_finish,
+                                    TaskDailyStats.finished)):
+            rows = (Task
+                    .select(field, date_field, fn.COUNT(Task.task_id))
+                    .where(date_field.is_null(False))
+                    .group_by(field, date_field)
+                    .tuples())
+            for user_id, day, count in rows:
+                TaskDailyStats.insert(
+                    role=role, user_id=user_id, day=day,
+                    **{column.name: count},
+                ).on_conflict(
+                    conflict_target=[TaskDailyStats.role,
+                                     TaskDailyStats.user_id,
+                                     TaskDailyStats.day],
+                    update={column: count},
+                ).execute()
+
+
+def report_query(role: str, user_id: int, left_date, right_date):
+    """Суммы сводки пользователя за период: по строке сводки на день"""
+    return (TaskDailyStats
+            .select(fn.SUM(TaskDailyStats.started),
+                    fn.SUM(TaskDailyStats.finished))
+            .where((TaskDailyStats.role == role) &
+                   (TaskDailyStats.user_id == user_id) &
+                   TaskDailyStats.day.between(left_date, right_date)))
+
+
+def report_counts(role: str, user_id: int, left_date, right_date) -> tuple:
+    """(начато, завершено) задач пользователя за период"""
+    started, finished = report_query(role, user_id, left_date,
+                                     right_date).tuples().get()
+    return started or 0, finished or 0
+
+
+def save_attachments(task_ids, message) -> None:
+    """
+    Сохраняем вложение сообщения у задач. Файл, который уже есть у
+    задачи (тот же file_unique_id), второй раз не сохраняется
+    """
+    fields = attachment_fields(message)
+    TaskAttachment.insert_many(
+        [dict(fields, task_id=task_id) for task_id in task_ids]
+    ).on_conflict_ignore().execute()
+    touch_tasks(task_ids)
+
+
+def task_attachments(task_id: int):
+    """Вложения задачи в порядке добавления"""
+    return (TaskAttachment
+            .select()
+            .where(TaskAttachment.task_id == task_id)
+            .order_by(TaskAttachment.id))
@@ -0,0 +1,103 @@
+"""
+Кэш отчётов: (начато, завершено) задач пользователя за период.
+
+Ключ - (роль, пользователь, первый день, последний день): один и тот же
+период, введённый по-разному, даёт одну запись. Отчёт меняется только
+когда у задачи появляется дата начала или завершения (count_day в
+queries.py). После такой смены статуса handler_worker.py вызывает
+task_counted - сбрасываются только периоды менеджера и исполнителя
+задачи, в которые попадает этот день. Другие процессы узнают об
+изменении через invalidation_hooks (см. update_queue.py) и сбрасывают
+все отчёты пользователя через apply_invalidation. Отчёт живёт не
+дольше USER_CACHE_TTL секунд: столько update_queue.py хранит сообщения
+о сбросе.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from cache import CACHE_REQUESTS
+from config import REPORT_CACHE_SIZE, USER_CACHE_TTL
+from queries import STATS_ROLES, report_counts
+
+# Вызываются с (role, user_id) после task_counted в этом процессе
+invalidation_hooks = []
+
+
+class ReportCache:
+    """
+    LRU отчётов: ключ -> (отчёт, когда устареет). Поколение
+    пользователя (и всего кэша - epoch) растёт при каждом сбросе: отчёт,
+    посчитанный до сброса, в кэш не попадёт
+    """
+
+    def __init__(self, size: int = REPORT_CACHE_SIZE,
+                 ttl: float = USER_CACHE_TTL) -> None:
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.epoch = 0
+
+    def counts(self, role: str, user_id: int, left_date,
+               right_date) -> tuple:
+        user = (role, int(user_id))
+        key = (*user, left_date, right_date)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.entries.move_to_end(key)
+                CACHE_REQUESTS.inc('report', 'hit')
+                return entry[0]
+            generation = (self.epoch, self.generations.get(user, 0))
+        CACHE_REQUESTS.inc('report', 'miss')
+        counts = report_counts(role, user_id, left_date, right_date)
+        with self.lock:
+            if (self.epoch, self.generations.get(user, 0)) == generation:
+                self.entries[key] = (counts, now + self.ttl)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        return counts
+
+    def invalidate(self, role: str, user_id: int, day=None) -> None:
+        """Сбрасываем периоды пользователя с днём day, без day - все"""
+        user = (role, int(user_id))
+        with self.lock:
+            self.generations[user] = self.generations.get(user, 0) + 1
+            for key in list(self.entries):
+                if key[:2] == user and (day is None or
+                                        key[2] <= day <= key[3]):
+                    del self.entries[key]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.epoch += 1
+            self.entries.clear()
+
+
+reports = ReportCache()
+
+
+def counts(role: str, user_id: int, left_date, right_date) -> tuple:
+    """(начато, завершено) задач пользователя за период, из кэша"""
+    return reports.counts(role, user_id, left_date, right_date)
+
+
+def task_counted(task, day) -> None:
+    """
+    У задачи появилась дата начала/завершения day. Вызывать после
+    фиксации транзакции с count_day
+    """
+    for role, field in STATS_ROLES:
+        user_id = getattr(task, field.object_id_name)
+        reports.invalidate(role, user_id, day)
+        for hook in invalidation_hooks:
+            hook(role, user_id)
+
+
+def apply_invalidation(role: str, user_id: int) -> None:
+    """Отчёты пользователя изменились в другом процессе"""
+    reports.invalidate(role, user_id)
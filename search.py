@@ -0,0 +1,165 @@
+"""
+Полнотекстовый поиск задач по названию (SQLite FTS5).
+
+task_search - таблица FTS5 без копии данных (content=''). Каждое слово
+названия хранится дважды, с участником задачи: m<id_manager>_слово и
+w<id_worker>_слово. Список документов такого токена - задачи одного
+пользователя с этим словом, поэтому время запроса зависит от числа
+задач пользователя, а не от всей б/д: частое слово не заставляет
+читать задачи всех пользователей, а bm25 считается по задачам
+пользователя. Начало слова ищется как префикс токена.
+
+Слова - буквы и цифры названия (split_words), всё остальное разделяет слова.
+Токены считаются в Python и добавляются в индекс index_tasks() в той
+же транзакции, что и задачи (handler_create_tasks). Каждый, кто
+добавляет задачи в task, должен вызвать index_tasks(); пропущенные
+задачи добавляет index_missing_tasks() при запуске (run_migrations),
+до этого они не ищутся. Задачи не удаляются
+и не переименовываются; если это появится, старые токены нужно удалить
+из индекса командой 'delete'. Запрос дополнительно проверяет владельца
+задачи по task.id_manager/id_worker: чужая задача не попадёт в выдачу,
+даже если в индексе окажется лишний токен.
+
+create_index() создаёт таблицу и заполняет её по уже сохранённым
+задачам (миграции 0006, 0007 и новая б/д), а у существующей таблицы
+дополняет пропущенные задачи.
+
+На других б/д поиск идёт через LIKE по названию, без ранжирования.
+"""
+import operator
+import re
+from functools import reduce
+
+from peewee import chunked
+
+from database import is_sqlite
+from models import db, Task
+from queries import PAGE_SIZE
+
+ROLE_TOKENS = {
+    'manager': 'm',
+    'worker': 'w',
+}
+# Больше слов в запросе не учитываем
+MAX_WORDS = 8
+# Задач на один SELECT при заполнении индекса
+INDEX_BATCH = 1000
+# '_' - часть токена m5_отчет, в словах его нет
+WORD = re.compile(r'[^\W_]+')
+
+# '_' - часть токена: m5_отчет не делится на m5 и отчет
+INDEX_SQL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS task_search USING fts5(
+        terms, content='',
+        tokenize="unicode61 remove_diacritics 2 tokenchars '_'")
+"""
+
+INSERT_SQL = 'INSERT INTO task_search(rowid, terms) VALUES (?, ?)'
+
+# Задачи, которых нет в индексе: rowid есть и у таблицы без данных
+MISSING_SQL = """
+    SELECT task_id FROM task
+    WHERE task_id NOT IN (SELECT rowid FROM task_search)
+    ORDER BY task_id
+"""
+
+SEARCH_SQL = """
+    SELECT task.task_id, task.task_name, task.status
+    FROM task_search JOIN task ON task.task_id = task_search.rowid
+    WHERE task_search MATCH ? AND ({owners})
+    ORDER BY bm25(task_search), task.task_id
+    LIMIT ? OFFSET ?
+"""
+
+
+def split_words(text: str) -> list:
+    """Слова текста. unicode61 не сводит ё к е - сводим сами"""
+    return WORD.findall(text.lower().replace('ё', 'е'))
+
+
+def search_terms(task_name: str, id_manager: int, id_worker: int) -> str:
+    """Слова названия с префиксами m<id_manager>_ и w<id_worker>_"""
+    owners = (f'm{int(id_manager)}_', f'w{int(id_worker)}_')
+    return ' '.join(owner + word
+                    for owner in owners for word in split_words(task_name))
+
+
+def index_tasks(task_ids) -> None:
+    """
+    Добавляем задачи в поиск. Вызывать в транзакции их создания при
+    любой вставке в task
+    """
+    if not is_sqlite(db):
+        return
+    for batch in chunked(task_ids, INDEX_BATCH):
+        rows = (Task
+                .select(Task.task_id, Task.task_name,
+                        Task.id_manager, Task.id_worker)
+                .where(Task.task_id.in_(batch))
+                .tuples())
+        db.cursor().executemany(INSERT_SQL, [
+            (task_id, search_terms(task_name, id_manager, id_worker))
+            for task_id, task_name, id_manager, id_worker in rows])
+
+
+def create_index() -> None:
+    """Таблица поиска. Новая таблица заполняется задачами"""
+    if not is_sqlite(db):
+        return
+    exists = db.table_exists('task_search')
+    with db.atomic():
+        db.execute_sql(INDEX_SQL)
+        if not exists:
+            task_ids = Task.select(Task.task_id).order_by(Task.task_id)
+            index_tasks([task_id for task_id, in task_ids.tuples()])
+        else:
+            index_missing_tasks()
+
+
+def index_missing_tasks() -> None:
+    """Добавляем в поиск задачи, вставленные без index_tasks()"""
+    task_ids = [task_id for task_id, in db.execute_sql(MISSING_SQL)]
+    if task_ids:
+        index_tasks(task_ids)
+
+
+def query_words(text: str) -> list:
+    """Слова запроса без знаков препинания и синтаксиса FTS5"""
+    return split_words(text)[:MAX_WORDS]
+
+
+def match_expression(words: list, user_id: int, roles) -> str:
+    """Все слова (и как начало слова) среди задач пользователя в ролях"""
+    owners = [f'{ROLE_TOKENS[role]}{int(user_id)}_' for role in roles]
+    return ' AND '.join(
+        '(' + ' OR '.join(f'"{owner}{word}"*' for owner in owners) + ')'
+        for word in words)
+
+
+def search_tasks(text: str, user_id: int, roles, page: int = 0,
+                 size: int = PAGE_SIZE) -> tuple:
+    """
+    Страница page задач пользователя, подходящих под запрос, лучшие
+    первыми. Возвращаем ([(task_id, task_name, status)], есть ли ещё)
+    """
+    words = query_words(text)
+    if not words or not roles:
+        return [], False
+    if is_sqlite(db):
+        owners = ' OR '.join(f'task.id_{role} = ?' for role in roles)
+        rows = db.execute_sql(
+            SEARCH_SQL.format(owners=owners),
+            (match_expression(words, user_id, roles),
+             *(user_id for _ in roles), size + 1, page * size)).fetchall()
+    else:
+        owners = [getattr(Task, f'id_{role}') == user_id for role in roles]
+        rows = list(Task
+                    .select(Task.task_id, Task.task_name, Task.status)
+                    .where(reduce(operator.or_, owners))
+                    .where(*(Task.task_name.contains(word)
+                             for word in words))
+                    .order_by(Task.task_id.desc())
+                    .limit(size + 1)
+                    .offset(page * size)
+                    .tuples())
+    return rows[:size], len(rows) > size
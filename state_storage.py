@@ -0,0 +1,263 @@
+"""
+Хранилища состояний диалогов для TeleBot.
+
+sqlite - таблица BotState с кэшем в памяти процесса и отложенной записью:
+set_state меняет только словарь, фоновый поток пачками сбрасывает
+изменения в б/д. Состояния переживают перезапуск бота. Кэш - только для
+одного процесса: процессы update_queue.py создают хранилище без кэша
+(cache=False) и читают и пишут BotState напрямую.
+redis - StateRedisStorage из telebot, общий для нескольких процессов
+(нужен пакет redis).
+memory - прежнее StateMemoryStorage.
+"""
+import atexit
+import json
+import logging
+import threading
+from typing import Optional, Union
+
+from telebot import StateMemoryStorage
+from telebot.storage import StateRedisStorage
+from telebot.storage.base_storage import StateStorageBase, StateDataContext
+
+from config import STATE_STORAGE, REDIS_URL
+from models import db, BotState
+
+logger = logging.getLogger('manager_bot_logger')
+
+
+class StateSqliteStorage(StateStorageBase):
+    """
+    Состояния в таблице BotState.
+
+    С cache=True процесс считает свой кэш источником правды для
+    прочитанных ключей, поэтому при нескольких процессах все обновления
+    одного чата должны приходить в один процесс. С cache=False каждое
+    обращение идёт напрямую в б/д.
+    """
+
+    def __init__(self, cache: bool = True, flush_interval: float = 0.5,
+                 separator: Optional[str] = ':',
+                 prefix: Optional[str] = 'telebot') -> None:
+        self.separator = separator
+        self.prefix = prefix
+        if not self.prefix:
+            raise ValueError('Prefix cannot be empty')
+
+        self.cache = cache
+        self.records = {}  # key: {'state': ..., 'data': {...}} или None
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+        if self.cache:
+            self.flusher = threading.Thread(
+                target=self._flush_loop, args=(flush_interval,),
+                name='StateSqliteStorage', daemon=True)
+            self.flusher.start()
+            atexit.register(self.close)
+
+    def _key(self, chat_id, user_id, business_connection_id=None,
+             message_thread_id=None, bot_id=None) -> str:
+        return self._get_key(chat_id, user_id, self.prefix, self.separator,
+                             business_connection_id, message_thread_id,
+                             bot_id)
+
+    def _load(self, key: str) -> Optional[dict]:
+        """Запись состояния из кэша, при промахе - из б/д"""
+        with self.lock:
+            if key in self.records:
+                return self.records[key]
+
+        row = BotState.get_or_none(BotState.key == key)
+        record = None
+        if row is not None:
+            record = {'state': row.state, 'data': json.loads(row.data)}
+        if not self.cache:
+            return record
+
+        with self.lock:
+            # Пока читали б/д, ключ мог записать другой поток
+            return self.records.setdefault(key, record)
+
+    def _store(self, key: str, record: Optional[dict]) -> None:
+        """Запоминаем запись. None - состояние удалено"""
+        with self.lock:
+            self.records[key] = record
+            self.dirty.add(key)
+        if not self.cache:
+            self.flush()
+
+    def flush(self) -> None:
+        """Сбрасываем накопленные изменения в б/д одной транзакцией"""
+        with self.lock:
+            if not self.dirty:
+                return
+            changes = {key: self.records[key] for key in self.dirty}
+            self.dirty.clear()
+            if not self.cache:
+                self.records.clear()
+
+        deleted = [key for key, record in changes.items() if record is None]
+        rows = [
+            {'key': key, 'state': record['state'],
+             'data': json.dumps(record['data'])}
+            for key, record in changes.items() if record is not None
+        ]
+        try:
+            with db.atomic():
+                if deleted:
+                    BotState.delete().where(
+                        BotState.key.in_(deleted)).execute()
+                if rows:
+                    BotState.insert_many(rows).on_conflict(
+                        conflict_target=[BotState.key],
+                        preserve=[BotState.state, BotState.data],
+                    ).execute()
+        except Exception:
+            # Не теряем изменения: повторим при следующем сбросе
+            with self.lock:
+                self.records.update(
+                    (key, record) for key, record in changes.items()
+                    if key not in self.dirty)
+                self.dirty.update(changes)
+            raise
+
+    def _flush_loop(self, flush_interval: float) -> None:
+        while not self.stopped.wait(flush_interval):
+            if not self.dirty:
+                continue
+            try:
+                # Соединение из пула только на время сброса
+                with db.connection_context():
+                    self.flush()
+            except Exception as e:
+                # flush() вернул изменения в dirty: повторим через
+                # flush_interval
+                logger.error(f'Ошибка записи состояний: {e}')
+
+    def close(self) -> None:
+        """Останавливаем фоновую запись и сбрасываем остаток"""
+        self.stopped.set()
+        self.flush()
+
+    def set_state(self, chat_id: int, user_id: int, state: str,
+                  business_connection_id: Optional[str] = None,
+                  message_thread_id: Optional[int] = None,
+                  bot_id: Optional[int] = None) -> bool:
+        if hasattr(state, 'name'):
+            state = state.name
+
+        key = self._key(chat_id, user_id, business_connection_id,
+                        message_thread_id, bot_id)
+        if self.cache:
+            with self.lock:
+                record = self.records.get(key)
+                if record is not None:
+                    # Быстрый путь: ключ уже в кэше, б/д не трогаем
+                    record['state'] = state
+                    self.dirty.add(key)
+                    return True
+
+        record = self._load(key)
+        data = {} if record is None else record['data']
+        self._store(key, {'state': state, 'data': data})
+        return True
+
+    def get_state(self, chat_id: int, user_id: int,
+                  business_connection_id: Optional[str] = None,
+                  message_thread_id: Optional[int] = None,
+                  bot_id: Optional[int] = None) -> Union[str, None]:
+        record = self._load(self._key(chat_id, user_id,
+                                      business_connection_id,
+                                      message_thread_id, bot_id))
+        if record is None:
+            return None
+        return record['state']
+
+    def delete_state(self, chat_id: int, user_id: int,
+                     business_connection_id: Optional[str] = None,
+                     message_thread_id: Optional[int] = None,
+                     bot_id: Optional[int] = None) -> bool:
+        key = self._key(chat_id, user_id, business_connection_id,
+                        message_thread_id, bot_id)
+        if self._load(key) is None:
+            return False
+        self._store(key, None)
+        return True
+
+    def set_data(self, chat_id: int, user_id: int, key: str,
+                 value: Union[str, int, float, dict],
+                 business_connection_id: Optional[str] = None,
+                 message_thread_id: Optional[int] = None,
+                 bot_id: Optional[int] = None) -> bool:
+        _key = self._key(chat_id, user_id, business_connection_id,
+                         message_thread_id, bot_id)
+        record = self._load(_key)
+        if record is None:
+            raise RuntimeError(
+                f'StateSqliteStorage: key {_key} does not exist.')
+        data = dict(record['data'], **{key: value})
+        self._store(_key, {'state': record['state'], 'data': data})
+        return True
+
+    def get_data(self, chat_id: int, user_id: int,
+                 business_connection_id: Optional[str] = None,
+                 message_thread_id: Optional[int] = None,
+                 bot_id: Optional[int] = None) -> dict:
+        record = self._load(self._key(chat_id, user_id,
+                                      business_connection_id,
+                                      message_thread_id, bot_id))
+        if record is None:
+            return {}
+        return record['data']
+
+    def reset_data(self, chat_id: int, user_id: int,
+                   business_connection_id: Optional[str] = None,
+                   message_thread_id: Optional[int] = None,
+                   bot_id: Optional[int] = None) -> bool:
+        return self.save(chat_id, user_id, {}, business_connection_id,
+                         message_thread_id, bot_id)
+
+    def get_interactive_data(self, chat_id: int, user_id: int,
+                             business_connection_id: Optional[str] = None,
+                             message_thread_id: Optional[int] = None,
+                             bot_id: Optional[int] = None):
+        return StateDataContext(
+            self,
+            chat_id=chat_id,
+            user_id=user_id,
+            business_connection_id=business_connection_id,
+            message_thread_id=message_thread_id,
+            bot_id=bot_id,
+        )
+
+    def save(self, chat_id: int, user_id: int, data: dict,
+             business_connection_id: Optional[str] = None,
+             message_thread_id: Optional[int] = None,
+             bot_id: Optional[int] = None) -> bool:
+        key = self._key(chat_id, user_id, business_connection_id,
+                        message_thread_id, bot_id)
+        record = self._load(key)
+        if record is None:
+            return False
+        self._store(key, {'state': record['state'], 'data': data})
+        return True
+
+    def __str__(self) -> str:
+        return f'<StateSqliteStorage: {len(self.records)} cached>'
+
+
+def create_state_storage(kind: str = STATE_STORAGE,
+                         cache: bool = True) -> StateStorageBase:
+    """
+    Хранилище состояний по настройке STATE_STORAGE. cache=False - для
+    нескольких процессов с общей б/д (только для sqlite)
+    """
+    if kind == 'sqlite':
+        return StateSqliteStorage(cache=cache)
+    if kind == 'redis':
+        return StateRedisStorage(redis_url=REDIS_URL)
+    if kind == 'memory':
+        return StateMemoryStorage()
+    raise ValueError(f'Неизвестное хранилище состояний: {kind}')
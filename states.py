@@ -9,6 +9,8 @@ class UserState(StatesGroup):
     send_task_status = State()
     chose_times_borders_report = State()
     chose_times_borders_status = State()
+    chose_times_borders_export = State()
+    search_query = State()
     forward_to_worker = State()
     forward_to_manager = State()
     chose_times_borders_w = State()
@@ -24,6 +26,7 @@ class UserState(StatesGroup):
     fin_task_id = State()
     name_worker = State()
     task_name = State()
+    choose_workers = State()
     to_do_manager = State()
     to_do_worker = State()
     name_manager = State()
@@ -0,0 +1,67 @@
+"""
+Карточки задач для менеджера и исполнителя с кэшем готовых карточек.
+
+Карточка хранится по ключу (task_id, роль, версия задачи). Версия
+растёт при каждом изменении задачи (queries.touch_tasks), поэтому
+карточка пересобирается только после изменения, а повторный просмотр -
+это чтение версии по первичному ключу и обращение к кэшу.
+"""
+import keyboards
+from cache import TTLCache
+from config import TASK_CARD_CACHE_SIZE
+from models import Task
+from queries import format_date, task_card
+
+# Подписи статусов в карточке: для менеджера и для исполнителя
+CARD_STATUSES = {
+    'manager': {
+        'finishing': 'Исполнитель завершает и вот-вот отправит задание',
+        'process': 'Исполнитель ещё не принял работу',
+        'work': 'Исполнитель работает над задачей',
+        'finish': 'Работа завершена',
+    },
+    'worker': {
+        'finishing': 'Вы завершает задание',
+        'process': 'Вы ещё не приняли работу',
+        'work': 'Вы работает над задачей',
+        'finish': 'Работа завершена',
+    },
+}
+
+# Карточка версии не устаревает, вытесняются только давно не нужные
+cards = TTLCache('task_card', TASK_CARD_CACHE_SIZE, float('inf'))
+
+
+def render(task: Task, role: str) -> tuple:
+    """(текст, клавиатура) карточки. task - из queries.task_card"""
+    date_start = format_date(task.date_start)
+    date_finish = format_date(task.date_finish)
+    if task.status == 'process':
+        date_start = 'Работа не начата'
+    if task.status in ['process', 'work', 'finishing']:
+        date_finish = 'Работа не завершена'
+    status = CARD_STATUSES[role].get(task.status, task.status)
+
+    if role == 'manager':
+        user_line = f'🧑‍💻Исполнитель: \n{task.worker.user_name}'
+    else:
+        user_line = f'Работу назначил: \n{task.manager.user_name}'
+    text = (f'Имя работы: \n{task.task_name}\n\n'
+            f'{user_line}\n\n'
+            f'📆Дата начала работы: \n{date_start}\n\n'
+            f'Статус: \n{status}\n\n'
+            f'📆Дата завершения работы: \n{date_finish}')
+    markup = keyboards.task_card(task.task_id) if task.has_files else None
+    return text, markup
+
+
+def card(task_id, role: str) -> tuple:
+    """(текст, клавиатура) карточки задачи для роли manager или worker"""
+    version = (Task
+               .select(Task.version)
+               .where(Task.task_id == task_id)
+               .scalar())
+    if version is None:
+        raise Task.DoesNotExist(f'Задача {task_id} не найдена')
+    return cards.get((int(task_id), role, version),
+                     lambda: render(task_card(task_id), role))
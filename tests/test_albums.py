@@ -0,0 +1,78 @@
+import contextvars
+import threading
+import time
+
+from telebot.types import Message
+
+import handler_worker
+from albums import AlbumBuffer
+from states import UserState
+
+MANAGER_ID = 5_000_000_001
+WORKER_ID = 5_000_000_002
+
+marker = contextvars.ContextVar('marker', default=None)
+
+
+def wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'не дождались'
+        time.sleep(0.01)
+
+
+def album_part(message_id: int, chat_id: int = MANAGER_ID) -> Message:
+    return Message.de_json({
+        'message_id': message_id, 'date': 1, 'media_group_id': 'album',
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'user'},
+        'photo': [{'file_id': f'photo{message_id}',
+                   'file_unique_id': f'unique{message_id}',
+                   'width': 90, 'height': 90}]})
+
+
+def test_album_is_submitted_once_in_order():
+    submitted = []
+
+    def submit(func, *args):
+        submitted.append((func, args, marker.get()))
+
+    def on_complete(message, messages):
+        pass
+
+    buffer = AlbumBuffer(window=0.05, submit=submit)
+    marker.set('первое сообщение')
+    buffer.add(album_part(2), on_complete)
+    marker.set(None)
+    buffer.add(album_part(1), on_complete)
+    wait_for(lambda: submitted)
+    time.sleep(0.1)
+
+    [(func, (first, messages), context)] = submitted
+    assert func is on_complete
+    assert first.message_id == 1
+    assert [message.message_id for message in messages] == [1, 2]
+    assert context == 'первое сообщение'
+
+
+def test_album_goes_through_chat_shard_and_error_path(driver, telegram,
+                                                      monkeypatch):
+    bot = handler_worker.bot
+    monkeypatch.setattr(handler_worker.album_buffer, 'window', 0.05)
+    threads = []
+
+    def failing_fan_out(func, items):
+        threads.append(threading.current_thread())
+        raise RuntimeError('flood')
+
+    monkeypatch.setattr(handler_worker, 'fan_out', failing_fan_out)
+    bot.set_state(MANAGER_ID, UserState.forward_to_worker)
+    bot.add_data(MANAGER_ID, workers=[WORKER_ID], task_ids=[])
+
+    for message_id in (1, 2):
+        driver._process({'message': album_part(message_id).json})
+    wait_for(lambda: any('Что-то пошло не так' in text
+                         for text in telegram.texts(MANAGER_ID)))
+
+    shard = handler_worker.chat_executor.shard(MANAGER_ID)
+    assert threads == [shard]
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from telebot import apihelper, asyncio_helper
+
+import handler_worker
+from async_main import AsyncBot
+
+CHAT_ID = 5_000_000_001
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Bot API цикла asyncio: запоминает запросы по порядку ответов"""
+    sent = []
+
+    async def process_request(token, method_name, method='get',
+                              params=None, files=None, **kwargs):
+        text = (params or {}).get('text')
+        if text == 'медленно':
+            await asyncio.sleep(0.05)
+        if text == 'ошибка':
+            raise asyncio_helper.ApiTelegramException(
+                method_name, None, {'ok': False, 'error_code': 403,
+                                    'description': 'Forbidden'})
+        sent.append((method_name, text))
+        if method_name == 'sendMessage':
+            return {'message_id': len(sent), 'date': 1,
+                    'chat': {'id': int(params['chat_id']),
+                             'type': 'private'}}
+        return True
+
+    monkeypatch.setattr(asyncio_helper, '_process_request', process_request)
+    return sent
+
+
+@pytest.fixture
+def async_bot():
+    sender = apihelper.CUSTOM_REQUEST_SENDER
+    async_bot = AsyncBot(handler_worker.bot.token, max_workers=1)
+    yield async_bot
+    async_bot.executor.shutdown()
+    apihelper.CUSTOM_REQUEST_SENDER = sender
+    handler_worker.bot.threaded = True
+
+
+def call(method_name: str, **params) -> tuple:
+    return (method_name, 'post', {'chat_id': CHAT_ID, **params}, None, 0)
+
+
+def test_edits_stay_in_order_with_messages(api, async_bot):
+    asyncio.run(async_bot.send_calls([
+        call('sendMessage', text='медленно'),
+        call('editMessageReplyMarkup', message_id=1),
+        call('sendMessage', text='потом'),
+    ]))
+
+    assert api == [('sendMessage', 'медленно'),
+                   ('editMessageReplyMarkup', None),
+                   ('sendMessage', 'потом')]
+
+
+def test_calls_from_other_threads_wait_for_chat_queue(api, async_bot):
+    bot = handler_worker.bot
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        async_bot.loop = loop
+        handler_calls = asyncio.create_task(async_bot.send_calls(
+            [call('sendMessage', text='медленно')]))
+        while str(CHAT_ID) not in async_bot.send_locks:
+            await asyncio.sleep(0)
+        message = await loop.run_in_executor(
+            None, bot.send_message, CHAT_ID, 'из потока')
+        await handler_calls
+        with pytest.raises(apihelper.ApiTelegramException) as error:
+            await loop.run_in_executor(
+                None, bot.send_message, CHAT_ID, 'ошибка')
+        return message, error.value
+
+    message, error = asyncio.run(scenario())
+
+    assert api == [('sendMessage', 'медленно'), ('sendMessage', 'из потока')]
+    assert message.message_id == 2
+    assert error.error_code == 403
@@ -0,0 +1,63 @@
+import datetime
+
+import report_cache
+from cache import TTLCache
+from report_cache import ReportCache
+
+
+def loader(values, during=None):
+    """load() для TTLCache: следующее значение, during() - во время чтения"""
+    values = iter(values)
+
+    def load():
+        if during is not None:
+            during()
+        return next(values)
+    return load
+
+
+def test_value_loaded_before_invalidate_is_not_stored():
+    cache = TTLCache('test', size=10, ttl=60)
+
+    stale = cache.get('roster', loader(['old'],
+                                       lambda: cache.invalidate('roster')))
+    assert stale == 'old'
+    assert cache.get('roster', loader(['new'])) == 'new'
+    assert cache.get('roster', loader(['unused'])) == 'new'
+
+
+def test_value_loaded_before_clear_is_not_stored():
+    cache = TTLCache('test', size=10, ttl=60)
+
+    cache.get('roster', loader(['old'], cache.clear))
+    assert cache.get('roster', loader(['new'])) == 'new'
+
+
+def test_other_key_invalidation_does_not_drop_load():
+    cache = TTLCache('test', size=10, ttl=60)
+
+    cache.get('worker', loader(['value'],
+                               lambda: cache.invalidate('manager')))
+    assert cache.get('worker', loader(['unused'])) == 'value'
+
+
+def test_expired_and_evicted_entries_are_loaded_again():
+    cache = TTLCache('test', size=1, ttl=0)
+    assert cache.get('a', loader([1])) == 1
+    assert cache.get('a', loader([2])) == 2
+
+    cache = TTLCache('test', size=1, ttl=60)
+    cache.get('a', loader([1]))
+    cache.get('b', loader([2]))
+    assert cache.get('a', loader([3])) == 3
+
+
+def test_report_expires(monkeypatch):
+    reports = iter([(1, 0), (2, 1)])
+    monkeypatch.setattr(report_cache, 'report_counts',
+                        lambda *args: next(reports))
+    day = datetime.date(2024, 5, 1)
+
+    cache = ReportCache(size=10, ttl=0)
+    assert cache.counts('worker', 1, day, day) == (1, 0)
+    assert cache.counts('worker', 1, day, day) == (2, 1)
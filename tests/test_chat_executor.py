@@ -0,0 +1,66 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from chat_executor import ChatExecutor, chat_key
+
+
+def message(chat_id: int) -> SimpleNamespace:
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id))
+
+
+@pytest.fixture
+def executor():
+    executor = ChatExecutor(SimpleNamespace(exception_handler=None),
+                            workers=2)
+    yield executor
+    executor.close()
+
+
+def test_chat_key():
+    callback = SimpleNamespace(message=message(5),
+                               from_user=SimpleNamespace(id=6))
+
+    assert chat_key(message(5)) == 5
+    assert chat_key(callback) == 5
+    assert chat_key(SimpleNamespace(from_user=SimpleNamespace(id=6))) == 6
+    assert chat_key(object()) is None
+
+
+def test_chat_in_order_other_chat_not_blocked(executor):
+    first, second = message(1), message(2)
+    assert executor.shard(1) is not executor.shard(2)
+    release = threading.Event()
+    other_done = threading.Event()
+    order = []
+
+    def slow(update) -> None:
+        release.wait(5)
+        order.append('первое')
+
+    executor.put(slow, first)
+    executor.put(lambda update: order.append('второе'), first)
+    executor.put(lambda update: other_done.set(), second)
+
+    # Другой чат обработан, пока первое обновление чата 1 ещё в работе
+    assert other_done.wait(5)
+    assert order == []
+    release.set()
+    executor.close()
+
+    assert order == ['первое', 'второе']
+    stats = executor.stats()
+    assert stats['processed'] == 3
+    assert [shard['processed'] for shard in stats['shards']] == [1, 2]
+
+
+def test_exception_is_reported(executor):
+    def failing(update) -> None:
+        raise RuntimeError('сбой')
+
+    executor.put(failing, message(1))
+    executor.close()
+
+    with pytest.raises(RuntimeError):
+        executor.raise_exceptions()
@@ -0,0 +1,53 @@
+import datetime
+import time
+
+import export
+from models import Task
+from queries import format_date
+from test_task_cycle import MANAGER_ID, WORKER_ID, assign, register
+
+
+def wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'не дождались'
+        time.sleep(0.01)
+
+
+def request_export(driver, today: datetime.date) -> None:
+    driver.press(MANAGER_ID, 'export')
+    driver.send(MANAGER_ID, f'{format_date(today)} - {format_date(today)}')
+    driver.press(MANAGER_ID, f'export:csv:{today.isoformat()}:'
+                             f'{today.isoformat()}')
+
+
+def test_export_sends_csv_for_period(driver, database, telegram):
+    today = datetime.date.today()
+    register(driver, MANAGER_ID, 'manager', 'Менеджер')
+    register(driver, WORKER_ID, 'worker', 'Исполнитель')
+    assign(driver, MANAGER_ID, 'Отчёт', [WORKER_ID])
+    assign(driver, MANAGER_ID, 'Не начата', [WORKER_ID])
+    with database.connection_context():
+        task = Task.get(Task.task_name == 'Отчёт')
+    driver.press(WORKER_ID, f'accept:{task.task_id}')
+
+    request_export(driver, today)
+    wait_for(lambda: telegram.documents)
+
+    [document] = telegram.documents
+    lines = document.decode('utf-8-sig').splitlines()
+    assert lines == [';'.join(export.HEADER),
+                     f'{task.task_id};Отчёт;Исполнитель;В работе;'
+                     f'{format_date(today)};']
+
+
+def test_export_too_large_is_not_sent(driver, database, telegram,
+                                      monkeypatch):
+    monkeypatch.setattr(export, 'EXPORT_MAX_BYTES', 10)
+    register(driver, MANAGER_ID, 'manager', 'Менеджер')
+
+    request_export(driver, datetime.date.today())
+    wait_for(lambda: any('слишком большой' in text
+                         for text in telegram.texts(MANAGER_ID)))
+
+    assert telegram.documents == []
@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+from peewee import SqliteDatabase
+
+import handler_worker
+import metrics
+from chat_executor import ChatExecutor
+from outbound import dispatcher
+
+
+def test_every_handler_is_instrumented():
+    bot = handler_worker.bot
+    handlers = [*bot.message_handlers, *bot.callback_query_handlers]
+
+    assert [handler['function'].__qualname__ for handler in handlers
+            if not handler['function'].__qualname__.startswith(
+                ('error_handler.', 'error_handler_callback.'))] == []
+
+
+def calls(handler: str) -> int:
+    series = metrics.HANDLER_DURATION.series.get((handler,))
+    return 0 if series is None else series[-2]
+
+
+def test_unexpected_message_is_counted(driver):
+    before = calls('handle_unexpected_messages')
+    driver.send(1, 'привет')
+
+    assert calls('handle_unexpected_messages') == before + 1
+    assert 'handler="handle_unexpected_messages"' in metrics.render()
+
+
+def test_install_is_idempotent():
+    database = SqliteDatabase(':memory:')
+    metrics.install(database)
+    metrics.install(database)
+
+    names = [metric.name for metric in metrics.REGISTRY]
+    assert len(names) == len(set(names))
+    assert dispatcher.observers.count(metrics.observe_api_call) == 1
+    with metrics.observe_handler('test_install'):
+        database.execute_sql('SELECT 1')
+    assert metrics.DB_QUERIES.series[('test_install', 'select')] == 1
+
+
+def test_outbound_wait_time_is_exported():
+    metrics.install(SqliteDatabase(':memory:'))
+    stats = dispatcher.stats()
+
+    text = metrics.render()
+    for priority in ('interactive', 'bulk'):
+        labels = f'{{priority="{priority}"}}'
+        assert (f'bot_outbound_wait_seconds_count{labels} '
+                f'{stats["sent"][priority]}') in text
+        assert f'bot_outbound_wait_seconds_sum{labels} ' in text
+        assert f'bot_outbound_max_wait_seconds{labels} ' in text
+    assert '# TYPE bot_outbound_wait_seconds summary' in text
+
+
+def test_shard_metrics_are_exported():
+    executor = ChatExecutor(SimpleNamespace(exception_handler=None),
+                            workers=2)
+    executor.put(lambda update: None,
+                 SimpleNamespace(chat=SimpleNamespace(id=1)))
+    executor.close()
+    metrics.install(SqliteDatabase(':memory:'), executor)
+    try:
+        text = metrics.render()
+    finally:
+        # Метрики снова снимаются с пула бота
+        metrics.install(SqliteDatabase(':memory:'),
+                        handler_worker.chat_executor)
+
+    assert 'bot_update_shard_queue_depth{shard="0"} 0' in text
+    assert 'bot_update_shard_wait_seconds_count{shard="1"} 1' in text
+    assert 'bot_update_shard_wait_seconds_count{shard="0"} 0' in text
+    assert 'bot_update_shard_max_latency_seconds{shard="1"} ' in text
@@ -0,0 +1,190 @@
+import datetime
+
+import pytest
+from peewee import AutoField, CharField, IntegerField, Model
+
+import migrations
+from database import is_sqlite
+from migrations import LATEST_VERSION, current_version, run_migrations
+from models import (
+    db,
+    SchemaVersion,
+    Task,
+    TaskAttachment,
+    TaskDailyStats,
+    UserManager,
+    UserWorker,
+)
+from queries import report_counts
+
+# id Telegram давно больше 2**31
+MANAGER_ID = 5_000_000_001
+WORKER_ID = 5_000_000_002
+
+
+class FirstSchemaModel(Model):
+    """Таблицы первой версии бота: даты строками dd/mm/yyyy, без ключей"""
+
+    class Meta:
+        database = db
+
+
+class FirstManager(FirstSchemaModel):
+    user_id = AutoField()
+    user_name = CharField()
+
+    class Meta:
+        table_name = 'usermanager'
+
+
+class FirstWorker(FirstSchemaModel):
+    user_id = AutoField()
+    user_name = CharField()
+
+    class Meta:
+        table_name = 'userworker'
+
+
+class FirstTask(FirstSchemaModel):
+    task_id = AutoField()
+    task_name = CharField()
+    id_worker = IntegerField()
+    id_manager = IntegerField()
+    date_start = CharField()
+    date_finish = CharField()
+    status = CharField()
+
+    class Meta:
+        table_name = 'task'
+
+
+class FirstAttachment(FirstSchemaModel):
+    """Вложения до внешнего ключа: task_id - просто число"""
+    task_id = IntegerField()
+    kind = CharField()
+    file_id = CharField(null=True)
+    file_unique_id = CharField(null=True)
+    caption = CharField(null=True)
+
+    class Meta:
+        table_name = 'taskattachment'
+
+
+def foreign_keys() -> set:
+    return {(key.column, key.dest_table)
+            for key in db.get_foreign_keys('task')}
+
+
+def test_fresh_database_gets_latest_version(database):
+    assert run_migrations() == LATEST_VERSION
+    assert run_migrations() == LATEST_VERSION
+    assert current_version() == LATEST_VERSION
+    assert foreign_keys() == {('id_worker', 'userworker'),
+                              ('id_manager', 'usermanager')}
+
+
+def test_big_telegram_ids(database):
+    run_migrations()
+    UserManager.create(user_id=MANAGER_ID, user_name='Менеджер')
+    UserWorker.create(user_id=WORKER_ID, user_name='Исполнитель')
+    task = Task.create(task_name='Отчёт', id_manager=MANAGER_ID,
+                       id_worker=WORKER_ID, status='work',
+                       date_start=datetime.date(2024, 3, 5))
+
+    task = Task.get_by_id(task.task_id)
+    assert (task.id_manager, task.id_worker) == (MANAGER_ID, WORKER_ID)
+    assert task.worker.user_name == 'Исполнитель'
+
+
+def test_upgrade_from_first_schema(database):
+    if not is_sqlite(database):
+        pytest.skip('Первая версия бота работала только с SQLite')
+    database.create_tables([FirstManager, FirstWorker, FirstTask])
+    FirstManager.create(user_id=1, user_name='Менеджер')
+    FirstWorker.create(user_id=2, user_name='Исполнитель')
+    FirstTask.create(task_name='Отчёт', id_worker=2, id_manager=1,
+                     date_start='01/03/2024', date_finish='04/03/2024',
+                     status='finish')
+    FirstTask.create(task_name='Смета', id_worker=2, id_manager=1,
+                     date_start='05/03/2024', date_finish='',
+                     status='work')
+
+    assert run_migrations() == LATEST_VERSION
+    assert run_migrations() == LATEST_VERSION
+
+    dates = list(Task
+                 .select(Task.date_start, Task.date_finish, Task.version)
+                 .order_by(Task.task_id)
+                 .tuples())
+    assert dates == [
+        (datetime.date(2024, 3, 1), datetime.date(2024, 3, 4), 0),
+        (datetime.date(2024, 3, 5), None, 0),
+    ]
+    assert foreign_keys() == {('id_worker', 'userworker'),
+                              ('id_manager', 'usermanager')}
+    assert TaskDailyStats.select().count() == 6
+    assert report_counts('worker', 2, datetime.date(2024, 3, 1),
+                         datetime.date(2024, 3, 31)) == (2, 1)
+
+
+def test_foreign_keys_added_to_existing_postgres_tables(database):
+    if is_sqlite(database):
+        pytest.skip('В SQLite миграция 0004 пересоздаёт таблицу task')
+    run_migrations()
+    names = [name for name, in database.execute_sql(
+        "SELECT conname FROM pg_constraint "
+        "WHERE conrelid = 'task'::regclass AND contype = 'f'")]
+    for name in names:
+        database.execute_sql(f'ALTER TABLE "task" DROP CONSTRAINT "{name}"')
+    SchemaVersion.delete().execute()
+    SchemaVersion.create(version=3)
+    assert foreign_keys() == set()
+
+    assert run_migrations() == LATEST_VERSION
+    assert foreign_keys() == {('id_worker', 'userworker'),
+                              ('id_manager', 'usermanager')}
+
+
+def test_attachments_table_added_by_migration(database, monkeypatch):
+    run_migrations()
+    TaskAttachment.drop_table()
+    SchemaVersion.delete().execute()
+    SchemaVersion.create(version=7)
+    # Таблицу должна создать миграция, а не create_models в конце
+    monkeypatch.setattr(migrations, 'create_models', lambda: None)
+
+    assert run_migrations() == LATEST_VERSION
+    assert TaskAttachment.table_exists()
+    assert 8 in {row.version for row in SchemaVersion.select()}
+
+
+def test_attachment_foreign_key_added(database):
+    run_migrations()
+    UserManager.create(user_id=MANAGER_ID, user_name='Менеджер')
+    UserWorker.create(user_id=WORKER_ID, user_name='Исполнитель')
+    task = Task.create(task_name='Смета', id_manager=MANAGER_ID,
+                       id_worker=WORKER_ID, status='work')
+    TaskAttachment.drop_table()
+    FirstAttachment.create_table()
+    FirstAttachment.create(task_id=task.task_id, kind='text',
+                           caption='Подробности')
+    FirstAttachment.create(task_id=task.task_id + 1, kind='text',
+                           caption='Чужое')
+    SchemaVersion.delete().execute()
+    SchemaVersion.create(version=8)
+
+    assert run_migrations() == LATEST_VERSION
+    assert [(key.column, key.dest_table) for key
+            in database.get_foreign_keys('taskattachment')] == [
+        ('task_id', 'task')]
+    assert [attachment.caption
+            for attachment in TaskAttachment.select()] == ['Подробности']
+
+    if is_sqlite(database):
+        database.execute_sql('PRAGMA foreign_keys = ON')
+    try:
+        Task.delete_by_id(task.task_id)
+        assert TaskAttachment.select().count() == 0
+    finally:
+        if is_sqlite(database):
+            database.execute_sql('PRAGMA foreign_keys = OFF')
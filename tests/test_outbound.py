@@ -0,0 +1,163 @@
+import json
+
+import pytest
+
+import outbound
+from outbound import BULK, INTERACTIVE, OutboundDispatcher, TokenBucket
+
+
+class FakeClock:
+    """Часы диспетчера: время идёт только по advance()"""
+
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def dispatcher_on(clock: FakeClock, **kwargs) -> OutboundDispatcher:
+    return OutboundDispatcher(clock=clock, **kwargs)
+
+
+def drain(dispatcher: OutboundDispatcher, clock: FakeClock) -> list:
+    """
+    Цикл _schedule на поддельных часах: выдаём разрешения, пока очередь
+    не опустеет. [(момент, chat_id)] в порядке выдачи
+    """
+    granted = []
+    while dispatcher.waiting:
+        now = clock()
+        delay = dispatcher.global_bucket.ready_at(now) - now
+        if delay <= 0:
+            ticket, delay = dispatcher._pick(now)
+            if ticket is not None:
+                dispatcher._grant(ticket, now)
+                granted.append((now, ticket.chat_id))
+                continue
+        clock.advance(delay)
+    return granted
+
+
+def enqueue(dispatcher: OutboundDispatcher, chat_id, priority) -> None:
+    """Запрос в очередь без потока планировщика"""
+    dispatcher.seq += 1
+    dispatcher.waiting.append(outbound.Ticket(
+        priority, dispatcher.seq, str(chat_id), lambda: None,
+        dispatcher.clock()))
+
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+    now = clock()
+    bucket.consume(now)
+    bucket.consume(now)
+
+    assert bucket.ready_at(now) == now + 0.5
+    assert bucket.ready_at(now + 0.5) == now + 0.5
+    bucket.block(now + 3)
+    assert bucket.ready_at(now + 1) == now + 3
+    assert not bucket.idle(now + 2)
+    assert bucket.idle(now + 4)
+
+
+def test_interactive_goes_before_bulk(clock):
+    dispatcher = dispatcher_on(clock, global_rate=1, chat_rate=1,
+                               chat_burst=1)
+    start = clock()
+    for chat_id in (1, 2, 3):
+        enqueue(dispatcher, chat_id, BULK)
+    enqueue(dispatcher, 4, INTERACTIVE)
+
+    granted = drain(dispatcher, clock)
+
+    # Общий лимит - 1 запрос/с: ответ пользователю обгоняет рассылку
+    assert granted == [(start, '4'), (start + 1, '1'), (start + 2, '2'),
+                       (start + 3, '3')]
+    stats = dispatcher.stats()
+    assert stats['sent'] == {'interactive': 1, 'bulk': 3}
+    assert stats['max_wait_seconds']['bulk'] == 3
+
+
+def test_chat_limit_lets_other_chats_through(clock):
+    dispatcher = dispatcher_on(clock, global_rate=100, chat_rate=1,
+                               chat_burst=1)
+    start = clock()
+    enqueue(dispatcher, 1, INTERACTIVE)
+    enqueue(dispatcher, 1, INTERACTIVE)
+    enqueue(dispatcher, 2, BULK)
+
+    assert drain(dispatcher, clock) == [(start, '1'), (start, '2'),
+                                        (start + 1, '1')]
+
+
+class Response:
+    def __init__(self, status_code: int, result: dict) -> None:
+        self.status_code = status_code
+        self.text = json.dumps(result)
+
+    def json(self) -> dict:
+        return json.loads(self.text)
+
+
+class StubSession:
+    """Сессия requests: отдаёт ответы по очереди"""
+
+    def __init__(self, responses: list) -> None:
+        self.responses = list(responses)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs) -> Response:
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+def test_429_blocks_chat_for_retry_after(clock, monkeypatch):
+    dispatcher = dispatcher_on(clock, max_retries=2)
+    acquired = []
+    monkeypatch.setattr(dispatcher, 'acquire',
+                        lambda chat_id, priority: acquired.append(chat_id))
+    session = StubSession([
+        Response(429, {'ok': False, 'error_code': 429,
+                       'parameters': {'retry_after': 7}}),
+        Response(200, {'ok': True, 'result': True}),
+    ])
+    monkeypatch.setattr(outbound.apihelper, '_get_req_session',
+                        lambda reset=False: session)
+
+    response = dispatcher.request('post', 'https://api/sendMessage',
+                                  params={'chat_id': 5})
+
+    assert response.status_code == 200
+    assert acquired == [5, 5]
+    assert dispatcher.stats()['retries_429'] == 1
+    bucket = dispatcher.chat_buckets['5']
+    assert bucket.ready_at(clock()) == clock() + 7
+
+    enqueue(dispatcher, 5, INTERACTIVE)
+    enqueue(dispatcher, 6, BULK)
+    start = clock()
+    assert drain(dispatcher, clock) == [(start, '6'), (start + 7, '5')]
+
+
+def test_429_is_returned_after_last_retry(clock, monkeypatch):
+    dispatcher = dispatcher_on(clock, max_retries=1)
+    monkeypatch.setattr(dispatcher, 'acquire', lambda chat_id, priority: 0)
+    too_many = Response(429, {'ok': False, 'error_code': 429})
+    session = StubSession([too_many, too_many])
+    monkeypatch.setattr(outbound.apihelper, '_get_req_session',
+                        lambda reset=False: session)
+
+    response = dispatcher.request('post', 'https://api/sendMessage',
+                                  params={'chat_id': 5})
+
+    assert response.status_code == 429
+    assert session.calls == 2
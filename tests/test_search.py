@@ -0,0 +1,128 @@
+import pytest
+
+from database import is_sqlite
+from migrations import LATEST_VERSION, run_migrations
+from models import SchemaVersion, Task, UserManager, UserWorker
+from search import index_tasks, search_terms, search_tasks
+
+
+@pytest.fixture
+def users(database):
+    run_migrations()
+    UserManager.insert_many([{'user_id': 5, 'user_name': 'm5'},
+                             {'user_id': 7, 'user_name': 'm7'}]).execute()
+    UserWorker.insert_many([{'user_id': 9, 'user_name': 'w9'}]).execute()
+
+
+def create_task(task_name: str, id_manager: int, id_worker: int) -> int:
+    task = Task.create(task_name=task_name, id_manager=id_manager,
+                       id_worker=id_worker, status='work')
+    index_tasks([task.task_id])
+    return task.task_id
+
+
+def names(result) -> list:
+    tasks, _ = result
+    return [task_name for _, task_name, _ in tasks]
+
+
+def test_search_terms_split_on_any_non_word_character():
+    assert search_terms('Планы+m7_секрёт', 5, 9) == (
+        'm5_планы m5_m7 m5_секрет w9_планы w9_m7 w9_секрет')
+
+
+def test_foreign_words_in_task_name_do_not_leak(users):
+    create_task('планы+m7_секрет', 5, 9)
+
+    assert names(search_tasks('секрет', 7, ['manager'])) == []
+    assert names(search_tasks('секрет', 5, ['manager'])) == [
+        'планы+m7_секрет']
+    assert names(search_tasks('секрет', 9, ['worker'])) == [
+        'планы+m7_секрет']
+
+
+def test_prefix_and_yo(users):
+    create_task('Квартальный отчёт', 5, 9)
+    create_task('Смета', 5, 9)
+
+    assert names(search_tasks('кварт отчет', 5, ['manager'])) == [
+        'Квартальный отчёт']
+
+
+def test_foreign_token_in_index_is_filtered_out(users, database):
+    if not is_sqlite(database):
+        pytest.skip('Индекс FTS5 есть только в SQLite')
+    task_id = create_task('Смета', 5, 9)
+    database.execute_sql(
+        'INSERT INTO task_search(rowid, terms) VALUES (?, ?)',
+        (task_id + 1000, 'm7_смета'))
+    database.execute_sql(
+        'INSERT INTO task_search(rowid, terms) VALUES (?, ?)',
+        (task_id, 'm7_смета'))
+
+    assert names(search_tasks('смета', 7, ['manager'])) == []
+
+
+def test_index_from_triggers_is_rebuilt(users, database):
+    if not is_sqlite(database):
+        pytest.skip('Индекс FTS5 есть только в SQLite')
+    task = Task.create(task_name='планы+m7_секрет', id_manager=5,
+                       id_worker=9, status='work')
+    # Индекс версии 6: токены пишет триггер, '+' не разделяет слова
+    database.execute_sql(
+        'INSERT INTO task_search(rowid, terms) VALUES (?, ?)',
+        (task.task_id, 'm5_планы+m7_секрет w9_планы+m7_секрет'))
+    database.execute_sql(
+        'CREATE TRIGGER task_search_insert AFTER INSERT ON task '
+        'BEGIN SELECT 1; END')
+    SchemaVersion.delete().execute()
+    SchemaVersion.create(version=6)
+
+    assert run_migrations() == LATEST_VERSION
+    assert database.execute_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger'"
+    ).fetchall() == []
+    assert names(search_tasks('секрет', 5, ['manager'])) == [
+        'планы+m7_секрет']
+    assert names(search_tasks('секрет', 7, ['manager'])) == []
+
+
+def test_task_inserted_without_index_is_added_on_start(users, database):
+    if not is_sqlite(database):
+        pytest.skip('Индекс FTS5 есть только в SQLite')
+    Task.create(task_name='Годовой отчёт', id_manager=5, id_worker=9,
+                status='work')
+    assert names(search_tasks('отчет', 5, ['manager'])) == []
+
+    run_migrations()
+    run_migrations()
+
+    assert names(search_tasks('отчет', 5, ['manager'])) == [
+        'Годовой отчёт']
+    assert database.execute_sql(
+        'SELECT count(*) FROM task_search').fetchone() == (1,)
+
+
+def test_search_returns_to_dialog(driver, database, telegram):
+    manager_id, worker_id = 5_000_000_001, 5_000_000_002
+    with database.connection_context():
+        UserManager.create(user_id=manager_id, user_name='Менеджер')
+        UserWorker.create(user_id=worker_id, user_name='Исполнитель')
+        create_task('Смета на ремонт', manager_id, worker_id)
+    state = driver.bot.current_states
+
+    driver.press(manager_id, 'new_task')
+    dialog_state = driver.bot.get_state(manager_id)
+    driver.send(manager_id, '/search')
+    driver.send(manager_id, 'смета')
+    assert telegram.texts(manager_id)[-1].startswith('🔎 Найденные задачи')
+    assert driver.bot.get_state(manager_id) == dialog_state
+
+    # Следующее сообщение - снова название новой задачи, а не поиск
+    driver.send(manager_id, 'Квартальный отчёт')
+    with database.connection_context():
+        assert Task.select().count() == 1
+    assert driver.bot.get_state(manager_id) != dialog_state
+    assert state.get_data(manager_id, manager_id,
+                          bot_id=driver.bot.bot_id)['task_name'] == (
+        'Квартальный отчёт')
@@ -0,0 +1,112 @@
+import logging
+import os
+import time
+
+import pytest
+from peewee import OperationalError
+from telebot.storage import StateRedisStorage
+
+import state_storage
+from migrations import run_migrations
+from models import BotState, Task, UserWorker
+from state_storage import StateSqliteStorage, create_state_storage
+
+MANAGER_ID = 5_000_000_001
+WORKER_ID = 5_000_000_002
+
+
+def wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'не дождались'
+        time.sleep(0.01)
+
+
+def test_failed_flush_is_logged_and_retried(database, monkeypatch, caplog):
+    run_migrations()
+    calls = []
+    insert_many = BotState.insert_many
+
+    def failing_insert_many(rows, *args, **kwargs):
+        calls.append(rows)
+        if len(calls) == 1:
+            raise OperationalError('database is locked')
+        return insert_many(rows, *args, **kwargs)
+
+    monkeypatch.setattr(BotState, 'insert_many', failing_insert_many)
+    storage = StateSqliteStorage(flush_interval=0.01)
+    try:
+        with caplog.at_level(logging.ERROR, logger='manager_bot_logger'):
+            storage.set_state(1, 1, 'menu')
+            wait_for(lambda: len(calls) >= 2 and not storage.dirty)
+    finally:
+        storage.close()
+
+    assert 'Ошибка записи состояний: database is locked' in caplog.text
+    assert [row.state for row in BotState.select()] == ['menu']
+
+
+def test_storages_without_cache_share_state(database):
+    run_migrations()
+    first = StateSqliteStorage(cache=False)
+    second = StateSqliteStorage(cache=False)
+
+    first.set_state(1, 1, 'menu')
+    assert second.get_state(1, 1) == 'menu'
+    with second.get_interactive_data(1, 1) as data:
+        data['workers'] = [5]
+    assert first.get_data(1, 1) == {'workers': [5]}
+    assert first.delete_state(1, 1)
+    assert second.get_state(1, 1) is None
+
+
+@pytest.fixture
+def redis_storages(monkeypatch):
+    """
+    Два хранилища redis, как у двух процессов: на TEST_REDIS_URL
+    (локальный redis, б/д очищается) или на fakeredis
+    """
+    redis = pytest.importorskip('redis')
+    url = os.getenv('TEST_REDIS_URL')
+    if url:
+        monkeypatch.setattr(state_storage, 'REDIS_URL', url)
+        storages = [create_state_storage('redis') for _ in range(2)]
+        storages[0].redis.flushdb()
+        return storages
+    fakeredis = pytest.importorskip('fakeredis')
+    pool = redis.ConnectionPool(connection_class=fakeredis.FakeConnection,
+                                server=fakeredis.FakeServer())
+    return [StateRedisStorage(connection_pool=pool) for _ in range(2)]
+
+
+def test_redis_storages_share_state(redis_storages):
+    first, second = redis_storages
+
+    first.set_state(1, 1, 'menu')
+    assert second.get_state(1, 1) == 'menu'
+    with second.get_interactive_data(1, 1) as data:
+        data['workers'] = [5]
+    assert first.get_data(1, 1) == {'workers': [5]}
+    assert first.delete_state(1, 1)
+    assert second.get_state(1, 1) is None
+
+
+def test_dialog_on_redis(driver, database, redis_storages, monkeypatch):
+    monkeypatch.setattr(driver.bot, 'current_states', redis_storages[0])
+    with database.connection_context():
+        UserWorker.create(user_id=WORKER_ID, user_name='Исполнитель')
+
+    driver.send(MANAGER_ID, '/start')
+    driver.press(MANAGER_ID, 'manager')
+    driver.send(MANAGER_ID, 'Менеджер')
+    driver.press(MANAGER_ID, 'new_task')
+    driver.send(MANAGER_ID, 'Смета')
+    driver.press(MANAGER_ID, f'pick:{WORKER_ID}')
+    data = redis_storages[1].get_data(MANAGER_ID, MANAGER_ID,
+                                      bot_id=driver.bot.bot_id)
+    assert data['workers'] == [WORKER_ID]
+
+    driver.press(MANAGER_ID, 'pick_done')
+    with database.connection_context():
+        assert [(task.task_name, task.id_worker)
+                for task in Task.select()] == [('Смета', WORKER_ID)]
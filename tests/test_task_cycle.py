@@ -0,0 +1,229 @@
+import datetime
+import json
+
+import keyboards
+from models import Task, TaskDailyStats, UserManager, UserWorker
+from queries import PAGE_SIZE, report_counts
+
+MANAGER_ID = 5_000_000_001
+WORKER_ID = 5_000_000_002
+
+
+def register(driver, user_id: int, role: str, name: str) -> None:
+    driver.send(user_id, '/start')
+    driver.press(user_id, role)
+    driver.send(user_id, name)
+
+
+def assign(driver, manager_id: int, task_name: str, worker_ids) -> None:
+    driver.press(manager_id, 'new_task')
+    driver.send(manager_id, task_name)
+    for worker_id in worker_ids:
+        driver.press(manager_id, f'pick:{worker_id}')
+    driver.press(manager_id, 'pick_done')
+    driver.send(manager_id, 'Подробности')
+    driver.press(manager_id, 'send')
+
+
+def last_markup(telegram, method: str, chat_id: int) -> list:
+    """callback_data кнопок последней клавиатуры method в чат chat_id"""
+    params = [params for name, params in telegram.calls
+              if name == method and 'reply_markup' in params and
+              int(params['chat_id']) == chat_id][-1]
+    return [button['callback_data']
+            for row in json.loads(params['reply_markup'])['inline_keyboard']
+            for button in row]
+
+
+def test_create_accept_finish(driver, database, telegram):
+    today = datetime.date.today()
+    register(driver, MANAGER_ID, 'manager', 'Менеджер')
+    register(driver, WORKER_ID, 'worker', 'Исполнитель')
+    with database.connection_context():
+        assert UserManager.get_by_id(MANAGER_ID).user_name == 'Менеджер'
+        assert UserWorker.get_by_id(WORKER_ID).user_name == 'Исполнитель'
+
+    driver.press(MANAGER_ID, 'new_task')
+    driver.send(MANAGER_ID, 'Квартальный отчёт')
+    driver.press(MANAGER_ID, f'pick:{WORKER_ID}')
+    driver.press(MANAGER_ID, 'pick_done')
+    driver.send(MANAGER_ID, 'Собрать цифры за квартал')
+    driver.press(MANAGER_ID, 'send')
+    with database.connection_context():
+        task = Task.get()
+    assert (task.task_name, task.status) == ('Квартальный отчёт', 'process')
+    assert (task.id_manager, task.id_worker) == (MANAGER_ID, WORKER_ID)
+
+    driver.press(WORKER_ID, f'accept:{task.task_id}')
+    with database.connection_context():
+        task = Task.get_by_id(task.task_id)
+    assert (task.status, task.date_start) == ('work', today)
+
+    driver.press(WORKER_ID, 'task_fin')
+    driver.press(WORKER_ID, task.task_id)
+    driver.send(WORKER_ID, 'Цифры в приложении')
+    driver.press(WORKER_ID, 'send_w')
+    with database.connection_context():
+        task = Task.get_by_id(task.task_id)
+        assert TaskDailyStats.select().count() == 2
+        assert report_counts('manager', MANAGER_ID, today, today) == (1, 1)
+        assert report_counts('worker', WORKER_ID, today, today) == (1, 1)
+    assert (task.status, task.date_finish) == ('finish', today)
+    assert any('сдаёт работу "Квартальный отчёт' in text
+               for text in telegram.texts(MANAGER_ID))
+    # DatabaseMiddleware вернул соединения в пул после каждого обновления
+    assert not database.obj._in_use
+
+
+def test_accept_button_accepts_its_own_task(driver, database, telegram):
+    other_manager = MANAGER_ID + 10
+    register(driver, MANAGER_ID, 'manager', 'Менеджер')
+    register(driver, other_manager, 'manager', 'Другой менеджер')
+    register(driver, WORKER_ID, 'worker', 'Исполнитель')
+    assign(driver, MANAGER_ID, 'Смета', [WORKER_ID])
+    assign(driver, other_manager, 'Договор', [WORKER_ID])
+    with database.connection_context():
+        first, second = Task.select().order_by(Task.task_id)
+    assert last_markup(telegram, 'sendMessage', WORKER_ID) == [
+        f'{keyboards.ACCEPT_PREFIX}{second.task_id}']
+
+    driver.press(WORKER_ID, f'{keyboards.ACCEPT_PREFIX}{second.task_id}')
+    driver.press(WORKER_ID, f'{keyboards.ACCEPT_PREFIX}{second.task_id}')
+    with database.connection_context():
+        statuses = dict(Task.select(Task.task_name, Task.status).tuples())
+    assert statuses == {'Смета': 'process', 'Договор': 'work'}
+    assert telegram.texts(WORKER_ID)[-1] == '❗️Задача уже принята'
+
+
+def test_worker_picker_pages(driver, database, telegram):
+    register(driver, MANAGER_ID, 'manager', 'Менеджер')
+    worker_ids = [WORKER_ID + i for i in range(PAGE_SIZE * 2 + 5)]
+    with database.connection_context():
+        UserWorker.insert_many([{'user_id': worker_id,
+                                 'user_name': f'Исполнитель {worker_id}'}
+                                for worker_id in worker_ids]).execute()
+
+    driver.press(MANAGER_ID, 'new_task')
+    driver.send(MANAGER_ID, 'Смета')
+    buttons = last_markup(telegram, 'sendMessage', MANAGER_ID)
+    assert buttons[:PAGE_SIZE] == [f'pick:{worker_id}'
+                                   for worker_id in worker_ids[:PAGE_SIZE]]
+    assert buttons[PAGE_SIZE:] == ['pick_page:1', 'pick_done', 'menu']
+
+    driver.press(MANAGER_ID, 'pick_page:2')
+    driver.press(MANAGER_ID, f'pick:{worker_ids[-1]}')
+    buttons = last_markup(telegram, 'editMessageReplyMarkup',
+                          MANAGER_ID)
+    assert buttons == [f'pick:{worker_id}'
+                       for worker_id in worker_ids[PAGE_SIZE * 2:]] + [
+        'pick_page:1', 'pick_done', 'menu']
+
+    driver.press(MANAGER_ID, 'pick_done')
+    with database.connection_context():
+        assert [task.id_worker for task in Task.select()] == [
+            worker_ids[-1]]
+
+
+def test_new_task_notice_fans_out(driver, database, telegram, monkeypatch):
+    import handler_worker
+    from outbound import fan_out
+    from states import UserState
+
+    worker_ids = [WORKER_ID, WORKER_ID + 1]
+    register(driver, MANAGER_ID, 'manager', 'Менеджер')
+    for worker_id in worker_ids:
+        register(driver, worker_id, 'worker', f'Исполнитель {worker_id}')
+    driver.press(MANAGER_ID, 'new_task')
+    driver.send(MANAGER_ID, 'Смета')
+    for worker_id in worker_ids:
+        driver.press(MANAGER_ID, f'pick:{worker_id}')
+    driver.press(MANAGER_ID, 'pick_done')
+    fan_outs = []
+
+    def recorded_fan_out(func, items):
+        items = list(items)
+        fan_outs.append(len(items))
+        return fan_out(func, items)
+
+    monkeypatch.setattr(handler_worker, 'fan_out', recorded_fan_out)
+    driver.bot.set_state(MANAGER_ID, UserState.info_for_task)
+    driver.send(MANAGER_ID, 'Подробности')
+
+    assert fan_outs == [2]
+    for worker_id in worker_ids:
+        assert any(text.startswith('📩Новая задача "Смета"')
+                   for text in telegram.texts(worker_id))
+
+
+def test_task_list_pages(driver, database, telegram):
+    today = datetime.date.today()
+    before = today - datetime.timedelta(days=40)
+    register(driver, MANAGER_ID, 'manager', 'Менеджер')
+    # Начата в периоде, сдана в периоде, и то и другое, вне периода
+    dates = [(today, None), (before, today), (today, today),
+             (before, before), (None, None)]
+    with database.connection_context():
+        Task.insert_many([
+            {'task_name': f'Задача {number}', 'id_manager': MANAGER_ID,
+             'id_worker': WORKER_ID, 'status': 'work',
+             'date_start': date_start, 'date_finish': date_finish}
+            for number in range(PAGE_SIZE * 2)
+            for date_start, date_finish in [dates[number % len(dates)]]
+        ]).execute()
+        expected = [task.task_id for task in Task.select().where(
+            (Task.date_start == today) | (Task.date_finish == today)
+        ).order_by(Task.task_id)]
+    period = f'{today.isoformat()},{today.isoformat()}'
+
+    driver.press(MANAGER_ID, 'all')
+    driver.send(MANAGER_ID, f'{today:%d/%m/%Y} - {today:%d/%m/%Y}')
+    buttons = last_markup(telegram, 'sendMessage', MANAGER_ID)
+    assert buttons == expected[:PAGE_SIZE] + [
+        f'page:all:n{expected[PAGE_SIZE - 1]}:{period}', 'menu']
+
+    driver.press(MANAGER_ID, buttons[PAGE_SIZE])
+    buttons = last_markup(telegram, 'editMessageReplyMarkup', MANAGER_ID)
+    assert buttons == expected[PAGE_SIZE:] + [
+        f'page:all:p{expected[PAGE_SIZE]}:{period}', 'menu']
+
+    driver.press(MANAGER_ID, buttons[-2])
+    buttons = last_markup(telegram, 'editMessageReplyMarkup', MANAGER_ID)
+    assert buttons == expected[:PAGE_SIZE] + [
+        f'page:all:n{expected[PAGE_SIZE - 1]}:{period}', 'menu']
+
+
+def test_card_is_rendered_again_after_status_change(driver, database,
+                                                    telegram, monkeypatch):
+    import task_cards
+    from states import UserState
+
+    register(driver, MANAGER_ID, 'manager', 'Менеджер')
+    register(driver, WORKER_ID, 'worker', 'Исполнитель')
+    assign(driver, MANAGER_ID, 'Смета', [WORKER_ID])
+    with database.connection_context():
+        task = Task.get()
+    rendered = []
+    original_render = task_cards.render
+
+    def render(task, role):
+        rendered.append((task.status, role))
+        return original_render(task, role)
+
+    monkeypatch.setattr(task_cards, 'render', render)
+
+    def open_card() -> str:
+        driver.bot.set_state(MANAGER_ID,
+                             UserState.chose_task_info_id_manager)
+        driver.press(MANAGER_ID, str(task.task_id))
+        return [text for text in telegram.texts(MANAGER_ID)
+                if text.startswith('Имя работы')][-1]
+
+    assert 'Исполнитель ещё не принял работу' in open_card()
+    assert 'Исполнитель ещё не принял работу' in open_card()
+    assert rendered == [('process', 'manager')]
+
+    driver.press(WORKER_ID, f'accept:{task.task_id}')
+    with database.connection_context():
+        assert Task.get_by_id(task.task_id).version == task.version + 1
+    assert 'Исполнитель работает над задачей' in open_card()
+    assert rendered == [('process', 'manager'), ('work', 'manager')]
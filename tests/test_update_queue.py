@@ -0,0 +1,122 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import webhook
+from update_queue import (
+    QueueWebhookServer,
+    UpdateQueue,
+    queue_db,
+    worker_partitions,
+)
+
+PARTITIONS = 4
+SECRET = 'test-secret'
+
+
+def message(update_id: int, chat_id: int) -> dict:
+    return {'update_id': update_id,
+            'message': {'message_id': update_id, 'date': 1, 'text': 'hi',
+                        'chat': {'id': chat_id, 'type': 'private'},
+                        'from': {'id': chat_id, 'is_bot': False,
+                                 'first_name': 'u'}}}
+
+
+def callback(update_id: int, chat_id: int) -> dict:
+    return {'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id), 'data': 'accept',
+                'chat_instance': 'test',
+                'from': {'id': chat_id, 'is_bot': False, 'first_name': 'u'},
+                'message': message(update_id, chat_id)['message']}}
+
+
+@pytest.fixture
+def queue(tmp_path):
+    update_queue = UpdateQueue(str(tmp_path / 'updates.db'), PARTITIONS)
+    with queue_db.connection_context():
+        yield update_queue
+
+
+def claimed_ids(queue, partitions) -> list:
+    return [update['update_id']
+            for _, update in queue.claim(partitions)]
+
+
+def test_partition_by_chat(queue):
+    assert queue.partition(message(1, 6)) == 2
+    assert queue.partition(callback(2, 6)) == 2
+    assert queue.partition({'update_id': 3}) == 0
+
+
+def test_claim_in_order_and_ack(queue):
+    queue.push([message(1, 5), message(2, 6), message(3, 5)])
+    queue.push([callback(4, 5)])
+
+    assert claimed_ids(queue, [1]) == [1, 3, 4]
+    assert claimed_ids(queue, [2]) == [2]
+    assert claimed_ids(queue, [0, 3]) == []
+
+    row_id, _ = queue.claim([1])[0]
+    queue.ack(row_id)
+    assert claimed_ids(queue, [1]) == [3, 4]
+    assert queue.depth() == 3
+
+
+def test_repeated_update_is_skipped(queue):
+    queue.push([message(1, 5)])
+    queue.push([message(1, 5), message(2, 5)])
+
+    assert claimed_ids(queue, [1]) == [1, 2]
+
+
+def test_partitions_are_split_between_workers():
+    split = [worker_partitions(worker, 3, 8) for worker in range(3)]
+
+    assert split == [[0, 3, 6], [1, 4, 7], [2, 5]]
+
+
+class FailingQueue:
+    def push(self, updates) -> None:
+        raise OSError('disk I/O error')
+
+
+@pytest.fixture
+def server(queue):
+    server = QueueWebhookServer(object(), queue, host='127.0.0.1', port=0,
+                                path='/webhook', secret=SECRET)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, update: dict) -> int:
+    request = urllib.request.Request(
+        f'http://127.0.0.1:{server.server_port}/webhook',
+        data=json.dumps(update).encode(), method='POST',
+        headers={webhook.SECRET_HEADER: SECRET})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_webhook_answers_after_update_is_queued(server, queue):
+    assert post(server, message(1, 5)) == 200
+    # Без ожидания: обновление уже в очереди на диске
+    assert claimed_ids(queue, [1]) == [1]
+
+
+def test_webhook_failure_makes_telegram_retry(server, queue):
+    server.queue = FailingQueue()
+    assert post(server, message(1, 5)) == 500
+
+    server.queue = queue
+    assert post(server, message(1, 5)) == 200
+    assert claimed_ids(queue, [1]) == [1]
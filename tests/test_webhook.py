@@ -0,0 +1,90 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import webhook
+
+SECRET = 'test-secret'
+UPDATE = {
+    'update_id': 1,
+    'message': {'message_id': 1, 'date': 0, 'text': 'hi',
+                'chat': {'id': 5, 'type': 'private'},
+                'from': {'id': 5, 'is_bot': False, 'first_name': 'u'}},
+}
+
+
+class RecordingBot:
+    """Запоминает обновления и вызовы Bot API вместо бота"""
+
+    def __init__(self) -> None:
+        self.updates = []
+        self.calls = []
+
+    def process_new_updates(self, updates) -> None:
+        self.updates.extend(update.update_id for update in updates)
+
+    def remove_webhook(self) -> None:
+        self.calls.append('remove_webhook')
+
+    def set_webhook(self, **kwargs) -> None:
+        self.calls.append('set_webhook')
+
+
+@pytest.fixture
+def server():
+    bot = RecordingBot()
+    server = webhook.WebhookServer(bot, host='127.0.0.1', port=0,
+                                   path='/webhook', secret=SECRET)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, headers) -> int:
+    request = urllib.request.Request(
+        f'http://127.0.0.1:{server.server_port}/webhook',
+        data=json.dumps(UPDATE).encode(), headers=headers, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+@pytest.mark.parametrize('headers', [
+    {},
+    {webhook.SECRET_HEADER: ''},
+    {webhook.SECRET_HEADER: 'wrong'},
+])
+def test_rejects_missing_or_wrong_secret(server, headers):
+    assert post(server, headers) == 403
+    server.updates.join()
+    assert server.bot.updates == []
+
+
+def test_dispatches_update_with_secret(server):
+    assert post(server, {webhook.SECRET_HEADER: SECRET}) == 200
+    server.updates.join()
+    assert server.bot.updates == [UPDATE['update_id']]
+
+
+def test_server_without_secret_rejects_everything(server):
+    server.secret = None
+    assert post(server, {}) == 403
+    assert post(server, {webhook.SECRET_HEADER: ''}) == 403
+    server.updates.join()
+    assert server.bot.updates == []
+
+
+def test_run_webhook_requires_secret(monkeypatch):
+    monkeypatch.setattr(webhook, 'WEBHOOK_URL', 'https://example.org/hook')
+    monkeypatch.setattr(webhook, 'WEBHOOK_SECRET', None)
+    bot = RecordingBot()
+    with pytest.raises(SystemExit):
+        webhook.run_webhook(bot, server=object())
+    assert bot.calls == []
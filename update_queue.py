@@ -0,0 +1,281 @@
+"""
+Запуск бота в нескольких процессах.
+
+Приёмник (ingress) получает обновления через getUpdates или вебхук и
+складывает их в очередь на диске - отдельную б/д SQLite. Обработчики
+(worker) разбирают очередь: обновление попадает в раздел chat_id по
+модулю UPDATE_QUEUE_PARTITIONS, а разделы делятся между процессами,
+поэтому обновления одного чата обрабатывает один процесс по порядку.
+Обработчики handler_worker.py работают в процессах без изменений.
+Вебхук отвечает Telegram 200 только после записи обновления в очередь,
+а при ошибке записи - 500, и Telegram присылает обновление повторно.
+Обновление удаляется из очереди после обработки, поэтому после
+падения процесса оно будет обработано повторно.
+
+    python update_queue.py ingress
+    python update_queue.py worker 0 4   # процессы 0..3 из 4
+
+Состояния диалогов должны храниться в общей б/д (STATE_STORAGE=sqlite,
+обработчики работают с ней без кэша) или в redis. Общий лимит исходящих
+сообщений делится между процессами. Изменения пользователей процессы
+передают друг другу через ту же б/д очереди (UserInvalidation), чтобы
+сбросить их из кэшей user_directory.py и report_cache.py.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+from peewee import (
+    fn,
+    Model,
+    SqliteDatabase,
+    AutoField,
+    BigIntegerField,
+    FloatField,
+    IntegerField,
+    TextField,
+)
+from telebot import TeleBot, apihelper
+from telebot.types import Update
+
+from config import (
+    BOT_TOKEN,
+    BOT_MODE,
+    UPDATE_QUEUE_PATH,
+    UPDATE_QUEUE_PARTITIONS,
+    USER_CACHE_TTL,
+)
+from database import SQLITE_PRAGMAS
+from webhook import WebhookServer, run_webhook
+
+logger = logging.getLogger('manager_bot_logger')
+
+queue_db = SqliteDatabase(None, pragmas=SQLITE_PRAGMAS)
+
+
+class QueuedUpdate(Model):
+    """Обновление Telegram в очереди. partition - раздел по chat_id"""
+    id = AutoField()
+    update_id = BigIntegerField(unique=True)
+    partition = IntegerField()
+    payload = TextField()
+
+    class Meta:
+        database = queue_db
+        indexes = (
+            (('partition', 'id'), False),
+        )
+
+
+class UserInvalidation(Model):
+    """
+    Пользователь или его отчёты изменились: процессы сбрасывают его из
+    своих кэшей
+    """
+    id = AutoField()
+    role = TextField()
+    user_id = BigIntegerField()
+    created = FloatField()  # time.time()
+
+    class Meta:
+        database = queue_db
+
+
+def update_chat_id(update: dict):
+    """chat_id обновления в виде JSON, None - если чата нет"""
+    for kind, value in update.items():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if chat is not None:
+            return chat['id']
+        user = value.get('from')
+        if user is not None:
+            return user['id']
+    return None
+
+
+class UpdateQueue:
+    """Очередь обновлений в SQLite, общая для процессов на одной машине"""
+
+    def __init__(self, path: str = UPDATE_QUEUE_PATH,
+                 partitions: int = UPDATE_QUEUE_PARTITIONS) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        queue_db.init(path)
+        queue_db.create_tables([QueuedUpdate, UserInvalidation])
+        self.partitions = partitions
+
+    def partition(self, update: dict) -> int:
+        return (update_chat_id(update) or 0) % self.partitions
+
+    def push(self, updates: list) -> None:
+        """Добавляем пачку обновлений. Повторно полученные пропускаются"""
+        rows = [{'update_id': update['update_id'],
+                 'partition': self.partition(update),
+                 'payload': json.dumps(update)}
+                for update in updates]
+        with queue_db.atomic():
+            QueuedUpdate.insert_many(rows).on_conflict_ignore().execute()
+
+    def claim(self, partitions: list, limit: int = 100) -> list:
+        """Первые по порядку обновления разделов: [(id, update)]"""
+        rows = (QueuedUpdate
+                .select(QueuedUpdate.id, QueuedUpdate.payload)
+                .where(QueuedUpdate.partition.in_(partitions))
+                .order_by(QueuedUpdate.id)
+                .limit(limit)
+                .tuples())
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def ack(self, row_id: int) -> None:
+        """Обновление обработано"""
+        QueuedUpdate.delete_by_id(row_id)
+
+    def depth(self) -> int:
+        return QueuedUpdate.select().count()
+
+    def publish_invalidation(self, role: str, user_id: int) -> None:
+        """
+        Сообщаем процессам об изменении пользователя. Сообщения старше
+        USER_CACHE_TTL удаляем: записи кэшей пользователей и отчётов
+        живут не дольше и до них уже устарели сами
+        """
+        now = time.time()
+        with queue_db.atomic():
+            UserInvalidation.create(role=role, user_id=user_id, created=now)
+            UserInvalidation.delete().where(
+                UserInvalidation.created < now - USER_CACHE_TTL).execute()
+
+    def invalidations(self, after: int) -> list:
+        """Изменения после сообщения after: [(id, role, user_id)]"""
+        return list(UserInvalidation
+                    .select(UserInvalidation.id, UserInvalidation.role,
+                            UserInvalidation.user_id)
+                    .where(UserInvalidation.id > after)
+                    .order_by(UserInvalidation.id)
+                    .tuples())
+
+    def last_invalidation(self) -> int:
+        return UserInvalidation.select(
+            fn.MAX(UserInvalidation.id)).scalar() or 0
+
+
+def worker_partitions(worker: int, workers: int,
+                      partitions: int = UPDATE_QUEUE_PARTITIONS) -> list:
+    """Разделы очереди, которые обрабатывает процесс worker из workers"""
+    return [number for number in range(partitions)
+            if number % workers == worker]
+
+
+class QueueWebhookServer(WebhookServer):
+    """Вебхук приёмника: обновление записывается в очередь до ответа 200"""
+    dispatch_updates = False
+
+    def __init__(self, bot: TeleBot, queue: UpdateQueue, **kwargs) -> None:
+        super().__init__(bot, **kwargs)
+        self.queue = queue
+
+    def accept(self, update: dict) -> None:
+        # Каждый запрос - в своём потоке, соединение закрываем после него
+        with queue_db.connection_context():
+            self.queue.push([update])
+
+
+def run_ingress(bot: TeleBot, queue: UpdateQueue) -> None:
+    """Получаем обновления и складываем их в очередь"""
+    if BOT_MODE == 'webhook':
+        run_webhook(bot, QueueWebhookServer(bot, queue))
+        return
+
+    bot.remove_webhook()
+    offset = None
+    while True:
+        try:
+            updates = apihelper.get_updates(bot.token, offset=offset,
+                                            timeout=20,
+                                            long_polling_timeout=20)
+        except Exception as e:
+            logger.error(f'Ошибка: {e}')
+            time.sleep(3)
+            continue
+        if updates:
+            queue.push(updates)
+            # Следующий getUpdates подтверждает Telegram эту пачку
+            offset = updates[-1]['update_id'] + 1
+
+
+def run_worker(bot: TeleBot, queue: UpdateQueue, worker: int,
+               workers: int, idle_sleep: float = 0.05) -> None:
+    """Обрабатываем обновления своих разделов по порядку"""
+    import report_cache
+    import user_directory
+
+    partitions = worker_partitions(worker, workers, queue.partitions)
+    bot.threaded = False
+    user_directory.invalidation_hooks.append(queue.publish_invalidation)
+    report_cache.invalidation_hooks.append(queue.publish_invalidation)
+    last_invalidation = queue.last_invalidation()
+    while True:
+        for row_id, role, user_id in queue.invalidations(last_invalidation):
+            user_directory.apply_invalidation(role, user_id)
+            report_cache.apply_invalidation(role, user_id)
+            last_invalidation = row_id
+        batch = queue.claim(partitions)
+        if not batch:
+            time.sleep(idle_sleep)
+            continue
+        for row_id, update in batch:
+            try:
+                bot.process_new_updates([Update.de_json(update)])
+            except Exception as e:
+                logger.error(f'Ошибка: {e}')
+            queue.ack(row_id)
+
+
+def share_outbound_limit(workers: int) -> None:
+    """Общий лимит сообщений в секунду делим поровну между процессами"""
+    from outbound import dispatcher, TokenBucket
+
+    rate = dispatcher.global_bucket.rate / workers
+    dispatcher.global_bucket = TokenBucket(rate, rate, dispatcher.clock)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Бот в нескольких процессах')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('ingress', help='приём обновлений в очередь')
+    worker_parser = commands.add_parser('worker', help='обработка очереди')
+    worker_parser.add_argument('worker', type=int, help='номер процесса')
+    worker_parser.add_argument('workers', type=int, help='всего процессов')
+    args = parser.parse_args()
+
+    if args.command == 'ingress':
+        from telebot.types import BotCommand
+
+        from config import DEFAULT_COMMANDS
+        from migrations import run_migrations
+        from models import db
+
+        with db.connection_context():
+            run_migrations()
+        ingress_bot = TeleBot(BOT_TOKEN, threaded=False)
+        ingress_bot.set_my_commands(
+            [BotCommand(*cmd) for cmd in DEFAULT_COMMANDS])
+        run_ingress(ingress_bot, UpdateQueue())
+    else:
+        from telebot.custom_filters import StateFilter
+
+        from config import METRICS_PORT
+        from handler_worker import bot
+        from metrics import start_server as start_metrics_server
+        from state_storage import create_state_storage
+
+        # Кэш состояний видит только свой процесс (state_storage.py)
+        bot.current_states = create_state_storage(cache=False)
+        bot.add_custom_filter(StateFilter(bot))
+        if METRICS_PORT:
+            start_metrics_server(METRICS_PORT + args.worker)
+        share_outbound_limit(args.workers)
+        run_worker(bot, UpdateQueue(), args.worker, args.workers)
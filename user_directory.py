@@ -0,0 +1,58 @@
+"""
+Кэш пользователей в памяти процесса: имена менеджеров и исполнителей
+и списки (ростеры) для кнопок выбора.
+
+Записи читаются из б/д при промахе и живут USER_CACHE_TTL секунд, всего
+хранится не больше USER_CACHE_SIZE записей (вытесняются давно не
+нужные). Неизвестный пользователь тоже кэшируется - как None.
+
+После изменения пользователя вызываем invalidate(role, user_id). Она
+сбрасывает записи в этом процессе и вызывает invalidation_hooks - через
+них другие процессы узнают об изменении (см. update_queue.py) и
+сбрасывают свои записи через apply_invalidation.
+"""
+from cache import TTLCache
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+from models import UserManager, UserWorker
+
+ROLE_MODELS = {
+    'manager': UserManager,
+    'worker': UserWorker,
+}
+
+# Вызываются с (role, user_id) после invalidate в этом процессе
+invalidation_hooks = []
+
+users = TTLCache('user', USER_CACHE_SIZE, USER_CACHE_TTL)
+rosters = TTLCache('roster', USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def user_name(role: str, user_id: int):
+    """Имя менеджера/исполнителя, None - если он не зарегистрирован"""
+    model = ROLE_MODELS[role]
+    return users.get((role, int(user_id)), lambda: (
+        model.select(model.user_name)
+        .where(model.user_id == user_id)
+        .scalar()))
+
+
+def roster(role: str) -> tuple:
+    """Все менеджеры/исполнители: ((user_id, user_name), ...) по user_id"""
+    model = ROLE_MODELS[role]
+    return rosters.get(role, lambda: tuple(
+        model.select(model.user_id, model.user_name)
+        .order_by(model.user_id)
+        .tuples()))
+
+
+def apply_invalidation(role: str, user_id: int) -> None:
+    """Сбрасываем пользователя и ростер его роли только в этом процессе"""
+    users.invalidate((role, int(user_id)))
+    rosters.invalidate(role)
+
+
+def invalidate(role: str, user_id: int) -> None:
+    """Пользователь изменился: сбрасываем записи здесь и в других процессах"""
+    apply_invalidation(role, user_id)
+    for hook in invalidation_hooks:
+        hook(role, user_id)
@@ -0,0 +1,129 @@
+"""
+Приём обновлений через вебхук вместо bot.polling().
+
+Встроенный HTTP-сервер проверяет секретный токен из заголовка
+X-Telegram-Bot-Api-Secret-Token, принимает обновление (accept) и
+только после этого отвечает Telegram 200. Если принять не удалось,
+ответ 500 - Telegram пришлёт обновление повторно. Без WEBHOOK_SECRET
+вебхук не запускается, а запрос без заголовка или с чужим токеном
+получает 403: иначе любой, кто достучится до порта, мог бы прислать
+обновление от чужого имени. WebhookServer кладёт обновление в очередь
+в памяти, отдельный поток передаёт обновления в bot.process_new_updates
+по порядку поступления.
+
+Проверка без сети - запустить сервер и отправить записанный Update:
+
+    curl -X POST localhost:8443/webhook \
+         -H 'X-Telegram-Bot-Api-Secret-Token: <WEBHOOK_SECRET>' \
+         -d @update.json
+"""
+import hmac
+import json
+import logging
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import TeleBot
+from telebot.types import Update
+
+from config import (
+    WEBHOOK_URL,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+)
+
+logger = logging.getLogger('manager_bot_logger')
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    server: 'WebhookServer'
+
+    def do_POST(self) -> None:
+        if self.path.split('?')[0] != self.server.webhook_path:
+            self.send_error(404)
+            return
+        secret = self.headers.get(SECRET_HEADER)
+        if not self.server.secret or secret is None or \
+                not hmac.compare_digest(secret.encode(),
+                                        self.server.secret.encode()):
+            self.send_error(403)
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            update = json.loads(self.rfile.read(length))
+        except ValueError:
+            self.send_error(400)
+            return
+
+        # Telegram ждёт быстрый ответ, обработка идёт после него
+        try:
+            self.server.accept(update)
+        except Exception as e:
+            logger.error(f'Ошибка: {e}')
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args) -> None:
+        logger.debug(f'Вебхук: {format % args}')
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """HTTP-сервер вебхука с очередью обновлений для бота"""
+    daemon_threads = True
+    # Поток, передающий обновления из очереди в памяти боту
+    dispatch_updates = True
+
+    def __init__(self, bot: TeleBot, host: str = WEBHOOK_HOST,
+                 port: int = WEBHOOK_PORT, path: str = WEBHOOK_PATH,
+                 secret: str = WEBHOOK_SECRET) -> None:
+        super().__init__((host, port), WebhookHandler)
+        self.bot = bot
+        self.webhook_path = path
+        self.secret = secret
+        self.updates = queue.Queue()
+        if self.dispatch_updates:
+            self.dispatcher = threading.Thread(target=self._dispatch,
+                                               name='WebhookDispatcher',
+                                               daemon=True)
+            self.dispatcher.start()
+
+    def accept(self, update: dict) -> None:
+        """Обновление принято, если метод не поднял исключение"""
+        self.updates.put(update)
+
+    def _dispatch(self) -> None:
+        while True:
+            update = self.updates.get()
+            try:
+                self.bot.process_new_updates([Update.de_json(update)])
+            except Exception as e:
+                logger.error(f'Ошибка: {e}')
+            finally:
+                self.updates.task_done()
+
+
+def run_webhook(bot: TeleBot, server: WebhookServer = None) -> None:
+    """Регистрируем вебхук в Telegram и обслуживаем его до остановки"""
+    if not WEBHOOK_URL:
+        exit('WEBHOOK_URL отсутствует в переменных окружения')
+    if not WEBHOOK_SECRET:
+        exit('WEBHOOK_SECRET отсутствует в переменных окружения')
+    if server is None:
+        server = WebhookServer(bot)
+    bot.remove_webhook()
+    bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+    logger.info(f'Вебхук слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}'
+                f'{WEBHOOK_PATH}')
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()